@@ -1,8 +1,20 @@
 import discord
 from discord.ext import commands
 import asyncio
+import aiohttp
 import json
+import os
+import random
+import time
+import yarl
 from datetime import datetime
+from discord_endpoints import use_discord_endpoints
+from logqueue import PriorityLogQueue
+from logsink import LogSink, parse_time
+from ratelimit import RateLimiter, backoff_delay, route_key
+
+# Optionally point the bot at another Discord API and gateway (such as a local stand-in for load tests)
+use_discord_endpoints(os.getenv('DISCORD_API_BASE'), os.getenv('DISCORD_GATEWAY_URL'))
 
 # Set up the bot with a command prefix and intents
 intents = discord.Intents.default()
@@ -12,172 +24,575 @@ intents.guild_messages = True
 intents.message_content = True
 intents.members = True
 intents.voice_states = True  # Required for voice state updates
-intents.presences = True  # Required for presence updates
+intents.presences = False  # Nothing here handles presence updates, and across many guilds they cost memory and bandwidth
 intents.invites = True  # Required for invite events
 
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Replace with your channel ID and guild ID
+# Replace with your channel ID and guild ID (used when there is no routing file)
 LOG_CHANNEL_ID = 1300179330940403777  # Replace with your actual channel ID
 TARGET_GUILD_ID = 1300179329443037376  # Replace with your actual guild ID
 
-# Queue for logging messages
-log_queue = asyncio.Queue()
+# Routing file mapping each guild to log to its log channel: {"<guild ID>": <channel ID>, ...}
+LOG_ROUTES_FILE = os.getenv('LOG_ROUTES_FILE', 'log_routes.json')
+
+# Log shipping settings
+LOG_QUEUE_SIZE = 10000  # Entries held per log channel before the overflow policy applies
+LOG_OVERFLOW_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "block"
+LOG_WORKERS = 1  # Senders draining each log channel's queue; more than one can reorder entries
+LOG_AS_EMBEDS = False  # Pack entries into embeds (6000 characters per message) instead of plain text
+
+# Discord limits for a single message
+MAX_MESSAGE_LENGTH = 2000
+MAX_EMBED_DESCRIPTION = 4096
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS_PER_MESSAGE = 6000
+MAX_SEND_ATTEMPTS = 5
+
+# Local JSON Lines copy of every entry, kept even when Discord is unreachable
+LOG_DIR = "logs"
+LOG_ROTATE_BYTES = 50 * 1024 * 1024  # Start a new file after this many bytes
+LOG_ROTATE_SECONDS = 86400  # Start a new file after this many seconds
+LOG_COMPRESS_ROTATED = True  # Gzip files once they are rotated out
+LOG_KEEP_FILES = 30  # Oldest files beyond this are deleted (0 keeps everything)
+
+# Outbound rate limiting, retries and the dead-letter spool
+GLOBAL_RATE_LIMIT = 50  # Requests per second across the whole bot
+MAX_RATE_LIMIT_WAIT = 30  # Batches that would wait longer are spooled instead (discord.py's minimum is 30)
+RETRY_BASE_DELAY = 1.0  # Backoff doubles from here, with jitter, up to RETRY_MAX_DELAY
+RETRY_MAX_DELAY = 60.0
+DEAD_LETTER_FILE = os.path.join(LOG_DIR, "dead_letter.jsonl")  # Batches that could not be sent, replayed on recovery
+DEAD_LETTER_MAX_BYTES = 10 * 1024 * 1024  # Batches beyond this are dropped (they are still in the local log)
+
+# Rules for each action:
+#   priority - 0 is sent first and evicted last when the queue is full
+#   sample - share of events sent to the channel (1.0 sends all)
+#   include_channels / exclude_channels - channel IDs to limit logging to, or to skip
+#   dedupe_seconds - skip exact repeats (same action, user and details) within this many seconds
+# Sampling and dedupe only thin what is sent to Discord; the local log keeps every included event
+DEFAULT_LOG_RULE = {"priority": 2, "sample": 1.0, "include_channels": None, "exclude_channels": (), "dedupe_seconds": 0}
+LOG_RULES = {
+    # Security-relevant events never wait behind chat
+    "Member Ban": {"priority": 0},
+    "Member Unban": {"priority": 0},
+    "Role Update": {"priority": 0},
+    "Channel Create": {"priority": 0},
+    "Channel Delete": {"priority": 0},
+    "Bulk Message Delete": {"priority": 0},
+    "Member Join": {"priority": 1},
+    "Member Leave": {"priority": 1},
+    "Nickname Change": {"priority": 1},
+    "Invite Create": {"priority": 1},
+    "Message Delete": {"priority": 2},
+    "Message Edit": {"priority": 2},
+    "Message Sent": {"priority": 3, "sample": 1.0, "exclude_channels": ()},
+    "Voice State Update": {"priority": 3, "dedupe_seconds": 10},
+    "Voice Channel Join": {"priority": 3, "dedupe_seconds": 10},
+    "Voice Channel Leave": {"priority": 3, "dedupe_seconds": 10}
+}
+
+def compile_rule(rule):
+    """Fill in a rule's defaults and turn its channel lists into sets."""
+    rule = {**DEFAULT_LOG_RULE, **rule}
+    if rule["include_channels"] is not None:
+        rule["include_channels"] = frozenset(rule["include_channels"])
+    rule["exclude_channels"] = frozenset(rule["exclude_channels"])
+    return rule
+
+log_rules = {action: compile_rule(rule) for action, rule in LOG_RULES.items()}
+default_log_rule = compile_rule({})
+LOG_PRIORITY_LEVELS = max(rule["priority"] for rule in [default_log_rule, *log_rules.values()]) + 1
+
+def load_log_routes():
+    """Load the guild ID -> log channel ID routing table, falling back to TARGET_GUILD_ID and LOG_CHANNEL_ID."""
+    try:
+        with open(LOG_ROUTES_FILE, 'r', encoding="utf-8") as f:
+            return {int(guild_id): int(channel_id) for guild_id, channel_id in json.load(f).items()}
+    except FileNotFoundError:
+        return {TARGET_GUILD_ID: LOG_CHANNEL_ID}
+
+# Guilds to log, each mapped to its log channel
+log_routes = load_log_routes()
+
+# Bounded priority queue of (time queued, formatted entry) for each log channel,
+# so a slow or rate-limited channel does not hold up the others
+log_queues = {channel_id: PriorityLogQueue(LOG_PRIORITY_LEVELS, maxsize=LOG_QUEUE_SIZE) for channel_id in set(log_routes.values())}
+
+# When each (guild ID, action, user ID, details) was last sent, for dedupe windows
+last_logged = {}
+
+# Counters for the log shipping pipeline
+log_stats = {
+    "queued": 0,
+    "dropped": 0,
+    "sent_entries": 0,
+    "sent_messages": 0,
+    "failed_entries": 0,
+    "last_lag": 0.0,
+    "max_lag": 0.0,
+    "max_lag_by_priority": [0.0] * LOG_PRIORITY_LEVELS,
+    "filtered": 0,
+    "sampled_out": 0,
+    "deduped": 0,
+    "spooled": 0,
+    "replayed": 0,
+    "spool_dropped": 0,
+    "unroutable": 0
+}
+
+# Worker tasks for each log channel (started on the first ready event that resolves the channel)
+log_workers = {}
 
-def get_timestamp():
-    """Get the current timestamp in a formatted string."""
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+# Routed log channels the bot cannot see; their entries are only kept in the local log
+unresolved_channels = set()
+
+# Task resending the dead-letter spool, while one runs
+replay_task = None
+
+# Writer thread for the local log
+log_sink = LogSink(LOG_DIR, LOG_ROTATE_BYTES, LOG_ROTATE_SECONDS, LOG_COMPRESS_ROTATED, LOG_KEEP_FILES)
+log_sink.start()
+
+# Shared by everything the bot sends; it learns the limits from the response headers
+rate_limiter = RateLimiter(GLOBAL_RATE_LIMIT)
+
+bot = commands.Bot(
+    command_prefix='!',
+    intents=intents,
+    http_trace=rate_limiter.trace_config(),
+    max_ratelimit_timeout=MAX_RATE_LIMIT_WAIT  # Raise instead of sleeping through long rate limits
+)
+
+async def log_to_channel(channel_id, lines):
+    """Send a batch of log lines to a log channel as one message, spooling it if that keeps failing."""
+    channel = bot.get_channel(channel_id)
+    if not channel:
+        # Retrying cannot help until the route is fixed, so do not spool the batch
+        if channel_id not in unresolved_channels:
+            unresolved_channels.add(channel_id)
+            print(f"Log channel {channel_id} not found, dropping its entries (they are still in the local log)")
+        log_stats["unroutable"] += len(lines)
+        return False
+
+    if LOG_AS_EMBEDS:
+        kwargs = {"embeds": [discord.Embed(description=page) for page in split_pages(lines, MAX_EMBED_DESCRIPTION)]}
+    else:
+        kwargs = {"content": "\n".join(lines)}
+
+    route = route_key("POST", f"{yarl.URL(discord.http.Route.BASE).path}/channels/{channel.id}/messages")
+    for attempt in range(MAX_SEND_ATTEMPTS):
+        # Wait here rather than inside discord.py, which holds the route's lock while it sleeps
+        if not await rate_limiter.acquire(route, MAX_RATE_LIMIT_WAIT):
+            break
 
-async def log_to_channel(message):
-    """Send a structured log message to the designated channel."""
-    channel = bot.get_channel(LOG_CHANNEL_ID)
-    if channel:
         try:
-            await channel.send(message)
+            await channel.send(**kwargs)
+            return True
+        except discord.RateLimited as e:
+            # discord.py gave up on a rate limit longer than MAX_RATE_LIMIT_WAIT
+            print(f"Rate limited for {e.retry_after:.0f}s, spooling {len(lines)} log entries")
+            break
         except discord.HTTPException as e:
-            if e.status == 429:  # Rate limit error
-                retry_after = int(e.response.headers.get('Retry-After', 1))
-                await asyncio.sleep(retry_after)  # Wait for the specified time
-                await log_to_channel(message)  # Retry sending the message
-
-async def log_message(action, user, details):
-    """Log a message with structured data."""
-    timestamp = get_timestamp()
-    log_entry = {
-        "timestamp": timestamp,
+            if e.status != 429 and e.status < 500:
+                print(f"Failed to send {len(lines)} log entries: {e}")
+                return False
+            retry_after = float(e.response.headers.get('Retry-After', 0)) or None
+        except (OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Could not reach Discord: {e!r}")
+            retry_after = None
+
+        if attempt + 1 < MAX_SEND_ATTEMPTS:
+            await asyncio.sleep(backoff_delay(attempt, retry_after, RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+
+    spool_dead_letters(channel_id, lines)
+    return False
+
+def spool_dead_letters(channel_id, lines):
+    """Append a batch that could not be sent to the dead-letter spool."""
+    try:
+        if os.path.exists(DEAD_LETTER_FILE) and os.path.getsize(DEAD_LETTER_FILE) >= DEAD_LETTER_MAX_BYTES:
+            log_stats["spool_dropped"] += len(lines)
+            return
+        os.makedirs(os.path.dirname(DEAD_LETTER_FILE) or ".", exist_ok=True)
+        with open(DEAD_LETTER_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"channel": channel_id, "lines": lines}, ensure_ascii=False) + "\n")
+        log_stats["spooled"] += len(lines)
+    except OSError as e:
+        log_stats["spool_dropped"] += len(lines)
+        print(f"Failed to spool {len(lines)} log entries: {e}")
+
+def start_replay():
+    """Start resending the dead-letter spool unless that is already running or there is nothing to send."""
+    global replay_task
+    if replay_task is not None and not replay_task.done():
+        return
+    if os.path.exists(DEAD_LETTER_FILE) or os.path.exists(DEAD_LETTER_FILE + ".replay"):
+        replay_task = bot.loop.create_task(replay_dead_letters())
+
+def save_replay_position(position_file, offset):
+    """Record how far into the replay file batches have been handled, replacing the old record atomically."""
+    with open(position_file + ".tmp", "w", encoding="utf-8") as f:
+        f.write(str(offset))
+    os.replace(position_file + ".tmp", position_file)
+
+async def replay_dead_letters():
+    """Resend spooled batches in order, spooling a channel's batches again once one of them fails."""
+    replay_file = DEAD_LETTER_FILE + ".replay"
+    position_file = replay_file + ".pos"
+
+    # Take over the spool so new failures start a fresh one; an existing
+    # replay file is left over from a run that stopped partway through
+    if not os.path.exists(replay_file):
+        try:
+            os.replace(DEAD_LETTER_FILE, replay_file)
+        except FileNotFoundError:
+            return
+        if os.path.exists(position_file):
+            os.remove(position_file)  # Belongs to a replay that already finished
+
+    # Skip the batches an interrupted replay already handled
+    try:
+        with open(position_file, encoding="utf-8") as f:
+            start = int(f.read())
+    except (FileNotFoundError, ValueError):
+        start = 0
+
+    # Each batch is kept with the byte offset just past its line
+    batches = []
+    with open(replay_file, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            offset += len(line)
+            try:
+                batch = json.loads(line)
+            except ValueError:
+                continue  # A batch cut off by a crash
+            # Spools from before routing hold bare lists of lines for LOG_CHANNEL_ID
+            if isinstance(batch, list):
+                batch = {"channel": LOG_CHANNEL_ID, "lines": batch}
+            batches.append((offset, batch))
+
+    failed_channels = set()
+    for offset, batch in batches:
+        if batch["channel"] in failed_channels:
+            spool_dead_letters(batch["channel"], batch["lines"])
+        elif await log_to_channel(batch["channel"], batch["lines"]):
+            log_stats["replayed"] += len(batch["lines"])
+            log_stats["sent_messages"] += 1
+        elif batch["channel"] not in unresolved_channels:
+            failed_channels.add(batch["channel"])
+        save_replay_position(position_file, offset)
+
+    os.remove(replay_file)
+    if os.path.exists(position_file):
+        os.remove(position_file)
+
+def split_pages(lines, limit):
+    """Group lines into pages of at most limit characters."""
+    pages = []
+    for line in lines:
+        if pages and len(pages[-1]) + 1 + len(line) <= limit:
+            pages[-1] += "\n" + line
+        else:
+            pages.append(line)
+    return pages
+
+def enqueue_log(queue, priority, formatted_message):
+    """Queue a log entry, applying the overflow policy when the queue is full."""
+    item = (time.monotonic(), formatted_message)
+    if queue.full():
+        log_stats["dropped"] += 1
+        # Make room by discarding the oldest of the least important entries;
+        # an entry is never dropped for one that matters less
+        if queue.evict(priority, same_level=LOG_OVERFLOW_POLICY != "drop_newest") is None:
+            return False
+    queue.put_nowait(priority, item)
+    log_stats["queued"] += 1
+    return True
+
+def is_duplicate(guild_id, action, user_id, details, window):
+    """Check whether this exact event was sent for the user in the guild within the window, recording it if not."""
+    now = time.monotonic()
+    key = (guild_id, action, user_id, details)
+    if now - last_logged.get(key, -window) < window:
+        return True
+    last_logged[key] = now
+
+    # Forget events whose windows have all passed once the table gets large
+    if len(last_logged) > 10000:
+        longest = max(rule["dedupe_seconds"] for rule in log_rules.values())
+        for stale in [key for key, logged in last_logged.items() if now - logged >= longest]:
+            del last_logged[stale]
+    return False
+
+async def log_message(guild, action, user, details, channel=None):
+    """Log a message with structured data to the guild's log channel."""
+    rule = log_rules.get(action, default_log_rule)
+
+    # Channel rules decide whether the event is logged at all
+    if channel is not None and (
+        channel.id in rule["exclude_channels"]
+        or (rule["include_channels"] is not None and channel.id not in rule["include_channels"])
+    ):
+        log_stats["filtered"] += 1
+        return
+
+    now = datetime.now()
+    timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+    log_sink.write({
+        "ts": int(now.timestamp() * 1000),
+        "time": now.astimezone().isoformat(timespec="seconds"),
         "action": action,
-        "user": {
-            "name": user.name,
-            "id": user.id
-        },
+        "guild": str(guild.id),
+        "user": {"id": str(user.id), "name": user.name},
+        "channel": str(channel.id) if channel is not None else None,
         "details": details
-    }
-    log_entry_json = json.dumps(log_entry, indent=4)  # Convert to JSON format with indentation
+    })
+
+    if log_routes[guild.id] in unresolved_channels:
+        log_stats["unroutable"] += 1
+        return
+    if rule["sample"] < 1 and random.random() >= rule["sample"]:
+        log_stats["sampled_out"] += 1
+        return
+    if rule["dedupe_seconds"] and is_duplicate(guild.id, action, user.id, details, rule["dedupe_seconds"]):
+        log_stats["deduped"] += 1
+        return
+
     formatted_message = f"**[{timestamp}]** {action} | **User:** {user.name} (ID: {user.id}) | **Details:** {details}"
-    await log_queue.put(formatted_message)  # Add to the log queue
+    queue = log_queues[log_routes[guild.id]]
+    if LOG_OVERFLOW_POLICY == "block":
+        await queue.put(rule["priority"], (time.monotonic(), formatted_message))  # Wait for room in the queue
+        log_stats["queued"] += 1
+    else:
+        enqueue_log(queue, rule["priority"], formatted_message)
+
+async def log_worker(channel_id):
+    """Worker to drain a log channel's queue, packing as many entries as fit into each message."""
+    queue = log_queues[channel_id]
+    capacity = MAX_EMBED_CHARACTERS_PER_MESSAGE if LOG_AS_EMBEDS else MAX_MESSAGE_LENGTH
+    entry_limit = MAX_EMBED_DESCRIPTION if LOG_AS_EMBEDS else MAX_MESSAGE_LENGTH
 
-async def log_worker():
-    """Worker to process log messages from the queue."""
     while True:
-        message = await log_queue.get()  # Use await to get from asyncio.Queue
-        await log_to_channel(message)
-        log_queue.task_done()
-        await asyncio.sleep(1)  # Adjust the sleep time as needed
+        # Wait for an entry, then keep taking the most important queued entries
+        # until the next would not fit (6000 characters of embeds always fit in
+        # fewer than MAX_EMBEDS_PER_MESSAGE pages)
+        priority, (queued_at, line) = await queue.get()
+        batch, size = [], 0
+        oldest = [None] * LOG_PRIORITY_LEVELS
+        while True:
+            if len(line) > entry_limit:
+                line = line[:entry_limit - 1] + "…"
+            if batch and size + 1 + len(line) > capacity:
+                queue.put_back(priority, (queued_at, line))
+                break
+            size += len(line) + (1 if batch else 0)
+            batch.append(line)
+            oldest[priority] = min(oldest[priority] or queued_at, queued_at)
+            if queue.empty():
+                break
+            priority, (queued_at, line) = queue.get_nowait()
+
+        # Lag is how long the oldest entry in the message waited
+        now = time.monotonic()
+        lag = now - min(queued for queued in oldest if queued is not None)
+        log_stats["last_lag"] = lag
+        log_stats["max_lag"] = max(log_stats["max_lag"], lag)
+        for level, queued in enumerate(oldest):
+            if queued is not None:
+                log_stats["max_lag_by_priority"][level] = max(log_stats["max_lag_by_priority"][level], now - queued)
+
+        if await log_to_channel(channel_id, batch):
+            log_stats["sent_entries"] += len(batch)
+            log_stats["sent_messages"] += 1
+            start_replay()  # Sending works again, so catch up on anything spooled
+        else:
+            log_stats["failed_entries"] += len(batch)
 
 # Event handlers for logging various actions
 @bot.event
 async def on_member_join(member):
     """Log when a member joins the server."""
-    if member.guild.id == TARGET_GUILD_ID:
-        await log_message("Member Join", member, "has joined the server.")
+    if member.guild.id in log_routes:
+        await log_message(member.guild, "Member Join", member, "has joined the server.")
 
 @bot.event
 async def on_member_remove(member):
     """Log when a member leaves the server."""
-    if member.guild.id == TARGET_GUILD_ID:
-        await log_message("Member Leave", member, "has left the server.")
+    if member.guild.id in log_routes:
+        await log_message(member.guild, "Member Leave", member, "has left the server.")
 
 @bot.event
 async def on_message(message):
     """Log messages sent in the server."""
     if message.author == bot.user:
         return
-    if message.guild.id == TARGET_GUILD_ID:
-        await log_message("Message Sent", message.author, f"sent: {message.content}")
+    if message.guild and message.guild.id in log_routes:
+        await log_message(message.guild, "Message Sent", message.author, f"sent: {message.content}", message.channel)
+    await bot.process_commands(message)
 
 @bot.event
 async def on_message_edit(before, after):
     """Log when a message is edited."""
-    if before.guild.id == TARGET_GUILD_ID:
-        await log_message("Message Edit", before.author, 
-                          f"edited a message:\n**Before:** \"{before.content}\"\n**After:** \"{after.content}\"")
+    if before.guild and before.guild.id in log_routes:
+        await log_message(before.guild, "Message Edit", before.author, 
+                          f"edited a message:\n**Before:** \"{before.content}\"\n**After:** \"{after.content}\"", before.channel)
 
 @bot.event
 async def on_message_delete(message):
     """Log when a message is deleted."""
-    if message.guild.id == TARGET_GUILD_ID:
-        await log_message("Message Delete", message.author, f"deleted: \"{message.content}\"")
+    if message.guild and message.guild.id in log_routes:
+        await log_message(message.guild, "Message Delete", message.author, f"deleted: \"{message.content}\"", message.channel)
 
 @bot.event
 async def on_voice_state_update(member, before, after):
     """Log when a user mutes/unmutes or joins/leaves a voice channel."""
-    if member.guild.id == TARGET_GUILD_ID:
+    if member.guild.id in log_routes:
         if before.self_mute != after.self_mute:
             action = "muted" if after.self_mute else "unmuted"
-            await log_message("Voice State Update", member, f"has {action} themselves.")
+            await log_message(member.guild, "Voice State Update", member, f"has {action} themselves.", after.channel or before.channel)
 
         if before.self_deaf != after.self_deaf:
             action = "deafened" if after.self_deaf else "undeafened"
-            await log_message("Voice State Update", member, f"has {action} themselves.")
+            await log_message(member.guild, "Voice State Update", member, f"has {action} themselves.", after.channel or before.channel)
 
         # Log when a user joins or leaves a voice channel
         if before.channel is None and after.channel is not None:
-            await log_message("Voice Channel Join", member, f"has joined the voice channel: **{after.channel.name}**")
+            await log_message(member.guild, "Voice Channel Join", member, f"has joined the voice channel: **{after.channel.name}**", after.channel)
         elif before.channel is not None and after.channel is None:
-            await log_message("Voice Channel Leave", member, f"has left the voice channel: **{before.channel.name}**")
+            await log_message(member.guild, "Voice Channel Leave", member, f"has left the voice channel: **{before.channel.name}**", before.channel)
 
 @bot.event
 async def on_member_update(before, after):
     """Log when a user is assigned or removed from a role or changes their nickname."""
-    if before.guild.id == TARGET_GUILD_ID:
+    if before.guild.id in log_routes:
         if before.roles != after.roles:
             added_roles = [role for role in after.roles if role not in before.roles]
             removed_roles = [role for role in before.roles if role not in after.roles]
             
             for role in added_roles:
-                await log_message("Role Update", after, f"has been given the role: **{role.name}**")
+                await log_message(before.guild, "Role Update", after, f"has been given the role: **{role.name}**")
             
             for role in removed_roles:
-                await log_message("Role Update", after, f"has been removed from the role: **{role.name}**")
+                await log_message(before.guild, "Role Update", after, f"has been removed from the role: **{role.name}**")
 
         # Log when a user changes their nickname
         if before.nick != after.nick:
-            await log_message("Nickname Change", before, 
+            await log_message(before.guild, "Nickname Change", before, 
                               f"changed their nickname from **{before.nick}** to **{after.nick}**")
 
 @bot.event
 async def on_guild_channel_create(channel):
     """Log when a channel is created."""
-    if channel.guild.id == TARGET_GUILD_ID:
-        await log_message("Channel Create", channel.guild, f"Channel created: **{channel.name}**")
+    if channel.guild.id in log_routes:
+        await log_message(channel.guild, "Channel Create", channel.guild, f"Channel created: **{channel.name}**", channel)
 
 @bot.event
 async def on_guild_channel_delete(channel):
     """Log when a channel is deleted."""
-    if channel.guild.id == TARGET_GUILD_ID:
-        await log_message("Channel Delete", channel.guild, f"Channel deleted: **{channel.name}**")
+    if channel.guild.id in log_routes:
+        await log_message(channel.guild, "Channel Delete", channel.guild, f"Channel deleted: **{channel.name}**", channel)
 
 @bot.event
 async def on_member_ban(guild, member):
     """Log when a user is banned."""
-    if guild.id == TARGET_GUILD_ID:
-        await log_message("Member Ban", member, "has been banned from the server.")
+    if guild.id in log_routes:
+        await log_message(guild, "Member Ban", member, "has been banned from the server.")
 
 @bot.event
 async def on_member_unban(guild, member):
     """Log when a user is unbanned."""
-    if guild.id == TARGET_GUILD_ID:
-        await log_message("Member Unban", member, "has been unbanned from the server.")
+    if guild.id in log_routes:
+        await log_message(guild, "Member Unban", member, "has been unbanned from the server.")
 
 @bot.event
 async def on_bulk_message_delete(messages):
     """Log when multiple messages are deleted."""
-    if messages[0].guild.id == TARGET_GUILD_ID:  # Check the guild of the first message
-        await log_message("Bulk Message Delete", messages[0].author, f"{len(messages)} messages have been deleted.")
+    if messages[0].guild.id in log_routes:  # Check the guild of the first message
+        await log_message(messages[0].guild, "Bulk Message Delete", messages[0].author, f"{len(messages)} messages have been deleted.", messages[0].channel)
 
 @bot.event
 async def on_invite_create(invite):
     """Log when a user invites someone to the server."""
-    if invite.guild.id == TARGET_GUILD_ID:
-        await log_message("Invite Create", invite.inviter, f"Invite created: {invite.code}")
+    if invite.guild.id in log_routes:
+        await log_message(invite.guild, "Invite Create", invite.inviter, f"Invite created: {invite.code}", invite.channel)
+
+@bot.command(name="logstats")
+async def logstats(ctx):
+    """Show queue depth, lag and throughput of the log shipping pipeline."""
+    queue = log_queues.get(log_routes.get(ctx.guild.id)) if ctx.guild else None
+    depth = f"{queue.qsize()}/{LOG_QUEUE_SIZE} (by priority: {', '.join(map(str, queue.depths()))})" if queue else "not logged"
+    await ctx.send(
+        f"Queue depth here: {depth} | All {len(log_queues)} log channels: {sum(q.qsize() for q in log_queues.values())} | "
+        f"Queued: {log_stats['queued']} | Filtered: {log_stats['filtered']} | Sampled out: {log_stats['sampled_out']} | "
+        f"Deduped: {log_stats['deduped']} | "
+        f"Dropped: {log_stats['dropped']} | Sent: {log_stats['sent_entries']} entries in {log_stats['sent_messages']} messages | "
+        f"Failed: {log_stats['failed_entries']} | Lag: {log_stats['last_lag']:.1f}s (max {log_stats['max_lag']:.1f}s, "
+        f"by priority {', '.join(f'{lag:.1f}s' for lag in log_stats['max_lag_by_priority'])}) | "
+        f"Spooled: {log_stats['spooled']} | Replayed: {log_stats['replayed']} | Spool dropped: {log_stats['spool_dropped']} | "
+        f"Unroutable: {log_stats['unroutable']} | "
+        f"Rate limit waits: {rate_limiter.stats['waits']} ({rate_limiter.stats['waited']:.1f}s) | "
+        f"429s: {rate_limiter.stats['route_limited']} route, {rate_limiter.stats['global_limited']} global"
+    )
+
+@bot.command(name="logsearch")
+@commands.guild_only()
+@commands.has_permissions(view_audit_log=True)
+async def logsearch(ctx, *filters):
+    """Search this server's local log, e.g. !logsearch user:123 "action:Member Ban" since:7d"""
+    query = {}
+    for item in filters:
+        key, _, value = item.partition(":")
+        if key not in ("action", "user", "since", "until", "text", "limit") or not value:
+            await ctx.send("Filters are action:, user:, since:, until:, text: and limit:, e.g. `since:12h` or `since:2024-01-31`")
+            return
+        query[key] = value
+
+    try:
+        entries = await asyncio.to_thread(
+            log_sink.query,
+            guild_id=ctx.guild.id,
+            action=query.get("action"),
+            user_id=query.get("user"),
+            since=parse_time(query["since"]) if "since" in query else None,
+            until=parse_time(query["until"]) if "until" in query else None,
+            text=query.get("text"),
+            limit=min(int(query.get("limit", 20)), 100)
+        )
+    except ValueError as e:
+        await ctx.send(f"Invalid filter: {e}")
+        return
+
+    if not entries:
+        await ctx.send("No matching log entries.")
+        return
+    lines = [f"`{entry['time']}` {entry['action']} | {entry['user']['name']} ({entry['user']['id']}) | {entry['details']}" for entry in entries]
+    for page in split_pages(lines, MAX_MESSAGE_LENGTH)[:3]:
+        await ctx.send(page[:MAX_MESSAGE_LENGTH])
 
 @bot.event
 async def on_ready():
     """Run when the bot is ready."""
-    bot.loop.create_task(log_worker())  # Start the log worker in your bot's startup
-    print(f'Bot is ready and logged in as {bot.user.name}')
+    # Check every route's channel; on_ready runs again after reconnects, when a fixed route starts working
+    unresolved_channels.clear()
+    unresolved_channels.update(channel_id for channel_id in log_queues if bot.get_channel(channel_id) is None)
+    if unresolved_channels:
+        print(f"Cannot see {len(unresolved_channels)} routed log channels: {', '.join(map(str, unresolved_channels))}")
+
+    # Start each channel's log workers once it resolves
+    for channel_id in log_queues:
+        if channel_id not in log_workers and channel_id not in unresolved_channels:
+            log_workers[channel_id] = [bot.loop.create_task(log_worker(channel_id)) for _ in range(LOG_WORKERS)]
+    start_replay()  # Anything spooled by an earlier run or before the reconnect
+
+    missing = [guild_id for guild_id in log_routes if bot.get_guild(guild_id) is None]
+    if missing:
+        print(f"Not in {len(missing)} routed guilds: {', '.join(map(str, missing))}")
+    print(f'Bot is ready and logged in as {bot.user.name}, logging {len(log_routes) - len(missing)} guilds to {len(log_queues) - len(unresolved_channels)} channels')
 
 
 
 bot.run('YOUR_BOT_TOKEN')
+
+# Write out whatever the local log still holds
+log_sink.close()
     
@@ -0,0 +1,12 @@
+import discord
+import yarl
+from discord.gateway import DiscordWebSocket
+
+def use_discord_endpoints(api_base=None, gateway_url=None):
+    """Point discord.py at another API and gateway (such as a local stand-in for load tests) when given."""
+    if api_base:
+        discord.http.Route.BASE = api_base.rstrip('/')
+        print(f"Using Discord API at {discord.http.Route.BASE}")
+    if gateway_url:
+        DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(gateway_url)
+        print(f"Using Discord gateway at {gateway_url}")
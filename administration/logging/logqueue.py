@@ -0,0 +1,83 @@
+import asyncio
+from collections import deque
+
+class PriorityLogQueue:
+    """A bounded queue with a FIFO per priority level; level 0 is taken first and evicted last."""
+
+    def __init__(self, levels, maxsize=0):
+        self.maxsize = maxsize
+        self._levels = [deque() for _ in range(levels)]
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def qsize(self):
+        return self._size
+
+    def depths(self):
+        """Get the number of queued items at each priority level."""
+        return [len(level) for level in self._levels]
+
+    def empty(self):
+        return self._size == 0
+
+    def full(self):
+        return 0 < self.maxsize <= self._size
+
+    def _level(self, priority):
+        return self._levels[min(max(priority, 0), len(self._levels) - 1)]
+
+    def _added(self):
+        self._size += 1
+        self._not_empty.set()
+        if self.full():
+            self._not_full.clear()
+
+    def _removed(self):
+        self._size -= 1
+        if not self._size:
+            self._not_empty.clear()
+        if not self.full():
+            self._not_full.set()
+
+    def put_nowait(self, priority, item):
+        """Add an item at the back of its level (callers check full() and evict first)."""
+        self._level(priority).append(item)
+        self._added()
+
+    def put_back(self, priority, item):
+        """Return an item to the front of its level, such as one that did not fit in a batch."""
+        self._level(priority).appendleft(item)
+        self._added()
+
+    async def put(self, priority, item):
+        """Wait for room, then add an item."""
+        while self.full():
+            await self._not_full.wait()
+        self.put_nowait(priority, item)
+
+    def get_nowait(self):
+        """Remove and return (priority, item) for the oldest item of the most important non-empty level."""
+        for priority, level in enumerate(self._levels):
+            if level:
+                item = level.popleft()
+                self._removed()
+                return priority, item
+        raise asyncio.QueueEmpty
+
+    async def get(self):
+        """Wait for an item, then remove and return it as (priority, item)."""
+        while self.empty():
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    def evict(self, priority, same_level=True):
+        """Drop the oldest item of the least important level below priority (or at it, if same_level) and return it."""
+        lowest = min(max(priority, 0), len(self._levels) - 1) + (0 if same_level else 1)
+        for level in reversed(self._levels[lowest:]):
+            if level:
+                item = level.popleft()
+                self._removed()
+                return item
+        return None
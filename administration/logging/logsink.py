@@ -0,0 +1,231 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+SEGMENT_PREFIX = "datascraper-"
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+class LogSink:
+    """Writes log entries as JSON Lines on a background thread, rotating by size and age."""
+
+    def __init__(self, directory, rotate_bytes=50 * 1024 * 1024, rotate_seconds=86400, compress=True,
+                 keep_segments=30, flush_interval=1.0, fsync=False):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.keep_segments = keep_segments
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.written = 0
+        self.errors = 0
+
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._path = None
+        self._opened_at = 0
+        self._size = 0
+        self._stamp = None
+        self._sequence = 0
+        self._thread = None
+
+    def start(self):
+        """Start the writer thread."""
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="log-sink", daemon=True)
+            self._thread.start()
+
+    def write(self, entry):
+        """Queue an entry (a dict) for writing; encoding happens on the writer thread."""
+        self._queue.put(entry)
+
+    def flush(self, timeout=5):
+        """Wait until everything queued so far is written to the active segment."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Write what is left and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _segment_path(self, now):
+        # A sequence number keeps names unique and in order when several start in the same second
+        stamp = datetime.fromtimestamp(now, timezone.utc).strftime(SEGMENT_TIME_FORMAT)
+        self._sequence = self._sequence + 1 if stamp == self._stamp else 0
+        self._stamp = stamp
+        while True:
+            path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{stamp}-{self._sequence:04d}.jsonl")
+            if not os.path.exists(path) and not os.path.exists(path + ".gz"):
+                return path
+            self._sequence += 1
+
+    def _open(self, now):
+        self._path = self._segment_path(now)
+        self._file = open(self._path, "a", encoding="utf-8", buffering=1024 * 1024)
+        self._opened_at = now
+        self._size = 0
+
+    def _close_segment(self):
+        """Close the active segment, then compress it and drop the oldest segments."""
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+        if self.compress and self._size:
+            with open(self._path, "rb") as source, gzip.open(self._path + ".gz", "wb") as target:
+                while chunk := source.read(1024 * 1024):
+                    target.write(chunk)
+            os.remove(self._path)
+        elif not self._size:
+            os.remove(self._path)
+
+        if self.keep_segments:
+            for path in segment_paths(self.directory)[:-self.keep_segments]:
+                os.remove(path)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+
+            try:
+                if isinstance(item, dict):
+                    now = time.time()
+                    if self._file is None or self._size >= self.rotate_bytes or now - self._opened_at >= self.rotate_seconds:
+                        self._close_segment()
+                        self._open(now)
+                    line = json.dumps(item, separators=(",", ":"), ensure_ascii=False, default=str) + "\n"
+                    self._file.write(line)
+                    self._size += len(line)
+                    self.written += 1
+
+                # Flush on a timer, when asked to, and before stopping
+                if self._file is not None and (item is None or isinstance(item, threading.Event) or time.monotonic() - last_flush >= self.flush_interval):
+                    self._file.flush()
+                    last_flush = time.monotonic()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error writing log entry: {e}")
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                self._close_segment()
+                return
+
+    def query(self, action=None, user_id=None, since=None, until=None, text=None, limit=100, guild_id=None):
+        """Find entries by action, user ID, time range (epoch ms), text in the details and guild, newest first."""
+        self.flush()
+        return query_segments(self.directory, action, user_id, since, until, text, limit, guild_id)
+
+def segment_paths(directory):
+    """List segment files oldest first (names sort by their start time)."""
+    return sorted(glob.glob(os.path.join(glob.escape(directory), SEGMENT_PREFIX + "*.jsonl*")))
+
+def _segment_start(path):
+    """Get a segment's start time in epoch ms from its name."""
+    stamp = os.path.basename(path)[len(SEGMENT_PREFIX):].split(".")[0].split("-")[0]
+    return int(datetime.strptime(stamp, SEGMENT_TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def query_segments(directory, action=None, user_id=None, since=None, until=None, text=None, limit=100, guild_id=None):
+    """Search segments newest first, skipping those that end before since or start after until."""
+    paths = segment_paths(directory)
+    user_id = None if user_id is None else str(user_id)
+    guild_id = None if guild_id is None else str(guild_id)
+    text = None if text is None else text.lower()
+    # The raw line can only rule entries out when the text reads the same inside JSON
+    raw_text = text if text is not None and json.dumps(text, ensure_ascii=False)[1:-1] == text else None
+    results = []
+
+    for i in range(len(paths) - 1, -1, -1):
+        path = paths[i]
+        start = _segment_start(path)
+        if until is not None and start > until:
+            continue
+        # A segment ends where the next one starts (rounded down to the second)
+        if since is not None and i + 1 < len(paths) and _segment_start(paths[i + 1]) + 1000 < since:
+            break
+
+        opener = gzip.open if path.endswith(".gz") else open
+        matches = []
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                # Cheap substring checks before decoding the line
+                if user_id is not None and user_id not in line:
+                    continue
+                if guild_id is not None and guild_id not in line:
+                    continue
+                if raw_text is not None and raw_text not in line.lower():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if action is not None and entry.get("action", "").lower() != action.lower():
+                    continue
+                if user_id is not None and str(entry.get("user", {}).get("id")) != user_id:
+                    continue
+                if guild_id is not None and entry.get("guild") != guild_id:
+                    continue
+                if since is not None and entry.get("ts", 0) < since:
+                    continue
+                if until is not None and entry.get("ts", 0) > until:
+                    continue
+                if text is not None and text not in str(entry.get("details", "")).lower():
+                    continue
+                matches.append(entry)
+
+        results.extend(reversed(matches))
+        if len(results) >= limit:
+            break
+
+    return results[:limit]
+
+def parse_time(value):
+    """Parse an ISO date/time (UTC unless given) or a relative age like 30m, 12h or 7d into epoch ms."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value[-1:] in units and value[:-1].replace(".", "", 1).isdigit():
+        return int((time.time() - float(value[:-1]) * units[value[-1]]) * 1000)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+def main():
+    """Search the local log from the command line, e.g. python logsink.py --action "Member Ban" --since 7d"""
+    parser = argparse.ArgumentParser(description="Search the datascraper's local JSON Lines log")
+    parser.add_argument("--dir", default="logs", help="Log directory")
+    parser.add_argument("--action", help='Action name, e.g. "Member Join"')
+    parser.add_argument("--user", help="User ID")
+    parser.add_argument("--guild", help="Guild ID")
+    parser.add_argument("--since", type=parse_time, help="ISO time or age such as 12h or 7d")
+    parser.add_argument("--until", type=parse_time, help="ISO time or age such as 12h or 7d")
+    parser.add_argument("--text", help="Text the entry's details must contain")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    for entry in query_segments(args.dir, args.action, args.user, args.since, args.until, args.text, args.limit, args.guild):
+        print(json.dumps(entry, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
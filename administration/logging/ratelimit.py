@@ -0,0 +1,115 @@
+import asyncio
+import random
+import re
+import time
+from collections import deque
+import aiohttp
+
+# IDs after these path segments pick the bucket (Discord's "major parameters"); other IDs do not
+_MAJOR_ID = re.compile(r"/(?:channels|guilds|webhooks)/\d{15,21}")
+_MINOR_ID = re.compile(r"(?<!/channels)(?<!/guilds)(?<!/webhooks)/\d{15,21}(?=/|$)")
+
+def route_key(method, path):
+    """Reduce a request to the route its rate limit applies to, e.g. POST /channels/123/messages/{id}."""
+    return f"{method} {_MINOR_ID.sub('/{id}', path)}"
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter, never shorter than a Retry-After the server gave."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        # Spread retries over a little past the reset so waiting senders do not all wake at once
+        delay = retry_after + random.uniform(0, min(delay, retry_after * 0.5 + base))
+    return delay
+
+class RateLimiter:
+    """Paces outbound Discord requests using the rate limit headers of earlier responses."""
+
+    def __init__(self, global_limit=50):
+        self.global_limit = global_limit
+        self.stats = {"waits": 0, "waited": 0.0, "route_limited": 0, "global_limited": 0}
+
+        self._global_until = 0.0
+        self._global_sent = deque()  # Send times within the last second
+        self._bucket_hashes = {}  # Route key -> Discord bucket hash
+        self._buckets = {}  # Bucket -> [remaining, reset time]
+
+    def _bucket(self, key):
+        bucket_hash = self._bucket_hashes.get(key)
+        # Buckets are shared by routes with the same hash, but only within one major parameter
+        if bucket_hash is None:
+            return key
+        major = _MAJOR_ID.search(key)
+        return f"{bucket_hash}:{major.group(0) if major else ''}"
+
+    def delay(self, key):
+        """Seconds until a request on this route may be sent without being rate limited."""
+        now = time.monotonic()
+        wait = max(0.0, self._global_until - now)
+
+        while self._global_sent and now - self._global_sent[0] >= 1:
+            self._global_sent.popleft()
+        if len(self._global_sent) >= self.global_limit:
+            wait = max(wait, 1 - (now - self._global_sent[0]))
+
+        state = self._buckets.get(self._bucket(key))
+        if state is not None and state[0] <= 0 and state[1] > now:
+            wait = max(wait, state[1] - now)
+        return wait
+
+    async def acquire(self, key, max_wait=None):
+        """Wait for a free slot on the route; give up (returning False) if that would take longer than max_wait."""
+        waited = 0.0
+        while True:
+            wait = self.delay(key)
+            if wait <= 0:
+                break
+            if max_wait is not None and waited + wait > max_wait:
+                return False
+            self.stats["waits"] += 1
+            self.stats["waited"] += wait
+            await asyncio.sleep(wait)
+            waited += wait
+
+        # Claim the slot now so concurrent senders see it taken before the response arrives
+        state = self._buckets.get(self._bucket(key))
+        if state is not None and state[1] > time.monotonic():
+            state[0] -= 1
+        return True
+
+    def update(self, key, status, headers):
+        """Record the rate limit state a response reported."""
+        now = time.monotonic()
+        if headers.get("X-RateLimit-Bucket"):
+            self._bucket_hashes[key] = headers["X-RateLimit-Bucket"]
+        bucket = self._bucket(key)
+
+        if status == 429:
+            retry_after = float(headers.get("Retry-After", 1))
+            if headers.get("X-RateLimit-Global") or headers.get("X-RateLimit-Scope") == "global":
+                self.stats["global_limited"] += 1
+                self._global_until = max(self._global_until, now + retry_after)
+            else:
+                self.stats["route_limited"] += 1
+                self._buckets[bucket] = [0, now + retry_after]
+        elif "X-RateLimit-Remaining" in headers:
+            self._buckets[bucket] = [
+                int(headers["X-RateLimit-Remaining"]),
+                now + float(headers.get("X-RateLimit-Reset-After", 1))
+            ]
+
+        # Forget buckets that have already reset so the table does not grow with every channel
+        if len(self._buckets) > 1024:
+            self._buckets = {name: state for name, state in self._buckets.items() if state[1] > now}
+
+    def trace_config(self):
+        """Build an aiohttp trace config that feeds every response the bot gets into the limiter."""
+        async def on_request_start(session, context, params):
+            self._global_sent.append(time.monotonic())
+
+        async def on_request_end(session, context, params):
+            self.update(route_key(params.method, params.url.path), params.response.status, params.response.headers)
+
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        return trace
@@ -0,0 +1,109 @@
+import sys
+from timestamps import to_epoch_ms
+
+# Shared int objects for snowflakes seen in many actions (guilds, moderators)
+_snowflakes = {}
+
+def snowflake(value):
+    """Convert an ID to a shared int, leaving non-numeric IDs as interned strings"""
+    if value is None:
+        return None
+    if not isinstance(value, int):
+        value = str(value)
+        if not value.isdigit():
+            return sys.intern(value)
+        value = int(value)
+    return _snowflakes.setdefault(value, value)
+
+def _intern(value):
+    """Intern a repeated string value, such as an action type or default reason"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def compact_action_id(action_id):
+    """Reduce an action ID to the audit log entry ID it was built from"""
+    if action_id is None or isinstance(action_id, int):
+        return action_id
+    action_id = str(action_id)
+    if action_id.isdigit():
+        return int(action_id)
+
+    # Older IDs were "<guild>:<action>:<user>:<entry>:<ISO timestamp>"; the
+    # audit log entry ID alone is already unique
+    parts = action_id.split(':')
+    if len(parts) > 3 and parts[3].isdigit():
+        return int(parts[3])
+    return action_id
+
+class ModerationAction:
+    """A stored moderation action"""
+
+    __slots__ = ("action", "guild_id", "timestamp", "reason", "moderator_id", "moderator_name", "action_id")
+
+    def __init__(self, action, guild_id, timestamp, reason=None, moderator_id=None, moderator_name=None, action_id=None):
+        self.action = _intern(action)
+        self.guild_id = snowflake(guild_id)
+        self.timestamp = timestamp
+        self.reason = _intern(reason)
+        self.moderator_id = snowflake(moderator_id)
+        self.moderator_name = _intern(moderator_name)
+        self.action_id = compact_action_id(action_id)
+
+    def __repr__(self):
+        return f"ModerationAction({self.action!r}, guild_id={self.guild_id!r}, timestamp={self.timestamp!r})"
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build an action from its JSON form"""
+        moderator = data.get("moderator")
+        if isinstance(moderator, dict):
+            moderator_id, moderator_name = moderator.get("id"), moderator.get("name")
+        else:
+            moderator_id, moderator_name = None, moderator
+
+        return cls(
+            data.get("action", "unknown"),
+            data.get("guild_id", "unknown"),
+            to_epoch_ms(data.get("timestamp")),
+            data.get("reason"),
+            moderator_id,
+            moderator_name,
+            data.get("action_id")
+        )
+
+    def to_dict(self):
+        """Convert the action to its JSON form"""
+        data = {
+            "action": self.action,
+            "guild_id": str(self.guild_id),
+            "timestamp": self.timestamp,
+            "reason": self.reason
+        }
+        if self.moderator_id is not None:
+            data["moderator"] = {"id": str(self.moderator_id), "name": self.moderator_name}
+        elif self.moderator_name is not None:
+            data["moderator"] = self.moderator_name
+        if self.action_id is not None:
+            data["action_id"] = self.action_id
+        return data
+
+def convert_history(history):
+    """Replace action dicts with ModerationAction records, counting those stored in an older form"""
+    upgraded = 0
+    for user_data in history.values():
+        if not isinstance(user_data, dict) or not isinstance(user_data.get("actions"), list):
+            continue
+        actions = user_data["actions"]
+        for i, data in enumerate(actions):
+            if isinstance(data, ModerationAction):
+                continue
+            action = ModerationAction.from_dict(data)
+            if data.get("timestamp") != action.timestamp or data.get("action_id") != action.action_id:
+                upgraded += 1
+            actions[i] = action
+    return upgraded
+
+def to_json(value):
+    """json.dump default hook for histories holding ModerationAction records"""
+    if isinstance(value, ModerationAction):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
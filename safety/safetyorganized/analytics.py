@@ -0,0 +1,214 @@
+from array import array
+from data import get_actions_since, get_reputations, calculate_server_stats, get_user_action_counts
+from actions import snowflake
+from timestamps import now_ms
+from reputation import reputation_engine
+
+# NumPy is optional; without it the commands fall back to the store's own counters
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DAY_MS = 86_400_000
+
+class ActionColumns:
+    """Moderation actions held column by column, refreshed incrementally from the store"""
+
+    def __init__(self):
+        # Store version the columns have caught up to
+        self.version = 0
+
+        # One entry per action: codes into the tables below, and the epoch-ms
+        # timestamp (-1 when unknown)
+        self.guilds = array('q')
+        self.users = array('q')
+        self.types = array('b')
+        self.times = array('q')
+
+        # Code tables for guild IDs, user IDs and action types
+        self.guild_ids, self.guild_codes = [], {}
+        self.user_ids, self.user_codes = [], {}
+        self.type_names, self.type_codes = [], {}
+
+        # Current reputation by user code
+        self.reputations = array('d')
+
+        # Most recent action by guild code: (timestamp, user ID, action type, reason)
+        self.recent = {}
+
+        # Group-by results for the current version
+        self._summary = None
+
+    def __len__(self):
+        return len(self.times)
+
+    @staticmethod
+    def _code(ids, codes, value):
+        """Get the code for a value, assigning the next one if it is new"""
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(ids)
+            ids.append(value)
+        return code
+
+    def refresh(self):
+        """Append the actions added to the store since the last refresh, streaming them from the store"""
+        version, new_actions = get_actions_since(self.version)
+
+        # The store was reloaded from disk, so start over
+        if version < self.version:
+            self.__init__()
+            version, new_actions = get_actions_since(0)
+
+        touched = set()
+        added = 0
+        for user_id, action in new_actions:
+            guild = self._code(self.guild_ids, self.guild_codes, action.guild_id)
+            user = self._code(self.user_ids, self.user_codes, user_id)
+            if user == len(self.reputations):
+                self.reputations.append(0)
+            timestamp = -1 if action.timestamp is None else action.timestamp
+
+            self.guilds.append(guild)
+            self.users.append(user)
+            self.types.append(self._code(self.type_names, self.type_codes, action.action))
+            self.times.append(timestamp)
+            touched.add(user_id)
+            added += 1
+
+            recent = self.recent.get(guild)
+            if timestamp >= 0 and (recent is None or timestamp > recent[0]):
+                self.recent[guild] = (timestamp, user_id, action.action, action.reason or "No reason provided")
+
+        # Reputation only changes when a user gets a new action
+        for user_id, reputation in get_reputations(touched).items():
+            self.reputations[self.user_codes[user_id]] = reputation
+
+        if added:
+            self._summary = None
+        self.version = version
+
+    def set_reputations(self, scores):
+        """Replace every user's reputation after a batch recompute"""
+        self.reputations = array('d', (float(score) for score in scores))
+        self._summary = None
+
+    def summary(self):
+        """Compute every group-by the commands need in one vectorized pass, cached per version"""
+        if self._summary is not None:
+            return self._summary
+
+        guild_count, user_count, type_count = len(self.guild_ids), len(self.user_ids), len(self.type_names)
+        guilds = np.frombuffer(self.guilds, dtype=np.int64) if self.guilds else np.zeros(0, dtype=np.int64)
+        users = np.frombuffer(self.users, dtype=np.int64) if self.users else np.zeros(0, dtype=np.int64)
+        types = np.frombuffer(self.types, dtype=np.int8).astype(np.int64) if self.types else np.zeros(0, dtype=np.int64)
+        reputations = np.frombuffer(self.reputations, dtype=np.float64) if self.reputations else np.zeros(0)
+
+        # Action counts for each (user, guild) pair, sorted by user so one
+        # user's pairs are contiguous; the pairs also give each guild's users
+        user_guilds, user_guild_counts = np.unique(users * guild_count + guilds, return_counts=True)
+        pair_users = user_guilds // max(guild_count, 1)
+        pair_guilds = user_guilds % max(guild_count, 1)
+
+        self._summary = {
+            "guild_type_counts": np.bincount(guilds * type_count + types, minlength=guild_count * type_count).reshape(guild_count, type_count),
+            "guild_users": np.bincount(pair_guilds, minlength=guild_count),
+            "guild_reputation": np.bincount(pair_guilds, weights=reputations[pair_users], minlength=guild_count),
+            "user_type_counts": np.bincount(users * type_count + types, minlength=user_count * type_count).reshape(user_count, type_count),
+            "user_guilds": user_guilds,
+            "user_guild_counts": user_guild_counts
+        }
+        return self._summary
+
+# Columns shared by every command
+columns = ActionColumns()
+
+def server_stats(guild_id):
+    """Calculate reputation statistics for a server"""
+    if np is None:
+        return calculate_server_stats(guild_id)
+
+    stats = {
+        "action_counts": {},
+        "total_users": 0,
+        "total_reputation": 0,
+        "avg_reputation": 0,
+        "recent_action": None
+    }
+
+    columns.refresh()
+    guild = columns.guild_codes.get(snowflake(guild_id))
+    if guild is None:
+        return stats
+
+    summary = columns.summary()
+    type_counts = summary["guild_type_counts"][guild]
+    stats["action_counts"] = {columns.type_names[code]: int(count) for code, count in enumerate(type_counts) if count}
+    stats["total_users"] = int(summary["guild_users"][guild])
+    stats["total_reputation"] = reputation_engine.current(float(summary["guild_reputation"][guild]))
+    if stats["total_reputation"].is_integer():
+        stats["total_reputation"] = int(stats["total_reputation"])
+    if stats["total_users"] > 0:
+        stats["avg_reputation"] = stats["total_reputation"] / stats["total_users"]
+
+    recent = columns.recent.get(guild)
+    if recent:
+        timestamp, user_id, action_type, reason = recent
+        stats["recent_action"] = {
+            "action": action_type,
+            "timestamp": timestamp,
+            "user_id": user_id,
+            "reason": reason
+        }
+
+    return stats
+
+def user_action_counts(user_id):
+    """Count a user's actions by type and by guild"""
+    if np is None:
+        return get_user_action_counts(user_id)
+
+    counts = {"by_type": {}, "by_guild": {}}
+
+    columns.refresh()
+    user = columns.user_codes.get(str(user_id))
+    if user is None:
+        return counts
+
+    summary = columns.summary()
+    type_counts = summary["user_type_counts"][user]
+    counts["by_type"] = {columns.type_names[code]: int(count) for code, count in enumerate(type_counts) if count}
+
+    # This user's (user, guild) keys sit in one contiguous run
+    guild_count = len(columns.guild_ids)
+    start, end = np.searchsorted(summary["user_guilds"], [user * guild_count, (user + 1) * guild_count])
+    for key, count in zip(summary["user_guilds"][start:end], summary["user_guild_counts"][start:end]):
+        counts["by_guild"][columns.guild_ids[int(key) - user * guild_count]] = int(count)
+
+    return counts
+
+def daily_actions(guild_id=None, days=30):
+    """Count actions per UTC day over the last few days (oldest first), optionally within one guild"""
+    columns.refresh()
+
+    end = (now_ms() // DAY_MS + 1) * DAY_MS
+    start = end - days * DAY_MS
+    guild = None
+    if guild_id is not None:
+        guild = columns.guild_codes.get(snowflake(guild_id))
+        if guild is None:
+            return [0] * days
+
+    if np is None or not len(columns):
+        counts = [0] * days
+        for i, timestamp in enumerate(columns.times):
+            if start <= timestamp < end and (guild is None or columns.guilds[i] == guild):
+                counts[(timestamp - start) // DAY_MS] += 1
+        return counts
+
+    times = np.frombuffer(columns.times, dtype=np.int64)
+    mask = (times >= start) & (times < end)
+    if guild is not None:
+        mask &= np.frombuffer(columns.guilds, dtype=np.int64) == guild
+    return np.bincount((times[mask] - start) // DAY_MS, minlength=days).tolist()
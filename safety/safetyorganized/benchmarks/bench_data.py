@@ -0,0 +1,304 @@
+"""Offline benchmarks for the moderation history data layer.
+
+Run from safety/safetyorganized:
+
+    python benchmarks/bench_data.py --sizes 10000 100000 1000000 --output results.json
+    python benchmarks/bench_data.py --sizes 100000 --backend sqlite --baseline results.json
+
+Each size runs in its own process against a synthetic history in a
+temporary directory, so peak memory is measured per size and nothing
+talks to Discord.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+
+ACTION_TYPES = ["ban", "kick", "timeout"]
+REASONS = ["No reason provided", "Spam", "Harassment", "Raid", "Scam links", "Alt account"]
+DAY_MS = 86_400_000
+
+# Snowflake-sized ID bases so IDs look like the real thing
+USER_BASE = 100_000_000_000_000_000
+GUILD_BASE = 200_000_000_000_000_000
+MODERATOR_BASE = 300_000_000_000_000_000
+ENTRY_BASE = 400_000_000_000_000_000
+
+# Metrics where a larger number is an improvement
+HIGHER_IS_BETTER = ("ingest_per_s", "dedupe_per_s")
+
+def generate_history(path, actions, guilds, users, seed):
+    """Stream a synthetic JSON history snapshot to disk"""
+    rng = random.Random(seed)
+    now = int(time.time() * 1000)
+
+    # Spread the actions over the users first so the file can be written user by user
+    counts = [0] * users
+    for _ in range(actions):
+        counts[rng.randrange(users)] += 1
+
+    entry = 0
+    with open(path, 'w') as f:
+        f.write('{')
+        first = True
+        for user, count in enumerate(counts):
+            if not count:
+                continue
+            user_actions = []
+            for _ in range(count):
+                moderator = rng.randrange(50)
+                user_actions.append({
+                    "action": rng.choice(ACTION_TYPES),
+                    "guild_id": str(GUILD_BASE + rng.randrange(guilds)),
+                    "timestamp": now - rng.randrange(365 * DAY_MS),
+                    "reason": rng.choice(REASONS),
+                    "moderator": {"id": str(MODERATOR_BASE + moderator), "name": f"moderator{moderator}"},
+                    "action_id": ENTRY_BASE + entry
+                })
+                entry += 1
+            f.write(('' if first else ',') + json.dumps(str(USER_BASE + user)) + ':')
+            json.dump({"reputation": 0, "actions": user_actions}, f, separators=(',', ':'))
+            first = False
+        f.write('}')
+
+def peak_rss_mb():
+    """Get this process's peak resident set size in MB, if the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def timed(function, *args, repeat=1):
+    """Run a function and return (seconds per call, last result)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+class FakeBot:
+    """Enough of a bot for rendering: every user is in gateway state, no guild is"""
+
+    def get_user(self, user_id):
+        return SimpleNamespace(id=user_id, name=f"user{user_id % 100000}", avatar=None, bot=False)
+
+    def get_guild(self, guild_id):
+        return None
+
+def run_one(args):
+    """Benchmark one history size in this process and print the results as JSON"""
+    workdir = tempfile.mkdtemp(prefix="modbench-")
+    history_file = os.path.join(workdir, "moderation_history.json")
+    os.environ.update({
+        "HISTORY_FILE": history_file,
+        "HISTORY_WAL_FILE": history_file + ".wal",
+        "HISTORY_DB_FILE": os.path.join(workdir, "moderation_history.db"),
+        "HISTORY_BACKEND": args.backend,
+        "HISTORY_FSYNC": "true" if args.fsync else "false",
+        "AUDIT_CURSOR_FILE": os.path.join(workdir, "audit_cursors.json"),
+        "USER_CACHE_FILE": os.path.join(workdir, "user_cache.json")
+    })
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+
+    users = args.users or max(1, args.actions // 5)
+    start = time.perf_counter()
+    generate_history(history_file, args.actions, args.guilds, users, args.seed)
+    generate_seconds = time.perf_counter() - start
+    rss_before_load = peak_rss_mb()
+
+    # Import only now so config picks up the environment above
+    sys.path.insert(0, PACKAGE_DIR)
+    import logging
+    logging.disable(logging.WARNING)
+    import data
+    import analytics
+    import utils
+
+    metrics = {"generate_s": round(generate_seconds, 3)}
+    rng = random.Random(args.seed + 1)
+
+    # Load (for SQLite this includes migrating the JSON file)
+    seconds, _ = timed(data.load_moderation_history)
+    metrics["load_s"] = round(seconds, 3)
+    metrics["peak_rss_after_load_mb"] = peak_rss_mb()
+
+    # Ingest new actions, then the same actions again to exercise dedupe
+    ingest = [
+        (USER_BASE + rng.randrange(users), rng.choice(ACTION_TYPES), GUILD_BASE + rng.randrange(args.guilds),
+         ENTRY_BASE + args.actions + i)
+        for i in range(args.ingest)
+    ]
+    for name in ("ingest_per_s", "dedupe_per_s"):
+        start = time.perf_counter()
+        for user_id, action_type, guild_id, action_id in ingest:
+            data.add_moderation_action(user_id, action_type, guild_id, reason="Benchmark", moderator="benchmark", action_id=action_id)
+        metrics[name] = round(len(ingest) / (time.perf_counter() - start), 1)
+    duplicates_skipped = data.get_duplicate_count()
+
+    # Queries, averaged over a spread of guilds
+    sample_guilds = [GUILD_BASE + rng.randrange(args.guilds) for _ in range(args.repeat)]
+    seconds, _ = timed(data.get_leaderboard, 100, repeat=args.repeat)
+    metrics["leaderboard_global_ms"] = round(seconds * 1000, 3)
+    start = time.perf_counter()
+    for guild_id in sample_guilds:
+        data.get_leaderboard(100, guild_id)
+    metrics["leaderboard_guild_ms"] = round((time.perf_counter() - start) * 1000 / args.repeat, 3)
+
+    start = time.perf_counter()
+    for guild_id in sample_guilds:
+        data.calculate_server_stats(guild_id)
+    metrics["stats_ms"] = round((time.perf_counter() - start) * 1000 / args.repeat, 3)
+
+    # The first analytics call builds the columns and group-bys
+    seconds, _ = timed(analytics.server_stats, sample_guilds[0])
+    metrics["analytics_stats_cold_ms"] = round(seconds * 1000, 3)
+    start = time.perf_counter()
+    for guild_id in sample_guilds:
+        analytics.server_stats(guild_id)
+    metrics["analytics_stats_ms"] = round((time.perf_counter() - start) * 1000 / args.repeat, 3)
+    seconds, _ = timed(analytics.daily_actions, None, 30, repeat=args.repeat)
+    metrics["daily_actions_ms"] = round(seconds * 1000, 3)
+
+    # Leaderboard page rendering, first with an empty user cache and then warm
+    bot = FakeBot()
+    for name in ("render_cold_ms", "render_warm_ms"):
+        start = time.perf_counter()
+        asyncio.run(utils.render_leaderboard_page(bot, "all.100", 0))
+        metrics[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    metrics["peak_rss_before_load_mb"] = rss_before_load
+
+    print(json.dumps({
+        "backend": args.backend,
+        "actions": args.actions,
+        "guilds": args.guilds,
+        "users": users,
+        "fsync": args.fsync,
+        "duplicates_skipped": duplicates_skipped,
+        "metrics": metrics
+    }))
+
+    # Let any background compaction finish before removing its files
+    import store
+    if store._compaction_thread is not None:
+        store._compaction_thread.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+def describe_environment():
+    """Describe the machine and code the results came from"""
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": numpy_version,
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+def compare(results, baseline):
+    """Print each metric next to the matching baseline run"""
+    previous = {(run["backend"], run["actions"], run["guilds"]): run for run in baseline.get("runs", [])}
+    for run in results["runs"]:
+        old = previous.get((run["backend"], run["actions"], run["guilds"]))
+        if old is None:
+            print(f"No baseline for {run['backend']} with {run['actions']} actions", file=sys.stderr)
+            continue
+        print(f"{run['backend']}, {run['actions']} actions vs baseline:", file=sys.stderr)
+        for name, value in run["metrics"].items():
+            old_value = old["metrics"].get(name)
+            if not value or not old_value:
+                continue
+            ratio = value / old_value
+            if abs(ratio - 1) < 0.02:
+                verdict = "same"
+            elif (ratio > 1) == (name in HIGHER_IS_BETTER):
+                verdict = "better"
+            else:
+                verdict = "worse"
+            print(f"  {name:26} {old_value:>12} -> {value:>12}  x{ratio:.2f} {verdict}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the moderation history data layer offline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Numbers of actions to generate")
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=None, help="Number of users (default: actions / 5)")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--ingest", type=int, default=10_000, help="Actions added (and re-added) after loading")
+    parser.add_argument("--repeat", type=int, default=50, help="Repetitions of each query")
+    parser.add_argument("--fsync", action="store_true", help="fsync the write-ahead log on every action")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results from an earlier run")
+    parser.add_argument("--run-one", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--actions", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args)
+        return
+
+    results = {"environment": describe_environment(), "runs": []}
+    for size in args.sizes:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--run-one", "--actions", str(size),
+            "--guilds", str(args.guilds), "--backend", args.backend, "--ingest", str(args.ingest),
+            "--repeat", str(args.repeat), "--seed", str(args.seed)
+        ]
+        if args.users:
+            command += ["--users", str(args.users)]
+        if args.fsync:
+            command.append("--fsync")
+
+        print(f"Benchmarking {args.backend} with {size} actions...", file=sys.stderr)
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(completed.returncode)
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        if run["duplicates_skipped"] != args.ingest:
+            print(f"  Expected {args.ingest} duplicates to be skipped, got {run['duplicates_skipped']}", file=sys.stderr)
+        results["runs"].append(run)
+        for name, value in run["metrics"].items():
+            print(f"  {name:26} {value}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,794 @@
+"""Offline stand-in for the Discord gateway and REST API, for load-testing the bots.
+
+Run from safety/safetyorganized:
+
+    python benchmarks/fake_discord.py --guilds 5 --members 2000 --rate 200 --duration 120
+    python benchmarks/fake_discord.py --replay events.jsonl --speed 10 --output report.json
+
+then start a bot with the printed DISCORD_API_BASE, DISCORD_GATEWAY_URL and
+TARGET_CHANNEL_ID in its environment (any token is accepted). A bot can also
+run in the same process: start a FakeDiscord and call install() before
+bot.start().
+
+Every synthetic event carries a token ("evt<seq>") in its message content,
+audit log reason or new member's name. When a bot posts a message containing
+that token, the time since the event was sent over the gateway is recorded,
+so the report gives end-to-end event-to-log latency and throughput.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import re
+import sys
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+
+from aiohttp import web, WSMsgType
+
+DISCORD_EPOCH = 1420070400000
+DAY_MS = 86_400_000
+API_PREFIX = "/api/v10"
+
+# Gateway opcodes
+DISPATCH, HEARTBEAT, IDENTIFY, PRESENCE_UPDATE, RESUME, REQUEST_GUILD_MEMBERS, HELLO, HEARTBEAT_ACK = 0, 1, 2, 3, 6, 8, 10, 11
+HEARTBEAT_INTERVAL_MS = 41250
+MEMBERS_PER_CHUNK = 1000
+
+# Audit log action types
+AUDIT_KICK, AUDIT_BAN, AUDIT_MEMBER_UPDATE = 20, 22, 24
+
+# Token tying a log message back to the event that caused it
+TOKEN = re.compile(r"evt(\d+)")
+
+EVENT_TYPES = ("message", "join", "leave", "ban", "kick", "timeout")
+DEFAULT_MIX = "message:90,join:4,leave:3,ban:1,kick:1,timeout:1"
+REASONS = ["Spam", "Harassment", "Raid", "Scam links", "Alt account"]
+WORDS = ["hello", "anyone", "around", "check", "this", "out", "lol", "thanks", "server", "update"]
+
+def iso(ms):
+    """Format epoch milliseconds the way Discord does"""
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).isoformat()
+
+def percentile(values, fraction):
+    """Get a percentile from a sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+class Snowflakes:
+    """Generates unique snowflakes that encode a creation time"""
+
+    def __init__(self):
+        self._counter = 0
+
+    def next(self, ms=None):
+        if ms is None:
+            ms = int(time.time() * 1000)
+        self._counter += 1
+        return ((ms - DISCORD_EPOCH) << 22) | (self._counter & 0x3FFFFF)
+
+class FakeGuild:
+    """One simulated guild: channels, members and an audit log"""
+
+    def __init__(self, guild_id, name, owner_id):
+        self.id = guild_id
+        self.name = name
+        self.owner_id = owner_id
+        self.channels = []
+        self.members = {}
+
+        # Audit log entries oldest first, with their IDs alongside for bisecting
+        self.audit_entries = []
+        self.audit_ids = []
+
+    def add_audit_entry(self, entry):
+        self.audit_entries.append(entry)
+        self.audit_ids.append(int(entry["id"]))
+
+    def audit_page(self, limit, before=None, after=None, action_type=None):
+        """Get entries the way the API pages them: ascending after a cursor, otherwise newest first"""
+        if action_type is not None:
+            # Filtered reads are rare (first polls), so a scan is fine
+            entries = [entry for entry in self.audit_entries if entry["action_type"] == action_type
+                       and (after is None or int(entry["id"]) > after) and (before is None or int(entry["id"]) < before)]
+            return entries[:limit] if after is not None else entries[::-1][:limit]
+        if after is not None:
+            start = bisect.bisect_right(self.audit_ids, after)
+            return self.audit_entries[start:start + limit]
+        end = len(self.audit_ids) if before is None else bisect.bisect_left(self.audit_ids, before)
+        return self.audit_entries[max(0, end - limit):end][::-1]
+
+    def to_payload(self, bot_member):
+        """Build the GUILD_CREATE payload; other members are sent when the bot requests them"""
+        return {
+            "id": str(self.id),
+            "name": self.name,
+            "owner_id": str(self.owner_id),
+            "member_count": len(self.members),
+            "large": len(self.members) >= 250,
+            "unavailable": False,
+            "features": [],
+            "emojis": [],
+            "stickers": [],
+            "roles": [{"id": str(self.id), "name": "@everyone", "permissions": "1071698660929", "position": 0}],
+            "channels": [dict(channel, guild_id=str(self.id)) for channel in self.channels],
+            "members": [bot_member],
+            "presences": [],
+            "voice_states": [],
+            "threads": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "joined_at": iso(DISCORD_EPOCH)
+        }
+
+class RateLimits:
+    """Fixed-window per-route and global limits, reported with Discord's headers"""
+
+    def __init__(self, route_limit, route_window, global_limit, error_rate, retry_after, rng):
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.global_limit = global_limit
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = rng
+        self._windows = {}
+        self._global = (0.0, 0)
+
+    def check(self, bucket):
+        """Count a request, returning (allowed, headers, body for a 429)"""
+        now = time.monotonic()
+
+        # The global limit applies per second across every route
+        if self.global_limit:
+            started, count = self._global
+            if now - started >= 1:
+                started, count = now, 0
+            if count >= self.global_limit:
+                retry_after = round(1 - (now - started), 3)
+                return False, {"X-RateLimit-Global": "true", "X-RateLimit-Scope": "global", "Retry-After": str(max(1, int(retry_after + 0.999)))}, {
+                    "message": "You are being rate limited.", "retry_after": retry_after, "global": True, "code": 0
+                }
+            self._global = (started, count + 1)
+
+        started, count = self._windows.get(bucket, (now, 0))
+        if now - started >= self.route_window:
+            started, count = now, 0
+        reset_after = round(self.route_window - (now - started), 3)
+        headers = {
+            "X-RateLimit-Limit": str(self.route_limit),
+            "X-RateLimit-Bucket": format(hash(bucket.split(':')[0]) & 0xFFFFFFFF, 'x'),
+            "X-RateLimit-Reset": str(round(time.time() + reset_after, 3)),
+            "X-RateLimit-Reset-After": str(reset_after)
+        }
+
+        if count >= self.route_limit:
+            headers.update({"X-RateLimit-Remaining": "0", "X-RateLimit-Scope": "user", "Retry-After": str(max(1, int(reset_after + 0.999)))})
+            return False, headers, {"message": "You are being rate limited.", "retry_after": reset_after, "global": False}
+
+        # Injected 429s look like a shared limit the client could not have predicted
+        if self.error_rate and self.rng.random() < self.error_rate:
+            headers.update({
+                "X-RateLimit-Remaining": str(self.route_limit - count), "X-RateLimit-Scope": "shared",
+                "Retry-After": str(max(1, int(self.retry_after + 0.999)))
+            })
+            return False, headers, {"message": "You are being rate limited.", "retry_after": self.retry_after, "global": False}
+
+        self._windows[bucket] = (started, count + 1)
+        headers["X-RateLimit-Remaining"] = str(self.route_limit - count - 1)
+        return True, headers, None
+
+class GatewaySession:
+    """One connected gateway client"""
+
+    def __init__(self, ws, compress):
+        self.ws = ws
+        self.sequence = 0
+        self.identified = False
+        self._compressor = zlib.compressobj() if compress == "zlib-stream" else None
+
+    async def send(self, op, data, event=None):
+        payload = {"op": op, "d": data, "s": None, "t": event}
+        if op == DISPATCH:
+            self.sequence += 1
+            payload["s"] = self.sequence
+        text = json.dumps(payload, separators=(',', ':'))
+
+        # zlib-stream shares one compression context per connection and ends
+        # every message with a sync flush; anything else goes out as plain text
+        if self._compressor is not None:
+            await self.ws.send_bytes(self._compressor.compress(text.encode()) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        else:
+            await self.ws.send_str(text)
+
+class FakeDiscord:
+    """Simulated guilds behind a Discord-compatible REST API and gateway"""
+
+    def __init__(self, guilds=3, members=500, channels=3, audit_entries=100, guild_id=None, log_channel_id=None,
+                 route_limit=5, route_window=5.0, global_limit=50, error_rate=0.0, retry_after=1.0, seed=1,
+                 host="127.0.0.1", port=8099):
+        self.rng = random.Random(seed)
+        self.host = host
+        self.port = port
+        self.snowflakes = Snowflakes()
+        self.rate_limits = RateLimits(route_limit, route_window, global_limit, error_rate, retry_after, self.rng)
+        self.sessions = []
+        self._runner = None
+        self._ready = asyncio.Event()
+
+        # Every known user by ID, starting with the bot itself
+        self.bot_user = self._make_user("fakebot", bot=True)
+        self.users = {self.bot_user["id"]: self.bot_user}
+
+        self.guilds = {}
+        for index in range(guilds):
+            guild = FakeGuild(guild_id if index == 0 and guild_id else self.snowflakes.next(), f"Fake Guild {index + 1}", int(self.bot_user["id"]))
+            for channel_index in range(channels):
+                channel_id = log_channel_id if index == 0 and channel_index == 0 and log_channel_id else self.snowflakes.next()
+                guild.channels.append({
+                    "id": str(channel_id), "type": 0, "name": f"channel-{channel_index + 1}", "position": channel_index,
+                    "permission_overwrites": [], "nsfw": False, "topic": None, "last_message_id": None,
+                    "rate_limit_per_user": 0, "parent_id": None
+                })
+            for member_index in range(members):
+                self._add_member(guild, self._make_user(f"member{member_index}"))
+            self._seed_audit_log(guild, audit_entries)
+            self.guilds[guild.id] = guild
+        self.channels = {int(channel["id"]): guild for guild in self.guilds.values() for channel in guild.channels}
+
+        # Guild IDs from recorded streams that this run maps onto its own guilds
+        self._guild_aliases = {}
+
+        # Measurements
+        self.started = None
+        self.events = Counter()
+        self.requests = Counter()
+        self.rate_limited = 0
+        self.messages_received = 0
+        self.embeds_received = 0
+        self.identifies = 0
+        self._pending = {}
+        self._latencies = []
+        self._first_log = None
+        self._last_log = None
+
+    # Simulated state
+
+    def _make_user(self, name, bot=False):
+        user = {"id": str(self.snowflakes.next()), "username": name, "global_name": None, "discriminator": "0", "avatar": None}
+        if bot:
+            user["bot"] = True
+        return user
+
+    def _add_member(self, guild, user, joined_ms=None):
+        self.users[user["id"]] = user
+        member = {
+            "user": user, "roles": [], "nick": None, "joined_at": iso(joined_ms or int(time.time() * 1000)),
+            "deaf": False, "mute": False, "flags": 0, "pending": False, "communication_disabled_until": None
+        }
+        guild.members[user["id"]] = member
+        return member
+
+    def _bot_member(self):
+        return {"user": self.bot_user, "roles": [], "nick": None, "joined_at": iso(DISCORD_EPOCH), "deaf": False, "mute": False, "flags": 0}
+
+    def _audit_entry(self, guild, action, target_id, moderator_id, reason, ms=None, changes=None):
+        entry = {
+            "id": str(self.snowflakes.next(ms)), "action_type": action, "target_id": str(target_id),
+            "user_id": str(moderator_id), "reason": reason, "changes": changes or [], "options": None
+        }
+        guild.add_audit_entry(entry)
+        return entry
+
+    def _seed_audit_log(self, guild, count):
+        """Fill a guild's audit log with older moderation actions, oldest first"""
+        if not count or not guild.members:
+            return
+        now = int(time.time() * 1000)
+        member_ids = list(guild.members)
+        moderators = member_ids[:5]
+        for ms in sorted(now - self.rng.randrange(90 * DAY_MS) for _ in range(count)):
+            action = self.rng.choice((AUDIT_BAN, AUDIT_KICK, AUDIT_MEMBER_UPDATE))
+            changes = None
+            if action == AUDIT_MEMBER_UPDATE:
+                changes = [{"key": "communication_disabled_until", "new_value": iso(ms + DAY_MS)}]
+            self._audit_entry(guild, action, self.rng.choice(member_ids), self.rng.choice(moderators), self.rng.choice(REASONS), ms, changes)
+
+    # Gateway
+
+    async def broadcast(self, event, data):
+        """Dispatch an event to every identified session"""
+        for session in list(self.sessions):
+            if session.identified and not session.ws.closed:
+                try:
+                    await session.send(DISPATCH, data, event)
+                except ConnectionError:
+                    pass
+
+    async def _identify(self, session):
+        self.identifies += 1
+        session.identified = True
+        await session.send(DISPATCH, {
+            "v": 10,
+            "user": self.bot_user,
+            "guilds": [{"id": str(guild_id), "unavailable": True} for guild_id in self.guilds],
+            "session_id": format(self.rng.getrandbits(64), 'x'),
+            "resume_gateway_url": f"ws://{self.host}:{self.port}/gateway",
+            "shard": [0, 1],
+            "application": {"id": self.bot_user["id"], "flags": 0}
+        }, "READY")
+        for guild in self.guilds.values():
+            await session.send(DISPATCH, guild.to_payload(self._bot_member()), "GUILD_CREATE")
+        self._ready.set()
+
+    async def _send_members(self, session, data):
+        """Answer a member chunk request with every member of the guild"""
+        guild_ids = data.get("guild_id")
+        for guild_id in guild_ids if isinstance(guild_ids, list) else [guild_ids]:
+            guild = self.guilds.get(int(guild_id))
+            if guild is None:
+                continue
+            members = list(guild.members.values())
+            chunk_count = max(1, -(-len(members) // MEMBERS_PER_CHUNK))
+            for index in range(chunk_count):
+                await session.send(DISPATCH, {
+                    "guild_id": str(guild.id),
+                    "members": members[index * MEMBERS_PER_CHUNK:(index + 1) * MEMBERS_PER_CHUNK],
+                    "chunk_index": index,
+                    "chunk_count": chunk_count,
+                    "nonce": data.get("nonce")
+                }, "GUILD_MEMBERS_CHUNK")
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        session = GatewaySession(ws, request.query.get("compress"))
+        self.sessions.append(session)
+        try:
+            await session.send(HELLO, {"heartbeat_interval": HEARTBEAT_INTERVAL_MS})
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(message.data)
+                op, data = payload.get("op"), payload.get("d")
+                if op == HEARTBEAT:
+                    await session.send(HEARTBEAT_ACK, None)
+                elif op == IDENTIFY:
+                    await self._identify(session)
+                elif op == RESUME:
+                    session.identified = True
+                    await session.send(DISPATCH, {}, "RESUMED")
+                elif op == REQUEST_GUILD_MEMBERS:
+                    await self._send_members(session, data)
+        finally:
+            self.sessions.remove(session)
+        return ws
+
+    # Events
+
+    def synthetic_events(self, rate, mix, count=None, duration=None):
+        """Yield (offset in seconds, event) pairs at a steady rate with the given type weights"""
+        kinds, weights = zip(*mix.items())
+        guilds = list(self.guilds.values())
+        index = 0
+        while (count is None or index < count) and (duration is None or index / rate < duration):
+            guild = self.rng.choice(guilds)
+            kind = self.rng.choices(kinds, weights)[0]
+            event = {"type": kind, "guild": str(guild.id)}
+            if kind == "message":
+                event["channel"] = self.rng.choice(guild.channels)["id"]
+                event["content"] = " ".join(self.rng.choices(WORDS, k=self.rng.randint(1, 8)))
+            if kind != "join" and guild.members:
+                event["user"] = self.rng.choice(list(guild.members))
+            if kind in ("ban", "kick", "timeout"):
+                event["moderator"] = next(iter(guild.members), self.bot_user["id"])
+                event["reason"] = self.rng.choice(REASONS)
+            yield index / rate, event
+            index += 1
+
+    @staticmethod
+    def recorded_events(path):
+        """Yield (offset, event) pairs from a JSON Lines file written with --record"""
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    event = json.loads(line)
+                    yield event.pop("at", 0), event
+
+    def _resolve(self, event):
+        """Find the guild and channel an event refers to, mapping recorded IDs onto this run's guilds"""
+        guild_id = int(event["guild"])
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guilds = list(self.guilds.values())
+            guild = self._guild_aliases.setdefault(guild_id, guilds[len(self._guild_aliases) % len(guilds)])
+
+        channel_id = event.get("channel")
+        if channel_id is not None and self.channels.get(int(channel_id)) is not guild:
+            channel_id = guild.channels[int(channel_id) % len(guild.channels)]["id"]
+        return guild, channel_id
+
+    def _track(self, sequence):
+        token = f"evt{sequence}"
+        self._pending[sequence] = time.perf_counter()
+        return token
+
+    async def emit(self, event):
+        """Apply one event to the simulated state and dispatch it over the gateway"""
+        # Raw gateway dispatches (e.g. captured from a real connection) go out as they are
+        if "t" in event:
+            self.events[event["t"]] += 1
+            await self.broadcast(event["t"], event.get("d"))
+            return
+
+        kind = event["type"]
+        guild, channel_id = self._resolve(event)
+        sequence = sum(self.events.values()) + 1
+        self.events[kind] += 1
+        now = int(time.time() * 1000)
+
+        user_id = event.get("user")
+        member = guild.members.get(user_id)
+        if member is None and kind != "join" and user_id is not None:
+            # Recorded streams can name users this run does not have yet
+            member = self._add_member(guild, dict(self._make_user(f"user{user_id[-6:]}"), id=user_id))
+        if member is None and kind != "join":
+            return
+
+        if kind == "message":
+            await self.broadcast("MESSAGE_CREATE", {
+                "id": str(self.snowflakes.next()), "channel_id": channel_id, "guild_id": str(guild.id),
+                "author": member["user"], "member": {key: value for key, value in member.items() if key != "user"},
+                "content": f"{event.get('content', '')} {self._track(sequence)}", "timestamp": iso(now),
+                "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+                "attachments": [], "embeds": [], "pinned": False, "type": 0
+            })
+        elif kind == "join":
+            member = self._add_member(guild, self._make_user(self._track(sequence)))
+            await self.broadcast("GUILD_MEMBER_ADD", dict(member, guild_id=str(guild.id)))
+        elif kind == "leave":
+            del guild.members[user_id]
+            await self.broadcast("GUILD_MEMBER_REMOVE", {"guild_id": str(guild.id), "user": member["user"]})
+        else:
+            reason = f"{event.get('reason') or 'No reason provided'} {self._track(sequence)}"
+            moderator = event.get("moderator") or self.bot_user["id"]
+            if kind == "timeout":
+                member["communication_disabled_until"] = iso(now + DAY_MS)
+                entry = self._audit_entry(guild, AUDIT_MEMBER_UPDATE, user_id, moderator, reason, changes=[
+                    {"key": "communication_disabled_until", "new_value": member["communication_disabled_until"]}
+                ])
+                await self.broadcast("GUILD_MEMBER_UPDATE", dict(member, guild_id=str(guild.id)))
+            else:
+                entry = self._audit_entry(guild, AUDIT_BAN if kind == "ban" else AUDIT_KICK, user_id, moderator, reason)
+                del guild.members[user_id]
+                if kind == "ban":
+                    await self.broadcast("GUILD_BAN_ADD", {"guild_id": str(guild.id), "user": member["user"]})
+                await self.broadcast("GUILD_MEMBER_REMOVE", {"guild_id": str(guild.id), "user": member["user"]})
+            await self.broadcast("GUILD_AUDIT_LOG_ENTRY_CREATE", dict(entry, guild_id=str(guild.id)))
+
+    async def replay(self, events, speed=1.0, record=None):
+        """Emit (offset, event) pairs on schedule, optionally recording them for a later replay"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        record_file = open(record, 'w') if record else None
+        try:
+            for offset, event in events:
+                delay = start + offset / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if record_file:
+                    record_file.write(json.dumps(dict(event, at=round(offset, 4))) + '\n')
+                await self.emit(event)
+        finally:
+            if record_file:
+                record_file.close()
+
+    # REST
+
+    def _json(self, data, status=200, headers=None):
+        # discord.py only parses bodies whose content type is exactly application/json
+        return web.Response(body=json.dumps(data).encode(), status=status, headers=headers, content_type="application/json")
+
+    def _not_found(self, code, message):
+        return self._json({"message": message, "code": code}, status=404)
+
+    @web.middleware
+    async def _rate_limit(self, request, handler):
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[f"{request.method} {route}"] += 1
+        if not route.startswith(API_PREFIX) or route == API_PREFIX + "/gateway/bot":
+            return await handler(request)
+
+        # Buckets are per route and major parameter, as on Discord
+        major = request.match_info.get("channel_id") or request.match_info.get("guild_id") or ""
+        allowed, headers, body = self.rate_limits.check(f"{request.method} {route}:{major}")
+        if not allowed:
+            self.rate_limited += 1
+            headers["Via"] = "1.1 google"
+            return self._json(body, status=429, headers=headers)
+
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    async def get_gateway(self, request):
+        return self._json({
+            "url": f"ws://{self.host}:{self.port}/gateway", "shards": 1,
+            "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1}
+        })
+
+    async def get_current_user(self, request):
+        return self._json(self.bot_user)
+
+    async def get_application(self, request):
+        return self._json({
+            "id": self.bot_user["id"], "name": self.bot_user["username"], "icon": None, "description": "",
+            "bot_public": True, "bot_require_code_grant": False, "verify_key": "", "flags": 0,
+            "owner": self.bot_user, "team": None
+        })
+
+    async def get_user(self, request):
+        user = self.users.get(request.match_info["user_id"])
+        return self._json(user) if user else self._not_found(10013, "Unknown User")
+
+    async def put_commands(self, request):
+        commands = await request.json()
+        for command in commands:
+            command.setdefault("id", str(self.snowflakes.next()))
+            command.setdefault("description", "")
+            command.update(application_id=self.bot_user["id"], version=str(self.snowflakes.next()))
+        return self._json(commands)
+
+    async def get_commands(self, request):
+        return self._json([])
+
+    async def get_guild(self, request):
+        guild = self.guilds.get(int(request.match_info["guild_id"]))
+        if guild is None:
+            return self._not_found(10004, "Unknown Guild")
+        payload = guild.to_payload(self._bot_member())
+        del payload["members"]
+        return self._json(payload)
+
+    async def get_member(self, request):
+        guild = self.guilds.get(int(request.match_info["guild_id"]))
+        member = guild.members.get(request.match_info["user_id"]) if guild else None
+        if request.match_info["user_id"] == self.bot_user["id"] and guild:
+            member = self._bot_member()
+        return self._json(member) if member else self._not_found(10007, "Unknown Member")
+
+    async def get_audit_logs(self, request):
+        guild = self.guilds.get(int(request.match_info["guild_id"]))
+        if guild is None:
+            return self._not_found(10004, "Unknown Guild")
+        limit = max(1, min(100, int(request.query.get("limit", 50))))
+        before, after = request.query.get("before"), request.query.get("after")
+        action_type = request.query.get("action_type")
+        entries = guild.audit_page(
+            limit, int(before) if before else None, int(after) if after is not None else None,
+            int(action_type) if action_type else None
+        )
+
+        user_ids = {entry["user_id"] for entry in entries} | {entry["target_id"] for entry in entries}
+        return self._json({
+            "audit_log_entries": entries,
+            "users": [self.users[user_id] for user_id in user_ids if user_id in self.users],
+            "integrations": [], "webhooks": [], "guild_scheduled_events": [], "threads": [],
+            "application_commands": [], "auto_moderation_rules": []
+        })
+
+    async def get_channel(self, request):
+        channel_id = int(request.match_info["channel_id"])
+        guild = self.channels.get(channel_id)
+        if guild is None:
+            return self._not_found(10003, "Unknown Channel")
+        channel = next(channel for channel in guild.channels if int(channel["id"]) == channel_id)
+        return self._json(dict(channel, guild_id=str(guild.id)))
+
+    async def post_message(self, request):
+        """Accept a log message, matching any event tokens in it to record latency"""
+        received = time.perf_counter()
+        channel_id = request.match_info["channel_id"]
+        if int(channel_id) not in self.channels:
+            return self._not_found(10003, "Unknown Channel")
+
+        # Messages with attachments arrive as multipart with the JSON in payload_json
+        if request.content_type.startswith("multipart/"):
+            text = (await request.post()).get("payload_json", "{}")
+        else:
+            text = await request.text()
+        data = json.loads(text or "{}")
+
+        for sequence in TOKEN.findall(text):
+            sent = self._pending.pop(int(sequence), None)
+            if sent is not None:
+                self._latencies.append(received - sent)
+        self.messages_received += 1
+        self.embeds_received += len(data.get("embeds") or [])
+        if self._first_log is None:
+            self._first_log = received
+        self._last_log = received
+
+        return self._json({
+            "id": str(self.snowflakes.next()), "channel_id": channel_id, "author": self.bot_user,
+            "content": data.get("content") or "", "embeds": data.get("embeds") or [], "timestamp": iso(int(time.time() * 1000)),
+            "edited_timestamp": None, "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+            "attachments": [], "pinned": False, "type": 0, "components": data.get("components") or []
+        })
+
+    async def fallback(self, request):
+        return self._not_found(0, f"404: {request.method} {request.path} is not simulated")
+
+    def make_app(self):
+        app = web.Application(middlewares=[self._rate_limit], client_max_size=8 * 1024 * 1024)
+        app.router.add_get("/gateway", self.gateway)
+        app.router.add_get(API_PREFIX + "/gateway", self.get_gateway)
+        app.router.add_get(API_PREFIX + "/gateway/bot", self.get_gateway)
+        app.router.add_get(API_PREFIX + "/users/@me", self.get_current_user)
+        app.router.add_get(API_PREFIX + "/users/{user_id}", self.get_user)
+        app.router.add_get(API_PREFIX + "/oauth2/applications/@me", self.get_application)
+        app.router.add_get(API_PREFIX + "/applications/{application_id}/commands", self.get_commands)
+        app.router.add_put(API_PREFIX + "/applications/{application_id}/commands", self.put_commands)
+        app.router.add_get(API_PREFIX + "/applications/{application_id}/guilds/{guild_id}/commands", self.get_commands)
+        app.router.add_put(API_PREFIX + "/applications/{application_id}/guilds/{guild_id}/commands", self.put_commands)
+        app.router.add_get(API_PREFIX + "/guilds/{guild_id}", self.get_guild)
+        app.router.add_get(API_PREFIX + "/guilds/{guild_id}/members/{user_id}", self.get_member)
+        app.router.add_get(API_PREFIX + "/guilds/{guild_id}/audit-logs", self.get_audit_logs)
+        app.router.add_get(API_PREFIX + "/channels/{channel_id}", self.get_channel)
+        app.router.add_post(API_PREFIX + "/channels/{channel_id}/messages", self.post_message)
+        app.router.add_get("/_fake/report", lambda request: self._json(self.report()))
+        app.router.add_route("*", "/{path:.*}", self.fallback)
+        return app
+
+    # Lifecycle
+
+    @property
+    def api_base(self):
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    @property
+    def gateway_url(self):
+        return f"ws://{self.host}:{self.port}/gateway"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.started = time.perf_counter()
+
+    async def stop(self):
+        for session in list(self.sessions):
+            await session.ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def wait_for_bot(self):
+        """Wait until a bot has identified on the gateway"""
+        await self._ready.wait()
+
+    def install(self):
+        """Point discord.py in this process at the fake, for bots started alongside it"""
+        from discord_endpoints import use_discord_endpoints
+        use_discord_endpoints(self.api_base, self.gateway_url)
+
+    def report(self):
+        """Summarize events sent, logs received and the latency between them"""
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        latencies = sorted(self._latencies)
+        log_span = (self._last_log - self._first_log) if self._first_log is not None else 0
+        matched = len(latencies)
+
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "events": dict(self.events, total=sum(self.events.values())),
+            "logs": {
+                "messages": self.messages_received,
+                "embeds": self.embeds_received,
+                "messages_per_s": round(self.messages_received / log_span, 2) if log_span else None
+            },
+            "latency_ms": {
+                "matched": matched,
+                "unmatched": len(self._pending),
+                **{name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+                   for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+                "max": round(latencies[-1] * 1000, 2) if latencies else None,
+                "mean": round(sum(latencies) / matched * 1000, 2) if latencies else None
+            },
+            "rest": {"requests": dict(self.requests), "rate_limited": self.rate_limited},
+            "gateway": {"identifies": self.identifies, "sessions": len(self.sessions)}
+        }
+
+def parse_mix(text):
+    """Parse "type:weight" pairs into a dict"""
+    mix = {}
+    for pair in text.split(','):
+        if pair.strip():
+            kind, weight = pair.split(':')
+            if kind.strip() not in EVENT_TYPES:
+                raise argparse.ArgumentTypeError(f"Unknown event type: {kind}")
+            mix[kind.strip()] = float(weight)
+    return mix
+
+async def run(args):
+    fake = FakeDiscord(
+        guilds=args.guilds, members=args.members, channels=args.channels, audit_entries=args.audit_entries,
+        guild_id=args.guild_id, log_channel_id=args.log_channel_id, route_limit=args.route_limit,
+        route_window=args.route_window, global_limit=args.global_limit, error_rate=args.error_rate,
+        retry_after=args.retry_after, seed=args.seed, host=args.host, port=args.port
+    )
+    await fake.start()
+
+    log_channel = next(iter(fake.guilds.values())).channels[0]["id"]
+    print(f"Fake Discord listening on {fake.host}:{fake.port}; start the bots with:", file=sys.stderr)
+    print(f"  DISCORD_API_BASE={fake.api_base}", file=sys.stderr)
+    print(f"  DISCORD_GATEWAY_URL={fake.gateway_url}", file=sys.stderr)
+    print(f"  TARGET_CHANNEL_ID={log_channel}", file=sys.stderr)
+
+    try:
+        await fake.wait_for_bot()
+        print(f"A bot identified; sending events in {args.warmup}s", file=sys.stderr)
+        await asyncio.sleep(args.warmup)
+        fake.started = time.perf_counter()
+
+        if args.replay:
+            events = fake.recorded_events(args.replay)
+        else:
+            events = fake.synthetic_events(args.rate, args.mix, count=args.count, duration=args.duration)
+        await fake.replay(events, speed=args.speed, record=args.record)
+
+        # Give the bots time to log what is still queued
+        print(f"Events sent; waiting {args.drain}s for the bots to catch up", file=sys.stderr)
+        await asyncio.sleep(args.drain)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        report = fake.report()
+        await fake.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an offline Discord stand-in and replay events to connected bots")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--members", type=int, default=500, help="Members per guild")
+    parser.add_argument("--channels", type=int, default=3, help="Text channels per guild")
+    parser.add_argument("--audit-entries", type=int, default=100, help="Older audit log entries per guild")
+    parser.add_argument("--guild-id", type=int, help="ID for the first guild (to match a bot's hard-coded guild)")
+    parser.add_argument("--log-channel-id", type=int, help="ID for the first guild's first channel")
+    parser.add_argument("--rate", type=float, default=50, help="Synthetic events per second")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"Event type weights (default {DEFAULT_MIX})")
+    parser.add_argument("--count", type=int, help="Stop after this many synthetic events")
+    parser.add_argument("--duration", type=float, help="Stop sending synthetic events after this many seconds")
+    parser.add_argument("--replay", help="Replay events from a JSON Lines file instead of generating them")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier")
+    parser.add_argument("--record", help="Write the events sent to a JSON Lines file for replaying later")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds to wait after a bot identifies")
+    parser.add_argument("--drain", type=float, default=10, help="Seconds to wait for logs after the last event")
+    parser.add_argument("--route-limit", type=int, default=5, help="Requests per route bucket per window")
+    parser.add_argument("--route-window", type=float, default=5.0, help="Route bucket window in seconds")
+    parser.add_argument("--global-limit", type=int, default=50, help="Requests per second across all routes (0 disables)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance of an unpredictable 429 on any request")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After for injected 429s")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.replay is None and args.count is None and args.duration is None:
+        print("Sending events until interrupted (Ctrl+C prints the report)", file=sys.stderr)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,40 @@
 import discord
 import asyncio
 import logging
+import time
 from discord.ext import commands, tasks
-from config import TOKEN, TARGET_CHANNEL_ID
+from config import TOKEN, TARGET_CHANNEL_ID, POLL_INTERVAL_MINUTES, POLL_CONCURRENCY, DISCORD_API_BASE, DISCORD_GATEWAY_URL, METRICS_HOST, METRICS_PORT
 from cache import user_cache
+from discord_endpoints import use_discord_endpoints
+from pagination import PageButton
+from metrics import discord_http_trace, start_server, poll_cycle_seconds, polled_guilds, poll_backlog, command_seconds
 
 def setup_bot():
     """Set up and configure the bot"""
+    use_discord_endpoints(DISCORD_API_BASE, DISCORD_GATEWAY_URL)
+    
     intents = discord.Intents.default()
     intents.members = True
     intents.message_content = True
     
-    bot = commands.Bot(command_prefix="!", intents=intents)
+    # Every REST call is traced for the per-route request and 429 metrics
+    bot = commands.Bot(command_prefix="!", intents=intents, http_trace=discord_http_trace())
+    
+    # Time slash commands from the moment they reach the command tree
+    async def start_command_timer(interaction):
+        interaction.extras["started"] = time.perf_counter()
+        return True
+    
+    bot.tree.interaction_check = start_command_timer
     
     # Register events
     @bot.event
     async def on_ready():
         logging.info(f'{bot.user.name} has connected to Discord!')
         
+        # Serve metrics locally (only the first time the bot is ready)
+        await start_server(METRICS_HOST, METRICS_PORT)
+        
         # Set bot status
         await bot.change_presence(activity=discord.Activity(
             type=discord.ActivityType.watching,
@@ -31,10 +48,20 @@ def setup_bot():
         except Exception as e:
             logging.error(f"Failed to sync commands: {e}")
             
+        # Register the stateless pagination buttons
+        bot.add_dynamic_items(PageButton)
+        
         # Start the background task for polling guilds
         poll_guilds.start()
         logging.info("Started guild polling background task")
     
+    @bot.event
+    async def on_app_command_completion(interaction, command):
+        """Record how long a slash command took"""
+        started = interaction.extras.get("started")
+        if started is not None:
+            command_seconds.observe(time.perf_counter() - started, command=command.qualified_name)
+    
     @bot.event
     async def on_guild_join(guild):
         """Log when the bot joins a new guild"""
@@ -54,31 +81,92 @@ def setup_bot():
         target_channel = bot.get_channel(TARGET_CHANNEL_ID)
         if target_channel:
             await target_channel.send(f"🔔 Bot has been removed from server: **{guild.name}** (ID: {guild.id})")
-    @tasks.loop(minutes=5)
+    
+    # Summary of the most recent polling cycle
+    bot.poll_status = {
+        "last_cycle_seconds": None,
+        "guilds_polled": 0,
+        "guilds_skipped": 0,
+        "guilds_failed": 0,
+        "backlog": 0
+    }
+    
+    async def poll_guild(guild):
+        """Poll one guild for new moderation actions, returning False if it was idle"""
+        from commands import fetch_historical_moderation_actions
+        
+        # Guilds we can't read are skipped without spending a request
+        if not guild.me or not guild.me.guild_permissions.view_audit_log:
+            return False
+        
+        # Fetch new moderation actions in silent mode; a guild with no audit
+        # activity since its cursor costs a single empty request
+        entries_seen = await fetch_historical_moderation_actions(bot, guild, silent=True)
+        return bool(entries_seen)
+    
+    async def poll_worker(queue, results):
+        """Take guilds off the queue until it is empty"""
+        while True:
+            try:
+                guild = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            
+            try:
+                logging.debug(f"Checking guild: {guild.name} ({guild.id})")
+                if await poll_guild(guild):
+                    results["guilds_polled"] += 1
+                else:
+                    results["guilds_skipped"] += 1
+            except Exception as e:
+                logging.error(f"Error processing guild {guild.name}: {str(e)}")
+                results["guilds_failed"] += 1
+            finally:
+                queue.task_done()
+    
+    @tasks.loop(minutes=POLL_INTERVAL_MINUTES)
     async def poll_guilds():
-        """Poll all guilds for new moderation actions every 5 minutes"""
+        """Poll all guilds for new moderation actions, several at a time"""
         try:
             logging.info("Polling guilds for new moderation actions...")
             
-            # Process each guild the bot is in
+            from data import get_duplicate_count
+            duplicates_before = get_duplicate_count()
+            started = time.monotonic()
+            
+            # Queue every guild and let a bounded number of workers drain it;
+            # the shared audit log bucket in ratelimit.py keeps them under Discord's limits
+            queue = asyncio.Queue()
             for guild in bot.guilds:
-                try:
-                    logging.info(f"Checking guild: {guild.name} ({guild.id})")
-                    
-                    # Import this from your commands.py
-                    from commands import fetch_historical_moderation_actions
-                    
-                    # Fetch new moderation actions in silent mode
-                    await fetch_historical_moderation_actions(bot, guild, silent=True)
-                    
-                    # Add a small delay between guilds to avoid rate limiting
-                    await asyncio.sleep(2)
-                    
-                except Exception as e:
-                    logging.error(f"Error processing guild {guild.name}: {str(e)}")
-                    continue
-                    
-            logging.info("Finished polling guilds")
+                queue.put_nowait(guild)
+            results = {"guilds_polled": 0, "guilds_skipped": 0, "guilds_failed": 0}
+            workers = [
+                asyncio.create_task(poll_worker(queue, results))
+                for _ in range(min(POLL_CONCURRENCY, max(1, queue.qsize())))
+            ]
+            
+            # Report the backlog if the cycle overruns the polling interval
+            _, pending = await asyncio.wait(workers, timeout=POLL_INTERVAL_MINUTES * 60)
+            backlog = queue.qsize() + len(pending) if pending else 0
+            if pending:
+                logging.warning(f"Polling cycle overran the {POLL_INTERVAL_MINUTES} minute interval with {backlog} guilds still pending")
+                await asyncio.gather(*pending)
+            
+            # Keep a warm copy of the user cache on disk for restarts
+            user_cache.save()
+            
+            duration = time.monotonic() - started
+            bot.poll_status.update(results, last_cycle_seconds=duration, backlog=backlog)
+            poll_cycle_seconds.observe(duration)
+            poll_backlog.set(backlog)
+            polled_guilds.inc(results["guilds_polled"], result="polled")
+            polled_guilds.inc(results["guilds_skipped"], result="idle")
+            polled_guilds.inc(results["guilds_failed"], result="failed")
+            logging.info(
+                f"Finished polling {len(bot.guilds)} guilds in {duration:.1f}s "
+                f"({results['guilds_polled']} polled, {results['guilds_skipped']} idle, {results['guilds_failed']} failed, "
+                f"{get_duplicate_count() - duplicates_before} re-polled entries skipped)"
+            )
             
         except Exception as e:
             logging.error(f"Error in poll_guilds task: {str(e)}")
@@ -88,6 +176,8 @@ def setup_bot():
         """Wait until the bot is ready before starting the polling task"""
         await bot.wait_until_ready()
     
+    bot.poll_guilds = poll_guilds
+    
     return bot
 
 def run_bot(bot):
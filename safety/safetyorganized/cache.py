@@ -1,2 +1,130 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, USER_CACHE_NEGATIVE_TTL, USER_CACHE_FILE
+from metrics import registry, save_seconds
+
+# Default for lookups that need to tell "not cached" apart from "cached as not found"
+NOT_CACHED = object()
+
+class CachedUser:
+    """The parts of a Discord user the bot renders"""
+    __slots__ = ("id", "name", "avatar_url", "bot")
+
+    def __init__(self, id, name, avatar_url=None, bot=False):
+        self.id = id
+        self.name = name
+        self.avatar_url = avatar_url
+        self.bot = bot
+
+    @classmethod
+    def from_user(cls, user):
+        """Copy the rendered fields from a discord.User or Member"""
+        avatar = getattr(user, 'display_avatar', None) or getattr(user, 'avatar', None)
+        return cls(user.id, user.name, avatar.url if avatar else None, bool(getattr(user, 'bot', False)))
+
+class UserCache:
+    """Size-capped LRU cache of users with expiry and negative entries"""
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, negative_ttl=USER_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # user ID -> (expiry time, CachedUser or None for a failed fetch)
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        """Check for a fresh entry (found or not found) without counting a lookup"""
+        entry = self._entries.get(str(user_id))
+        return entry is not None and entry[0] > time.time()
+
+    def _store(self, user_id, value, ttl):
+        """Insert an entry and evict the least recently used ones over the cap"""
+        self._entries[user_id] = (time.time() + ttl, value)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, user_id, default=None):
+        """Get a cached user (None if it couldn't be fetched), or default if it isn't cached"""
+        user_id = str(user_id)
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user):
+        """Cache a discord.User (or CachedUser) and return the cached copy"""
+        if not isinstance(user, CachedUser):
+            user = CachedUser.from_user(user)
+        self._store(str(user.id), user, self.ttl)
+        return user
+
+    def put_missing(self, user_id):
+        """Remember that a user couldn't be fetched"""
+        self._store(str(user_id), None, self.negative_ttl)
+
+    def stats(self):
+        """Get hit, miss and eviction counters"""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+    def save(self, path=USER_CACHE_FILE):
+        """Save fresh users to disk so a restart starts warm"""
+        now = time.time()
+        entries = [
+            [user.id, user.name, user.avatar_url, user.bot, expires]
+            for expires, user in self._entries.values()
+            if user is not None and expires > now
+        ]
+        try:
+            with save_seconds.time(store="user_cache"):
+                temp_file = path + '.tmp'
+                with open(temp_file, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(temp_file, path)
+        except Exception as e:
+            logging.error(f"Error saving user cache: {e}")
+
+    def load(self, path=USER_CACHE_FILE):
+        """Load users saved by a previous run, skipping expired ones"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+            now = time.time()
+            for user_id, name, avatar_url, bot, expires in entries:
+                if expires > now:
+                    self._store(str(user_id), CachedUser(user_id, name, avatar_url, bot), expires - now)
+            logging.info(f"Loaded {len(self._entries)} cached users")
+        except Exception as e:
+            logging.error(f"Error loading user cache: {e}")
+
 # Global cache for user objects
-user_cache = {}
+user_cache = UserCache()
+
+# Cache effectiveness, read from the counters above when metrics are collected
+registry.callback("user_cache_lookups_total", "User cache lookups by result", lambda: {"hit": user_cache.hits, "miss": user_cache.misses}, type="counter", labels=["result"])
+registry.callback("user_cache_evictions_total", "Users evicted from the cache to stay under its size cap", lambda: user_cache.evictions, type="counter")
+registry.callback("user_cache_size", "Users currently cached", lambda: len(user_cache))
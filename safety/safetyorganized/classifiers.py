@@ -0,0 +1,28 @@
+import discord
+
+# Audit log action -> list of (action name, predicate) pairs, checked in order
+AUDIT_CLASSIFIERS = {}
+
+def register_classifier(audit_action, action_name, predicate=None):
+    """Map an audit log action to a moderation action, optionally only when predicate(entry) is true"""
+    AUDIT_CLASSIFIERS.setdefault(audit_action, []).append((action_name, predicate))
+
+def classify_entry(entry):
+    """Get the moderation action name for an audit log entry, or None if it isn't one"""
+    for action_name, predicate in AUDIT_CLASSIFIERS.get(entry.action, ()):
+        if predicate is None or predicate(entry):
+            return action_name
+    return None
+
+def is_timeout(entry):
+    """Check whether a member update entry applied a timeout"""
+    after = getattr(entry, 'after', None)
+    return bool(
+        getattr(after, 'timed_out_until', None)
+        or getattr(after, 'communication_disabled_until', None)
+    )
+
+# Built-in moderation actions
+register_classifier(discord.AuditLogAction.ban, "ban")
+register_classifier(discord.AuditLogAction.kick, "kick")
+register_classifier(discord.AuditLogAction.member_update, "timeout", is_timeout)
@@ -1,18 +1,57 @@
 import discord
 import logging
-import asyncio
-import os
-from datetime import datetime
+import io
 from discord import app_commands
 from config import TARGET_CHANNEL_ID, TARGET_GUILD_ID
-from utils import format_timestamp, get_user_from_cache, fetch_user_safe, prefetch_users, send_leaderboard_page
+from ratelimit import audit_log_bucket
+from cursors import get_guild_cursor, set_guild_cursor, save_cursors
+from classifiers import AUDIT_CLASSIFIERS, classify_entry
+from dispatch import notification_dispatcher
+from utils import format_timestamp, format_reputation, format_sparkline, fetch_user_safe, send_leaderboard_page
+from analytics import server_stats, user_action_counts, daily_actions
+from pagination import register_renderer, send_paginated
+from cache import user_cache
+from metrics import registry, audit_entries_fetched, audit_entries_duplicate, audit_entries_new
 from data import (
-    moderation_history, get_user_history, get_leaderboard, 
-    add_moderation_action, save_moderation_history, calculate_server_stats
+    find_user_history, get_user_history, get_leaderboard, 
+    add_moderation_action
 )
 
+# Entries read per moderation audit log action when a guild has no cursor yet
+INITIAL_ENTRIES_PER_ACTION = 50
+
+# Entries per audit log request (Discord's maximum)
+AUDIT_PAGE_SIZE = 100
+
+async def paged_audit_entries(guild, after=None):
+    """Yield the entries after an entry ID oldest first, or the whole audit log newest first, one token per request"""
+    before = None
+    while True:
+        await audit_log_bucket.acquire()
+        if after:
+            page = [entry async for entry in guild.audit_logs(limit=AUDIT_PAGE_SIZE, after=discord.Object(id=after))]
+        else:
+            page = [entry async for entry in guild.audit_logs(limit=AUDIT_PAGE_SIZE, before=before)]
+        for entry in page:
+            yield entry
+        if len(page) < AUDIT_PAGE_SIZE:
+            return
+        
+        # Continue from the last entry of this page
+        if after:
+            after = page[-1].id
+        else:
+            before = page[-1]
+
+async def initial_audit_entries(guild):
+    """Yield the newest entries of each audit log action that can be a moderation action, one token per request"""
+    for audit_action in AUDIT_CLASSIFIERS:
+        await audit_log_bucket.acquire()
+        async for entry in guild.audit_logs(limit=INITIAL_ENTRIES_PER_ACTION, action=audit_action):
+            yield entry
+
 # Module-level function for fetching historical moderation actions
-async def fetch_historical_moderation_actions(bot, guild, silent=False):
+async def fetch_historical_moderation_actions(bot, guild, silent=False, backfill=False):
     """
     Fetch historical moderation actions from a server's audit logs
     
@@ -20,6 +59,9 @@ async def fetch_historical_moderation_actions(bot, guild, silent=False):
     - bot: The Discord bot instance
     - guild: The guild to fetch actions from
     - silent: If True, only send messages for actual new actions, not status updates
+    - backfill: If True, page through the entire audit log instead of only entries after the cursor
+    
+    Returns the number of audit log entries read.
     """
     try:
         # Get target channel
@@ -28,8 +70,10 @@ async def fetch_historical_moderation_actions(bot, guild, silent=False):
             logging.error(f"Target channel {TARGET_CHANNEL_ID} not found")
             return
         
-        # Initialize action count
+        # Initialize entry, action and duplicate counts
+        entries_seen = 0
         action_count = 0
+        duplicate_count = 0
         
         # Check if bot has permission to view audit logs
         bot_member = guild.get_member(bot.user.id)
@@ -46,176 +90,181 @@ async def fetch_historical_moderation_actions(bot, guild, silent=False):
             
         if not silent:
             await target_channel.send(f"✅ Bot has 'View Audit Log' permission in **{guild.name}**")
-            return
-            
-        permissions = bot_member.guild_permissions
-        if not permissions.view_audit_log:
+        # Pull the unfiltered audit log once and classify entries locally
+        try:
             if not silent:
-                await target_channel.send(f"⚠️ Missing 'View Audit Log' permission in **{guild.name}**")
-            return
-            
-        if not silent:
-            await target_channel.send(f"✅ Bot has 'View Audit Log' permission in **{guild.name}**")
-        # Process each action type separately
-        for action_type, action_name in [
-            (discord.AuditLogAction.ban, "ban"),
-            (discord.AuditLogAction.kick, "kick"),
-            (discord.AuditLogAction.member_update, "timeout")  # For timeouts
-        ]:
-            try:
-                if not silent:
-                    await target_channel.send(f"Checking for {action_name}s in **{guild.name}**...")
-                
-                # Collect all valid entries first
-                valid_entries = []
+                await target_channel.send(f"Checking the audit log in **{guild.name}**...")
+            
+            # Collect all moderation entries first
+            valid_entries = []
+            
+            # Only request entries newer than the cursor; without one, start
+            # from the newest entries of each moderation action (or the whole
+            # log when backfilling)
+            cursor = None if backfill else get_guild_cursor(guild.id)
+            started_snowflake = discord.utils.time_snowflake(discord.utils.utcnow())
+            if cursor or backfill:
+                audit_log_pages = paged_audit_entries(guild, cursor)
+            else:
+                audit_log_pages = initial_audit_entries(guild)
+            
+            # Read the audit log; both sources take a token before each request
+            newest_entry_id = 0
+            first_failed_id = None
+            debug_logging = logging.getLogger().isEnabledFor(logging.DEBUG)
+            async for entry in audit_log_pages:
+                entries_seen += 1
+                newest_entry_id = max(newest_entry_id, entry.id)
                 
-                # Get audit logs for this action type
-                async for entry in guild.audit_logs(action=action_type, limit=50):
-                    try:
-                        # Debug info about the entry
-                        entry_info = f"Entry ID: {entry.id}, Action: {entry.action}, User: {entry.user}, Target: {entry.target}"
-                        logging.info(f"Processing entry in {guild.name}: {entry_info}")
-                        
-                        # For timeouts, check if it's actually a timeout
-                        if action_type == discord.AuditLogAction.member_update:
-                            # Skip if not a timeout
-                            is_timeout = False
-                            
-                            # Check for timed_out_until attribute
-                            if hasattr(entry, 'after') and hasattr(entry.after, 'timed_out_until'):
-                                if entry.after.timed_out_until:
-                                    is_timeout = True
-                                    logging.info(f"Found timeout with timed_out_until: {entry.after.timed_out_until}")
-                            
-                            # Check for communication_disabled_until attribute
-                            if hasattr(entry, 'after') and hasattr(entry.after, 'communication_disabled_until'):
-                                if entry.after.communication_disabled_until:
-                                    is_timeout = True
-                                    logging.info(f"Found timeout with communication_disabled_until: {entry.after.communication_disabled_until}")
-                            
-                            if not is_timeout:
-                                logging.info(f"Skipping non-timeout member update: {entry_info}")
-                                continue
-                        # Get target user
-                        target_user = entry.target
-                        if not target_user:
-                            logging.warning(f"No target user for entry: {entry_info}")
-                            continue
-                        
-                        # Add to valid entries
-                        valid_entries.append(entry)
-                        
-                    except Exception as e:
-                        error_msg = f"Error processing individual audit log entry in {guild.name}: {str(e)}"
-                        logging.warning(error_msg)
-                        if not silent:
-                            await target_channel.send(f"⚠️ {error_msg}")
+                try:
+                    # Skip entries that aren't moderation actions
+                    action_name = classify_entry(entry)
+                    if action_name is None:
                         continue
-                
-                # Sort entries by timestamp (oldest first)
-                valid_entries.sort(key=lambda e: e.created_at)
-                
-                # Process entries in order (oldest to newest)
-                for entry in valid_entries:
-                    try:
-                        target_user = entry.target
-                        reason = entry.reason or "No reason provided"
-                        moderator = entry.user
-                        timestamp = entry.created_at
-                        
-                        # Generate a unique action ID
-                        action_id = f"{guild.id}:{action_name}:{target_user.id}:{entry.id}:{timestamp.isoformat()}"
-                        
-                        # Create and send an embed for this historical action
-                        embed = discord.Embed(
-                            title=f"{action_name.title()}",
-                            description=f"{target_user.name} ({target_user.id}) was {action_name}ed in {guild.name}",
-                            color=discord.Color.dark_red(),
-                            timestamp=timestamp
-                        )
-                        # Add user avatar if available
-                        if hasattr(target_user, 'avatar') and target_user.avatar:
-                            embed.set_thumbnail(url=target_user.avatar.url)
-                        
-                        # Add user ID field
+                    
+                    # Details for every entry are only worth formatting at debug level
+                    if debug_logging:
+                        logging.debug(f"Processing {action_name} entry in {guild.name}: Entry ID: {entry.id}, Action: {entry.action}, User: {entry.user}, Target: {entry.target}")
+                    
+                    # Get target user
+                    target_user = entry.target
+                    if not target_user:
+                        logging.warning(f"No target user for {action_name} entry {entry.id} in {guild.name}")
+                        continue
+                    
+                    # Add to valid entries
+                    valid_entries.append((entry, action_name))
+                    
+                except Exception as e:
+                    first_failed_id = min(first_failed_id or entry.id, entry.id)
+                    error_msg = f"Error processing individual audit log entry in {guild.name}: {str(e)}"
+                    logging.warning(error_msg)
+                    if not silent:
+                        await target_channel.send(f"⚠️ {error_msg}")
+                    continue
+            
+            # Sort entries by timestamp (oldest first)
+            valid_entries.sort(key=lambda item: item[0].created_at)
+            
+            # Process entries in order (oldest to newest)
+            for entry, action_name in valid_entries:
+                try:
+                    target_user = entry.target
+                    reason = entry.reason or "No reason provided"
+                    moderator = entry.user
+                    timestamp = entry.created_at
+                    
+                    # Audit log entry IDs are unique snowflakes, so they identify the action
+                    action_id = entry.id
+                    
+                    # Create and send an embed for this historical action
+                    embed = discord.Embed(
+                        title=f"{action_name.title()}",
+                        description=f"{target_user.name} ({target_user.id}) was {action_name}ed in {guild.name}",
+                        color=discord.Color.dark_red(),
+                        timestamp=timestamp
+                    )
+                    # Add user avatar if available
+                    if hasattr(target_user, 'avatar') and target_user.avatar:
+                        embed.set_thumbnail(url=target_user.avatar.url)
+                    
+                    # Add user ID field
+                    embed.add_field(
+                        name="User ID",
+                        value=f"`{target_user.id}`",
+                        inline=True
+                    )
+                    
+                    # Add reason if provided
+                    if reason:
                         embed.add_field(
-                            name="User ID",
-                            value=f"`{target_user.id}`",
-                            inline=True
+                            name="Reason",
+                            value=reason,
+                            inline=False
                         )
-                        
-                        # Add reason if provided
-                        if reason:
-                            embed.add_field(
-                                name="Reason",
-                                value=reason,
-                                inline=False
-                            )
-                        
-                        # Add moderator if provided
-                        if moderator:
-                            embed.add_field(
-                                name="Moderator",
-                                value=f"{moderator.name} ({moderator.id})",
-                                inline=True
-                            )
-                        
-                        # Add timestamp field for clarity (with UTC specified)
+                    
+                    # Add moderator if provided
+                    if moderator:
                         embed.add_field(
-                            name="When (UTC)",
-                            value=format_timestamp(timestamp),
+                            name="Moderator",
+                            value=f"{moderator.name} ({moderator.id})",
                             inline=True
                         )
-                        
-                        # Add footer with UTC mention
-                        embed.set_footer(text="All timestamps are in UTC")
-                        
-                        # Add action to history
-                        result = add_moderation_action(
-                            user_id=target_user.id,
-                            action_type=action_name,
-                            guild_id=guild.id,
-                            reason=reason,
-                            moderator=moderator,
-                            timestamp=timestamp.isoformat(),
-                            action_id=action_id
-                        )
-                        
-                        # Check if action was added or was a duplicate
-                        if result.get("duplicate"):
-                            logging.info(f"Skipping duplicate action: {action_id}")
-                            continue
-                        
-                        # Send embed only if not in silent mode or if it's a new action
-                        if not silent:
-                            await target_channel.send(embed=embed)
-                        else:
-                            # In silent mode, only send the actual action data without status messages
-                            await target_channel.send(embed=embed)
-                        
-                        # Increment action count
-                        action_count += 1
-                        
-                        # Add a small delay to avoid rate limiting
-                        await asyncio.sleep(0.5)
-                        
-                    except Exception as e:
-                        error_msg = f"Error processing audit log entry in {guild.name}: {str(e)}"
-                        logging.warning(error_msg)
-                        if not silent:
-                            await target_channel.send(f"⚠️ {error_msg}")
+                    
+                    # Add timestamp field for clarity (with UTC specified)
+                    embed.add_field(
+                        name="When (UTC)",
+                        value=format_timestamp(timestamp),
+                        inline=True
+                    )
+                    
+                    # Add footer with UTC mention
+                    embed.set_footer(text="All timestamps are in UTC")
+                    
+                    # Add action to history
+                    result = add_moderation_action(
+                        user_id=target_user.id,
+                        action_type=action_name,
+                        guild_id=guild.id,
+                        reason=reason,
+                        moderator=moderator,
+                        timestamp=timestamp,
+                        action_id=action_id
+                    )
+                    
+                    # Check if action was added or was a duplicate
+                    if result.get("duplicate"):
+                        duplicate_count += 1
                         continue
-            except Exception as e:
-                error_msg = f"Error processing {action_name}s in {guild.name}: {str(e)}"
-                logging.error(error_msg)
-                if not silent:
-                    await target_channel.send(f"⚠️ {error_msg}")
-                continue
+                    
+                    # Queue the embed; the dispatcher packs bursts into batched messages
+                    notification_dispatcher.enqueue(target_channel, embed)
+                    
+                    # Increment action count
+                    action_count += 1
+                    
+                except Exception as e:
+                    first_failed_id = min(first_failed_id or entry.id, entry.id)
+                    error_msg = f"Error processing audit log entry in {guild.name}: {str(e)}"
+                    logging.warning(error_msg)
+                    if not silent:
+                        await target_channel.send(f"⚠️ {error_msg}")
+                    continue
+            
+            # Advance the cursor past everything this pass has seen, but stop
+            # short of an entry that failed so the next poll reads it again
+            if first_failed_id is not None:
+                newest_entry_id = min(newest_entry_id, first_failed_id - 1)
+            elif not newest_entry_id:
+                # Nothing to read yet; start the next poll from this pass rather than from scratch
+                newest_entry_id = started_snowflake
+            if newest_entry_id:
+                set_guild_cursor(guild.id, newest_entry_id)
+        except Exception as e:
+            error_msg = f"Error reading the audit log in {guild.name}: {str(e)}"
+            logging.error(error_msg)
+            if not silent:
+                await target_channel.send(f"⚠️ {error_msg}")
+        
+        # Remember where this guild's audit log was read up to
+        save_cursors()
+        
+        audit_entries_fetched.inc(entries_seen)
+        audit_entries_duplicate.inc(duplicate_count)
+        audit_entries_new.inc(action_count)
+        
+        # Make sure the notifications are out before the summary
+        await notification_dispatcher.flush(target_channel)
+        
+        if duplicate_count:
+            logging.info(f"Skipped {duplicate_count} already imported audit log entries in {guild.name}")
         
         # Send summary only if actions were found or not in silent mode
         if not silent and action_count > 0:
             await target_channel.send(f"✅ Imported {action_count} historical moderation actions from **{guild.name}**")
         
+        return entries_seen
+        
     except Exception as e:
         error_msg = f"Error fetching historical moderation actions for {guild.name}: {str(e)}"
         logging.error(error_msg)
@@ -230,6 +279,88 @@ async def fetch_historical_moderation_actions(bot, guild, silent=False):
             target_channel = bot.get_channel(TARGET_CHANNEL_ID)
             if target_channel:
                 await target_channel.send(f"⚠️ {error_msg}")
+
+def add_activity_field(embed, counts):
+    """Add a per-day activity chart to a stats embed"""
+    if not any(counts):
+        return
+    embed.add_field(
+        name=f"Activity (Last {len(counts)} Days)",
+        value=f"`{format_sparkline(counts)}`\n{sum(counts)} actions, busiest day {max(counts)}",
+        inline=False
+    )
+
+async def render_history_page(bot, key, page):
+    """Render a page of a user's history; key is the user ID"""
+    user_data = find_user_history(key) or {"reputation": 0, "actions": []}
+    user = await fetch_user_safe(bot, int(key))
+    user_name = user.name if user else f"Unknown User ({key})"
+    
+    # Sort actions by timestamp (newest first)
+    actions = sorted(
+        user_data["actions"], 
+        key=lambda x: x.timestamp or 0,
+        reverse=True  # Newest first
+    )
+    
+    # Calculate pagination
+    items_per_page = 5  # Number of actions per page
+    total_pages = max(1, (len(actions) + items_per_page - 1) // items_per_page)
+    page = max(0, min(page, total_pages - 1))
+    start_idx = page * items_per_page
+    end_idx = min(start_idx + items_per_page, len(actions))
+    
+    # Create embed for this page
+    embed = discord.Embed(
+        title=f"Moderation History for {user_name}",
+        description=f"Reputation Score: {format_reputation(user_data.get('reputation', 0))}",
+        color=discord.Color.red()
+    )
+    
+    # Add user avatar if available
+    if user and user.avatar_url:
+        embed.set_thumbnail(url=user.avatar_url)
+    # Add actions for this page
+    for i, action in enumerate(actions[start_idx:end_idx]):
+        action_type = action.action
+        guild_id = action.guild_id
+        timestamp = action.timestamp
+        reason = action.reason or "No reason provided"
+        
+        # Try to get guild name
+        guild_name = "Unknown Server"
+        try:
+            guild = bot.get_guild(int(guild_id))
+            if guild:
+                guild_name = guild.name
+        except:
+            pass
+        
+        # Format timestamp
+        formatted_time = format_timestamp(timestamp)
+        
+        # Format moderator info
+        moderator_info = ""
+        if action.moderator_id is not None:
+            moderator_info = f"Moderator: {action.moderator_name or 'Unknown'}"
+        elif action.moderator_name is not None:
+            moderator_info = f"Moderator: {action.moderator_name}"
+        
+        # Add action text
+        action_text = f"**Type:** {action_type.title()}\n**Server:** {guild_name}\n**Date:** {formatted_time}\n**Reason:** {reason}\n{moderator_info}"
+        
+        embed.add_field(
+            name=f"Action #{start_idx + i + 1}",
+            value=action_text,
+            inline=False
+        )
+    
+    # Add footer with page info
+    embed.set_footer(text=f"Page {page+1}/{total_pages} | Total Actions: {len(actions)}")
+    return embed, total_pages
+
+register_renderer("history", render_history_page)
+
 def register_commands(bot):
     """Register all slash commands"""
     
@@ -282,9 +413,9 @@ def register_commands(bot):
                 # Use the guild where the command was used
                 guild = interaction.guild
             
-            # Import historical actions with verbose output
+            # Import the full audit log with verbose output
             await interaction.followup.send(f"Importing historical moderation actions from **{guild.name}**...")
-            await fetch_historical_moderation_actions(bot, guild, silent=False)
+            await fetch_historical_moderation_actions(bot, guild, silent=False, backfill=True)
             
         except Exception as e:
             error_msg = f"Error in import command: {str(e)}"
@@ -305,13 +436,11 @@ def register_commands(bot):
             await interaction.response.defer(thinking=True)
             
             # Get user history
-            user_id = str(user.id)
-            if user_id not in moderation_history:
+            user_data = find_user_history(user.id)
+            if user_data is None:
                 await interaction.followup.send(f"No moderation history found for {user.name}.")
                 return
             
-            # Get user data
-            user_data = moderation_history[user_id]
             # Check if user has actions
             if "actions" not in user_data or not user_data["actions"]:
                 embed = discord.Embed(
@@ -326,7 +455,7 @@ def register_commands(bot):
                 
                 embed.add_field(
                     name="Reputation Score",
-                    value=str(user_data.get("reputation", 0)),
+                    value=format_reputation(user_data.get("reputation", 0)),
                     inline=False
                 )
                 
@@ -339,15 +468,11 @@ def register_commands(bot):
                 await interaction.followup.send(embed=embed)
                 return
             
-            # Sort actions by timestamp (newest first)
-            actions = sorted(
-                user_data["actions"], 
-                key=lambda x: x.get("timestamp", "0"),
-                reverse=True  # Newest first
-            )
+            # Remember the user so every page can show their name and avatar
+            user_cache.put(user)
             
             # Send paginated history
-            await send_history_page(bot, interaction, user, user_data, actions, page=0)
+            await send_paginated(bot, interaction, "history", str(user.id))
             
         except Exception as e:
             error_msg = f"Error in history command: {str(e)}"
@@ -374,21 +499,10 @@ def register_commands(bot):
                 await interaction.followup.send(f"{user.name} has no moderation history.")
                 return
             
-            # Count actions by type
-            action_counts = {}
-            for action in history.get("actions", []):
-                action_type = action.get("action", "unknown")
-                if action_type not in action_counts:
-                    action_counts[action_type] = 0
-                action_counts[action_type] += 1
-            
-            # Count actions by guild
-            guild_counts = {}
-            for action in history.get("actions", []):
-                guild_id = action.get("guild_id", "unknown")
-                if guild_id not in guild_counts:
-                    guild_counts[guild_id] = 0
-                guild_counts[guild_id] += 1
+            # Count actions by type and by guild
+            counts = user_action_counts(user.id)
+            action_counts = counts["by_type"]
+            guild_counts = counts["by_guild"]
             
             # Create embed
             embed = discord.Embed(
@@ -403,7 +517,7 @@ def register_commands(bot):
             # Add reputation
             embed.add_field(
                 name="Reputation Score",
-                value=str(history.get("reputation", 0)),
+                value=format_reputation(history.get("reputation", 0)),
                 inline=True
             )
             
@@ -450,7 +564,7 @@ def register_commands(bot):
             await interaction.followup.send(f"An error occurred: {str(e)}")
     
     @bot.tree.command(name="leaderboard", description="View users with the lowest reputation scores")
-    async def leaderboard_command(interaction: discord.Interaction, limit: int = 10):
+    async def leaderboard_command(interaction: discord.Interaction, limit: int = 10, server_id: str = None):
         """View users with the lowest reputation scores"""
         try:
             # Check if command is used in the target guild
@@ -467,20 +581,18 @@ def register_commands(bot):
             if capped_limit != limit:
                 await interaction.followup.send(f"Limiting results to 50 users (you requested {limit}).", ephemeral=True)
             
-            # Get leaderboard
-            leaderboard = get_leaderboard(limit=capped_limit)
+            # Validate server ID for a per-server leaderboard
+            if server_id and not server_id.isdigit():
+                await interaction.followup.send(f"Invalid server ID: {server_id}")
+                return
             
             # Check if leaderboard is empty
-            if not leaderboard:
+            if not get_leaderboard(limit=1, guild_id=server_id):
                 await interaction.followup.send("No users with moderation history found.")
                 return
             
-            # Prefetch users
-            user_ids = [user_id for user_id, _ in leaderboard]
-            await prefetch_users(bot, user_ids)
-            
-            # Send paginated leaderboard
-            await send_leaderboard_page(bot, interaction, leaderboard, page=0)
+            # Send paginated leaderboard; the page renderer resolves the users it shows
+            await send_leaderboard_page(bot, interaction, capped_limit, guild_id=server_id)
         except Exception as e:
             error_msg = f"Error in leaderboard command: {str(e)}"
             logging.error(error_msg)
@@ -521,7 +633,7 @@ def register_commands(bot):
                 guild_name = guild.name
             
             # Calculate stats
-            stats = calculate_server_stats(guild_id)
+            stats = server_stats(guild_id)
             # Create embed
             embed = discord.Embed(
                 title=f"Moderation Statistics for {guild_name}",
@@ -562,25 +674,23 @@ def register_commands(bot):
                     inline=False
                 )
             
+            # Add daily activity for the last 30 days
+            add_activity_field(embed, daily_actions(guild_id))
+            
             # Add most recent action
             if stats["recent_action"]:
                 recent = stats["recent_action"]
                 action_type = recent.get("action", "unknown")
-                timestamp = recent.get("timestamp", "unknown")
+                timestamp = recent.get("timestamp")
                 user_id = recent.get("user_id", "unknown")
                 reason = recent.get("reason", "No reason provided")
                 # Format timestamp
-                formatted_time = timestamp
-                try:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                    formatted_time = format_timestamp(dt)
-                except:
-                    pass
+                formatted_time = format_timestamp(timestamp)
                 
                 # Try to get user
                 user_name = f"User {user_id}"
                 try:
-                    user = await fetch_user_safe(bot, int(user_id))
+                    user = await fetch_user_safe(bot, int(user_id), guild)
                     if user:
                         user_name = f"{user.name} ({user_id})"
                 except:
@@ -625,7 +735,7 @@ def register_commands(bot):
             # Try to fetch user info
             user = None
             try:
-                user = await fetch_user_safe(bot, int(user_id))
+                user = await fetch_user_safe(bot, int(user_id), interaction.guild)
             except:
                 pass
             
@@ -644,13 +754,13 @@ def register_commands(bot):
             )
             
             # Add user avatar if available
-            if user and user.avatar:
-                embed.set_thumbnail(url=user.avatar.url)
+            if user and user.avatar_url:
+                embed.set_thumbnail(url=user.avatar_url)
             
             # Add reputation
             embed.add_field(
                 name="Reputation Score",
-                value=str(history.get("reputation", 0)),
+                value=format_reputation(history.get("reputation", 0)),
                 inline=True
             )
             
@@ -663,12 +773,7 @@ def register_commands(bot):
             )
             # Count actions by type
             if action_count > 0:
-                action_counts = {}
-                for action in history.get("actions", []):
-                    action_type = action.get("action", "unknown")
-                    if action_type not in action_counts:
-                        action_counts[action_type] = 0
-                    action_counts[action_type] += 1
+                action_counts = user_action_counts(user_id)["by_type"]
                 
                 action_summary = "\n".join([f"{action_type.title()}: {count}" for action_type, count in action_counts.items()])
                 embed.add_field(
@@ -713,7 +818,7 @@ def register_commands(bot):
                 pass
             
             # Calculate stats for this guild
-            stats = calculate_server_stats(guild_id)
+            stats = server_stats(guild_id)
             
             # Check if stats are empty
             if stats["total_users"] == 0:
@@ -761,6 +866,9 @@ def register_commands(bot):
                     inline=False
                 )
             
+            # Add daily activity for the last 30 days
+            add_activity_field(embed, daily_actions(guild_id))
+            
             # Send embed
             await interaction.followup.send(embed=embed)
             
@@ -769,107 +877,30 @@ def register_commands(bot):
             logging.error(error_msg)
             await interaction.followup.send(f"An error occurred: {str(e)}")
 
-    # Helper function for paginated history
-    async def send_history_page(bot, interaction, user, user_data, actions, page=0):
-        """Send a page of user history with pagination buttons"""
-        # Calculate pagination
-        items_per_page = 5  # Number of actions per page
-        total_pages = max(1, (len(actions) + items_per_page - 1) // items_per_page)
-        page = max(0, min(page, total_pages - 1))
-        start_idx = page * items_per_page
-        end_idx = min(start_idx + items_per_page, len(actions))
-        
-        # Create embed for this page
-        embed = discord.Embed(
-            title=f"Moderation History for {user.name}",
-            description=f"Reputation Score: {user_data.get('reputation', 0)}",
-            color=discord.Color.red()
-        )
-        
-        # Add user avatar if available
-        if user.avatar:
-            embed.set_thumbnail(url=user.avatar.url)
-        # Add actions for this page
-        for i, action in enumerate(actions[start_idx:end_idx]):
-            action_type = action.get("action", "unknown")
-            guild_id = action.get("guild_id", "unknown")
-            timestamp = action.get("timestamp", "unknown")
-            reason = action.get("reason", "No reason provided")
-            
-            # Try to get guild name
-            guild_name = "Unknown Server"
-            try:
-                guild = bot.get_guild(int(guild_id))
-                if guild:
-                    guild_name = guild.name
-            except:
-                pass
-            
-            # Format timestamp
-            formatted_time = timestamp
-            try:
-                dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                formatted_time = format_timestamp(dt)
-            except:
-                pass
-            
-            # Format moderator info
-            moderator_info = ""
-            if "moderator" in action:
-                mod = action["moderator"]
-                if isinstance(mod, dict):
-                    mod_name = mod.get("name", "Unknown")
-                    moderator_info = f"Moderator: {mod_name}"
-                else:
-                    moderator_info = f"Moderator: {mod}"
-            
-            # Add action text
-            action_text = f"**Type:** {action_type.title()}\n**Server:** {guild_name}\n**Date:** {formatted_time}\n**Reason:** {reason}\n{moderator_info}"
+    @bot.tree.command(name="metrics", description="View the bot's performance metrics")
+    @app_commands.default_permissions(administrator=True)
+    async def metrics_command(interaction: discord.Interaction):
+        """Show a summary of the bot's metrics, with the full Prometheus output attached"""
+        try:
+            # Check if command is used in the target guild
+            allowed, message = check_guild_permission(interaction)
+            if not allowed:
+                await interaction.response.send_message(message, ephemeral=True)
+                return
             
-            embed.add_field(
-                name=f"Action #{start_idx + i + 1}",
-                value=action_text,
-                inline=False
-            )
-        
-        # Add footer with page info
-        embed.set_footer(text=f"Page {page+1}/{total_pages} | Total Actions: {len(actions)}")
-        # Create pagination buttons
-        view = discord.ui.View(timeout=300)  # 5 minute timeout
-        
-        # Previous page button
-        prev_button = discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            label="Previous",
-            emoji="⬅️",
-            disabled=(page == 0)
-        )
-        
-        # Next page button
-        next_button = discord.ui.Button(
-            style=discord.ButtonStyle.secondary,
-            label="Next",
-            emoji="➡️",
-            disabled=(page == total_pages - 1)
-        )
-        
-        # Set button callbacks
-        async def prev_callback(interaction):
-            await interaction.response.defer()
-            await send_history_page(bot, interaction, user, user_data, actions, page=page-1)
-        
-        async def next_callback(interaction):
-            await interaction.response.defer()
-            await send_history_page(bot, interaction, user, user_data, actions, page=page+1)
-        
-        prev_button.callback = prev_callback
-        next_button.callback = next_callback
-        
-        # Add buttons to view
-        view.add_item(prev_button)
-        view.add_item(next_button)
+            # Respond immediately to prevent timeout
+            await interaction.response.defer(thinking=True, ephemeral=True)
+            
+            # Fit the summary in one message; the attachment has everything
+            summary = registry.summary() or "No metrics recorded yet"
+            if len(summary) > 1900:
+                summary = summary[:1900].rsplit("\n", 1)[0] + "\n..."
+            exposition = discord.File(io.BytesIO(registry.render().encode()), filename="metrics.txt")
+            await interaction.followup.send(f"```\n{summary}\n```", file=exposition, ephemeral=True)
         
-        # Send or edit message
-        await interaction.followup.send(embed=embed, view=view)
+        except Exception as e:
+            error_msg = f"Error in metrics command: {str(e)}"
+            logging.error(error_msg)
+            await interaction.followup.send(f"An error occurred: {str(e)}")
 
     return bot  # Return the bot with commands registered
@@ -30,6 +30,49 @@ SOURCE_CHANNEL_IDS = os.getenv('SOURCE_CHANNEL_IDS', '').split(',')
 AUTHORIZED_USERS = os.getenv('AUTHORIZED_USERS', '').split(',')
 AUTHORIZED_ROLES = os.getenv('AUTHORIZED_ROLES', '').split(',')
 HISTORY_FILE = os.getenv('HISTORY_FILE', 'moderation_history.json')
+
+# Write-ahead log settings for the moderation history store
+HISTORY_WAL_FILE = os.getenv('HISTORY_WAL_FILE', HISTORY_FILE + '.wal')
+HISTORY_COMPACT_THRESHOLD = int(os.getenv('HISTORY_COMPACT_THRESHOLD', 1000))
+HISTORY_FSYNC = os.getenv('HISTORY_FSYNC', 'true').lower() in ('1', 'true', 'yes')
+
+# Storage backend for moderation history ('json' or 'sqlite')
+HISTORY_BACKEND = os.getenv('HISTORY_BACKEND', 'json').lower()
+HISTORY_DB_FILE = os.getenv('HISTORY_DB_FILE', 'moderation_history.db')
+HISTORY_CACHE_SIZE = int(os.getenv('HISTORY_CACHE_SIZE', 1000))
+
+# Guild polling settings
+POLL_INTERVAL_MINUTES = float(os.getenv('POLL_INTERVAL_MINUTES', 5))
+POLL_CONCURRENCY = int(os.getenv('POLL_CONCURRENCY', 5))
+AUDIT_LOG_RATE = float(os.getenv('AUDIT_LOG_RATE', 5))  # Audit log requests per second
+AUDIT_LOG_BURST = int(os.getenv('AUDIT_LOG_BURST', 5))
+AUDIT_CURSOR_FILE = os.getenv('AUDIT_CURSOR_FILE', 'audit_cursors.json')
+
+# Notification settings
+NOTIFY_COALESCE_SECONDS = float(os.getenv('NOTIFY_COALESCE_SECONDS', 1.0))
+
+# User cache settings
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', 86400))  # Seconds before a user is refetched
+USER_CACHE_NEGATIVE_TTL = float(os.getenv('USER_CACHE_NEGATIVE_TTL', 3600))  # Seconds to remember failed fetches
+USER_CACHE_FILE = os.getenv('USER_CACHE_FILE', 'user_cache.json')
+USER_FETCH_CONCURRENCY = int(os.getenv('USER_FETCH_CONCURRENCY', 10))
+
+# Reputation scoring: "action:weight" pairs, and an optional half-life in days (0 disables decay)
+REPUTATION_WEIGHTS = {
+    name.strip(): float(weight) if '.' in weight else int(weight)
+    for name, weight in (pair.split(':') for pair in os.getenv('REPUTATION_WEIGHTS', 'ban:-5,kick:-3,timeout:-1').split(',') if pair.strip())
+}
+REPUTATION_HALF_LIFE_DAYS = float(os.getenv('REPUTATION_HALF_LIFE_DAYS', 0))
+
+# Local Prometheus-style metrics endpoint (port 0 disables it)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Alternative Discord API and gateway URLs, e.g. the offline stand-in in benchmarks/fake_discord.py
+DISCORD_API_BASE = os.getenv('DISCORD_API_BASE')
+DISCORD_GATEWAY_URL = os.getenv('DISCORD_GATEWAY_URL')
+
 COMMAND_PREFIX = os.getenv('COMMAND_PREFIX', '!')
 
 # Constants
@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+from config import AUDIT_CURSOR_FILE
+from metrics import save_seconds
+
+# Last processed audit log entry ID per guild
+audit_cursors = {}
+
+def load_cursors():
+    """Load audit log cursors from file"""
+    try:
+        if os.path.exists(AUDIT_CURSOR_FILE):
+            with open(AUDIT_CURSOR_FILE, 'r') as f:
+                loaded_data = json.load(f)
+            audit_cursors.clear()
+            audit_cursors.update({
+                guild_id: entry_id for guild_id, entry_id in loaded_data.items() if isinstance(entry_id, int)
+            })
+            if len(audit_cursors) < len(loaded_data):
+                logging.warning(f"Ignored {len(loaded_data) - len(audit_cursors)} unreadable audit log cursors")
+            logging.info(f"Loaded audit log cursors for {len(audit_cursors)} guilds")
+    except Exception as e:
+        logging.error(f"Error loading audit log cursors: {e}")
+    
+    return audit_cursors
+
+def save_cursors():
+    """Save audit log cursors to file"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(AUDIT_CURSOR_FILE)), exist_ok=True)
+        
+        # Write to a temporary file first so a crash can't truncate the cursors
+        with save_seconds.time(store="cursors"):
+            temp_file = AUDIT_CURSOR_FILE + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump(audit_cursors, f, indent=2)
+            os.replace(temp_file, AUDIT_CURSOR_FILE)
+    except Exception as e:
+        logging.error(f"Error saving audit log cursors: {e}")
+
+def get_guild_cursor(guild_id):
+    """Get the last processed audit log entry ID, or None if the guild was never polled"""
+    return audit_cursors.get(str(guild_id))
+
+def set_guild_cursor(guild_id, entry_id):
+    """Advance the cursor for a guild"""
+    cursor = get_guild_cursor(guild_id)
+    if cursor is None or entry_id > cursor:
+        audit_cursors[str(guild_id)] = entry_id
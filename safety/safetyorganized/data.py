@@ -1,16 +1,64 @@
 import json
 import logging
 import os
-from datetime import datetime
-from config import HISTORY_FILE
+from config import HISTORY_FILE, HISTORY_BACKEND
+import store
+import sqlite_store
+from leaderboard import Leaderboard
+from timestamps import now_ms, to_epoch_ms
+from actions import ModerationAction, convert_history, compact_action_id, snowflake
+from reputation import reputation_engine
 
 # Global variables
 moderation_history = {}
 
+# Index of imported action IDs, mapped to the user they belong to
+action_index = {}
+
+# Number of actions rejected as duplicates since startup
+duplicates_skipped = 0
+
+# Users with actions ordered by reputation, globally and per guild
+leaderboard = Leaderboard()
+guild_leaderboards = {}
+
+# Guilds each user has actions in
+user_guilds = {}
+
+# Running totals per guild, used by calculate_server_stats
+guild_stats = {}
+
+# Number of actions stored, used to tell when cached views are stale
+store_version = 0
+
+# Owner of each action in the order actions were added, so readers can
+# catch up from an earlier store version
+action_log = []
+
 def load_moderation_history():
     """Load moderation history from file"""
     global moderation_history
     
+    # The SQLite backend reads rows on demand instead of loading everything
+    if HISTORY_BACKEND == 'sqlite':
+        try:
+            # A history may be only a write-ahead log if it was never compacted
+            if sqlite_store.count_users() == 0 and (os.path.exists(HISTORY_FILE) or store.has_log()):
+                sqlite_store.migrate_from_json()
+            
+            # Stored scores are reused only if they were computed with the same weights
+            scoring = sqlite_store.get_scoring()
+            if scoring and scoring[0] == reputation_engine.version:
+                reputation_engine.configure(reference=scoring[1])
+            else:
+                recompute_reputation()
+            logging.info(f"Using SQLite moderation history with {sqlite_store.count_users()} users")
+        except Exception as e:
+            logging.error(f"Error opening moderation history database: {e}")
+            import traceback
+            logging.error(traceback.format_exc())
+        return moderation_history
+    
     try:
         if os.path.exists(HISTORY_FILE):
             with open(HISTORY_FILE, 'r') as f:
@@ -28,30 +76,198 @@ def load_moderation_history():
             logging.info(f"Loaded moderation history with {len(moderation_history)} users")
         else:
             logging.warning(f"No history file found at {HISTORY_FILE}, starting with empty history")
-            moderation_history = {}
+            moderation_history.clear()
+        
+        # Replay actions recorded since the last snapshot, then convert the
+        # actions to compact records (upgrading older timestamps and IDs)
+        replayed = store.replay(moderation_history)
+        converted = convert_history(moderation_history)
+        if converted:
+            logging.info(f"Converted {converted} actions from an older history format")
+        if replayed or converted:
+            store.compact(moderation_history)
+        
+        # Derive reputation from the action log with the configured weights
+        for user_data in moderation_history.values():
+            if isinstance(user_data, dict) and isinstance(user_data.get("actions"), list):
+                user_data["reputation"] = reputation_engine.score_actions(user_data["actions"])
+        
+        rebuild_indexes()
     except Exception as e:
         logging.error(f"Error loading moderation history: {e}")
         import traceback
         logging.error(traceback.format_exc())
-        moderation_history = {}
+        moderation_history.clear()
     
     # Return the loaded data to ensure it's accessible
     return moderation_history
 
+def rebuild_indexes():
+    """Rebuild the action ID index, leaderboards and guild totals from the loaded history"""
+    global store_version
+    
+    store_version = 0
+    action_log.clear()
+    action_index.clear()
+    leaderboard.clear()
+    guild_leaderboards.clear()
+    user_guilds.clear()
+    guild_stats.clear()
+    
+    for user_id, user_data in moderation_history.items():
+        if not isinstance(user_data, dict) or not isinstance(user_data.get("actions"), list):
+            continue
+        store_version += len(user_data["actions"])
+        for action in user_data["actions"]:
+            action_log.append(user_id)
+            if action.action_id is not None:
+                action_index[action.action_id] = user_id
+            _add_user_to_guild(user_id, action.guild_id, 0)
+            _count_guild_action(user_id, action)
+    
+    _rebuild_rankings()
+    
+    logging.info(f"Indexed {len(action_index)} action IDs, {len(leaderboard)} ranked users and {len(guild_stats)} guilds")
+
+def _add_user_to_guild(user_id, guild_id, reputation):
+    """Record that a user has actions in a guild"""
+    guilds = user_guilds.setdefault(user_id, set())
+    if guild_id not in guilds:
+        guilds.add(guild_id)
+        if guild_id not in guild_leaderboards:
+            guild_leaderboards[guild_id] = Leaderboard()
+            guild_stats[guild_id] = {
+                "action_counts": {},
+                "total_reputation": 0,
+                "recent_action": None,
+                "recent_time": None
+            }
+        guild_stats[guild_id]["total_reputation"] += reputation
+
+def _count_guild_action(user_id, action):
+    """Add an action to its guild's running totals"""
+    stats = guild_stats[action.guild_id]
+    
+    # Count action type
+    action_type = action.action
+    stats["action_counts"][action_type] = stats["action_counts"].get(action_type, 0) + 1
+    
+    # Check if this is the most recent action
+    action_time = action.timestamp
+    if action_time is not None and (stats["recent_time"] is None or action_time > stats["recent_time"]):
+        stats["recent_time"] = action_time
+        stats["recent_action"] = {
+            "action": action_type,
+            "timestamp": action_time,
+            "user_id": user_id,
+            "reason": action.reason or "No reason provided"
+        }
+
+def _update_rankings(user_id, user_history, previous_reputation):
+    """Move a user to their current reputation on every leaderboard and guild total"""
+    reputation = user_history.get("reputation", 0)
+    change = reputation - previous_reputation
+    leaderboard.update(user_id, reputation)
+    for guild_id in user_guilds.get(user_id, ()):
+        guild_leaderboards[guild_id].update(user_id, reputation)
+        guild_stats[guild_id]["total_reputation"] += change
+
+def _rebuild_rankings():
+    """Sort every leaderboard and total each guild's reputation from the stored reputations"""
+    ranked = [(user_id, moderation_history[user_id].get("reputation", 0)) for user_id in user_guilds]
+    leaderboard.load(ranked)
+    
+    members = {guild_id: [] for guild_id in guild_leaderboards}
+    for guild_id in guild_stats:
+        guild_stats[guild_id]["total_reputation"] = 0
+    for user_id, reputation in ranked:
+        for guild_id in user_guilds[user_id]:
+            members[guild_id].append((user_id, reputation))
+            guild_stats[guild_id]["total_reputation"] += reputation
+    for guild_id, entries in members.items():
+        guild_leaderboards[guild_id].load(entries)
+
+def recompute_reputation(weights=None, half_life_days=None):
+    """Recompute every user's reputation from their actions, e.g. after a weight change"""
+    from analytics import columns
+    
+    reputation_engine.configure(weights, half_life_days)
+    columns.refresh()
+    scores = reputation_engine.score_columns(columns)
+    
+    if HISTORY_BACKEND == 'sqlite':
+        sqlite_store.set_reputations(zip(columns.user_ids, scores), reputation_engine)
+    else:
+        for user_id, score in zip(columns.user_ids, scores):
+            moderation_history[user_id]["reputation"] = float(score)
+        _rebuild_rankings()
+    
+    columns.set_reputations(scores)
+    logging.info(f"Recomputed reputation for {len(columns.user_ids)} users (scoring version {reputation_engine.version})")
+
+def get_store_version():
+    """Get a number that changes whenever an action is added or reputations are recomputed"""
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.get_version() + reputation_engine.generation
+    return store_version + reputation_engine.generation
+
+def get_actions_since(version):
+    """Get the current store version and an iterable of the (user ID, action) pairs added after an earlier one"""
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.get_actions_since(version)
+    
+    # Each user's newest actions are the last entries in their list
+    recent = action_log[version:]
+    offsets = {}
+    for user_id in recent:
+        offsets[user_id] = offsets.get(user_id, 0) + 1
+    for user_id, count in offsets.items():
+        offsets[user_id] = len(moderation_history[user_id]["actions"]) - count
+    
+    actions = []
+    for user_id in recent:
+        actions.append((user_id, moderation_history[user_id]["actions"][offsets[user_id]]))
+        offsets[user_id] += 1
+    return store_version, actions
+
+def get_reputations(user_ids):
+    """Get the current reputation of each of the given users"""
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.get_reputations(user_ids)
+    return {user_id: moderation_history[user_id].get("reputation", 0) for user_id in user_ids if user_id in moderation_history}
+
+def get_duplicate_count():
+    """Get the number of duplicate actions skipped since startup"""
+    return duplicates_skipped
+
 def save_moderation_history():
     """Save moderation history to file"""
+    if HISTORY_BACKEND == 'sqlite':
+        sqlite_store.get_connection().commit()
+        return
+    
     try:
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(os.path.abspath(HISTORY_FILE)), exist_ok=True)
-        
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(moderation_history, f, indent=2)
-        logging.info(f"Saved moderation history with {len(moderation_history)} users")
+        # Write a full snapshot and clear the write-ahead log
+        store.compact(moderation_history, background=False)
     except Exception as e:
         logging.error(f"Error saving moderation history: {e}")
         import traceback
         logging.error(traceback.format_exc())
 
+def get_user_count():
+    """Get the number of users with moderation history"""
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.count_users()
+    return len(moderation_history)
+
+def find_user_history(user_id):
+    """Get a user's moderation history, or None if the user has none"""
+    user_id = str(user_id)
+    
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.find_user(user_id)
+    return moderation_history.get(user_id)
+
 def get_user_history(user_id):
     """Get a user's moderation history"""
     global moderation_history
@@ -59,6 +275,9 @@ def get_user_history(user_id):
     # Convert to string to ensure consistent format
     user_id = str(user_id)
     
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.find_user(user_id) or {"reputation": 0, "actions": []}
+    
     # Try different formats of the user ID
     if user_id not in moderation_history:
         # Try without quotes
@@ -76,84 +295,127 @@ def get_user_history(user_id):
     
     return moderation_history[user_id]
 
+def get_user_action_counts(user_id):
+    """Count a user's actions by type and by guild"""
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.get_user_action_counts(user_id)
+    
+    counts = {"by_type": {}, "by_guild": {}}
+    user_history = moderation_history.get(str(user_id), {})
+    for action in user_history.get("actions", []):
+        action_type = action.action
+        counts["by_type"][action_type] = counts["by_type"].get(action_type, 0) + 1
+        guild_id = action.guild_id
+        counts["by_guild"][guild_id] = counts["by_guild"].get(guild_id, 0) + 1
+    
+    return counts
+
+def _build_action(action_type, guild_id, reason=None, moderator=None, timestamp=None, action_id=None):
+    """Build the stored representation of a moderation action"""
+    moderator_id, moderator_name = None, None
+    
+    # Add moderator if provided
+    if moderator:
+        if hasattr(moderator, 'id') and hasattr(moderator, 'name'):
+            moderator_id, moderator_name = moderator.id, moderator.name
+        else:
+            moderator_name = str(moderator)
+    
+    return ModerationAction(
+        action_type,
+        guild_id,
+        now_ms() if timestamp is None else to_epoch_ms(timestamp),
+        reason or "No reason provided",
+        moderator_id,
+        moderator_name,
+        action_id
+    )
+
 def add_moderation_action(user_id, action_type, guild_id, reason=None, moderator=None, timestamp=None, action_id=None):
     """Add a moderation action to a user's history"""
-    global moderation_history
+    global moderation_history, duplicates_skipped, store_version
     
     user_id = str(user_id)
-    guild_id = str(guild_id)
+    guild_id = snowflake(guild_id)
+    action_id = compact_action_id(action_id)
     
-    # Get user history
-    user_history = get_user_history(user_id)
+    if HISTORY_BACKEND == 'sqlite':
+        action = _build_action(action_type, guild_id, reason, moderator, timestamp, action_id)
+        if reputation_engine.needs_rebase(action.timestamp):
+            recompute_reputation()
+        result = sqlite_store.add_action(user_id, action, reputation_engine.action_score(action_type, action.timestamp))
+        if result.get("duplicate"):
+            duplicates_skipped += 1
+        return result
     
     # Check if this action already exists (to avoid duplicates)
-    if action_id and "actions" in user_history:
-        for action in user_history["actions"]:
-            if action.get("action_id") == action_id:
-                return {"duplicate": True}
+    if action_id is not None and action_id in action_index:
+        duplicates_skipped += 1
+        return {"duplicate": True}
     
-    # Create action object
-    action = {
-        "action": action_type,
-        "guild_id": guild_id,
-        "timestamp": timestamp or datetime.utcnow().isoformat(),
-        "reason": reason or "No reason provided"
-    }
+    # Get user history
+    user_history = get_user_history(user_id)
     
-    # Add moderator if provided
-    if moderator:
-        if hasattr(moderator, 'id') and hasattr(moderator, 'name'):
-            action["moderator"] = {
-                "id": str(moderator.id),
-                "name": moderator.name
-            }
-        else:
-            action["moderator"] = str(moderator)
+    # Create action object
+    action = _build_action(action_type, guild_id, reason, moderator, timestamp, action_id)
     
-    # Add action ID if provided
-    if action_id:
-        action["action_id"] = action_id
+    # Move the decay reference forward before scores grow too large
+    if reputation_engine.needs_rebase(action.timestamp):
+        recompute_reputation()
     
     # Add action to history
     if "actions" not in user_history:
         user_history["actions"] = []
     user_history["actions"].append(action)
+    if action_id is not None:
+        action_index[action_id] = user_id
+    action_log.append(user_id)
+    store_version += 1
+    
+    # Update the guild totals, then reputation and the leaderboards
+    previous_reputation = user_history.get("reputation", 0)
+    _add_user_to_guild(user_id, guild_id, previous_reputation)
+    _count_guild_action(user_id, action)
+    user_history["reputation"] = previous_reputation + reputation_engine.action_score(action_type, action.timestamp)
+    _update_rankings(user_id, user_history, previous_reputation)
     
-    # Update reputation
-    if action_type == "ban":
-        user_history["reputation"] -= 5
-    elif action_type == "kick":
-        user_history["reputation"] -= 3
-    elif action_type == "timeout":
-        user_history["reputation"] -= 1
+    # Append the action to the write-ahead log
+    store.append_action(user_id, len(user_history["actions"]) - 1, action, user_history["reputation"])
     
-    # Save history
-    save_moderation_history()
+    # Fold the log into a snapshot in the background once it has grown
+    if store.compaction_due():
+        store.compact(moderation_history)
     
     return {"success": True}
 
-def get_leaderboard(limit=100):
-    """Get users with the lowest reputation scores"""
+def get_leaderboard(limit=100, guild_id=None):
+    """Get users with the lowest reputation scores, optionally within one guild"""
     global moderation_history
     
-    # Filter users with actions
-    users_with_actions = {
-        user_id: data for user_id, data in moderation_history.items()
-        if "actions" in data and data["actions"]
-    }
+    if HISTORY_BACKEND == 'sqlite':
+        return sqlite_store.get_leaderboard(limit, guild_id)
     
-    # Sort by reputation (lowest first)
-    sorted_users = sorted(
-        users_with_actions.items(),
-        key=lambda x: x[1].get("reputation", 0)
-    )
+    # Pick the global or per-guild ranking
+    if guild_id is not None:
+        ranking = guild_leaderboards.get(snowflake(guild_id))
+        if ranking is None:
+            return []
+    else:
+        ranking = leaderboard
     
     # Return limited number of users
-    return sorted_users[:limit]
+    return [(user_id, moderation_history[user_id]) for user_id in ranking.top(limit)]
 
 def calculate_server_stats(guild_id):
     """Calculate reputation statistics for a server"""
-    guild_id = str(guild_id)
+    if HISTORY_BACKEND == 'sqlite':
+        stats = sqlite_store.calculate_server_stats(guild_id)
+        stats["total_reputation"] = reputation_engine.current(stats["total_reputation"])
+        if stats["total_users"] > 0:
+            stats["avg_reputation"] = stats["total_reputation"] / stats["total_users"]
+        return stats
+    
+    guild_id = snowflake(guild_id)
     
     # Initialize stats
     stats = {
@@ -164,55 +426,18 @@ def calculate_server_stats(guild_id):
         "recent_action": None
     }
     
-    # Track users in this guild
-    users_in_guild = set()
-    
-    # Track most recent action
-    most_recent_time = None
+    totals = guild_stats.get(guild_id)
+    if totals is None:
+        return stats
     
-    # Process all users
-    for user_id, user_data in moderation_history.items():
-        if "actions" not in user_data or not isinstance(user_data["actions"], list):
-            continue
-        
-        user_in_guild = False
-        
-        # Sort actions by timestamp (oldest first)
-        actions = sorted(user_data["actions"], key=lambda x: x.get("timestamp", "0"))
-        
-        # Process actions for this user
-        for action in actions:
-            if action.get("guild_id") == guild_id:
-                user_in_guild = True
-                
-                # Count action type
-                action_type = action.get("action", "unknown")
-                if action_type not in stats["action_counts"]:
-                    stats["action_counts"][action_type] = 0
-                stats["action_counts"][action_type] += 1
-                
-                # Check if this is the most recent action
-                if "timestamp" in action:
-                    try:
-                        action_time = datetime.fromisoformat(action["timestamp"].replace('Z', '+00:00'))
-                        if most_recent_time is None or action_time > most_recent_time:
-                            most_recent_time = action_time
-                            stats["recent_action"] = {
-                                "action": action_type,
-                                "timestamp": action["timestamp"],
-                                "user_id": user_id,
-                                "reason": action.get("reason", "No reason provided")
-                            }
-                    except:
-                        pass
-        
-        # Add user to count if they have actions in this guild
-        if user_in_guild:
-            users_in_guild.add(user_id)
-            stats["total_reputation"] += user_data.get("reputation", 0)
+    # Copy the running totals for this guild
+    stats["action_counts"] = dict(totals["action_counts"])
+    stats["total_users"] = len(guild_leaderboards[guild_id])
+    stats["total_reputation"] = reputation_engine.current(totals["total_reputation"])
+    if totals["recent_action"]:
+        stats["recent_action"] = dict(totals["recent_action"])
     
     # Calculate final stats
-    stats["total_users"] = len(users_in_guild)
     if stats["total_users"] > 0:
         stats["avg_reputation"] = stats["total_reputation"] / stats["total_users"]
     
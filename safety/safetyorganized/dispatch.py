@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from collections import deque
+import discord
+from config import NOTIFY_COALESCE_SECONDS
+
+# Discord limits for a single message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARACTERS_PER_MESSAGE = 6000
+
+# Attempts per message before it is dropped
+MAX_SEND_ATTEMPTS = 5
+
+class NotificationDispatcher:
+    """Packs embeds bound for the same channel into as few messages as possible"""
+
+    def __init__(self, coalesce_window=NOTIFY_COALESCE_SECONDS):
+        self.coalesce_window = coalesce_window
+        self.messages_sent = 0
+        self.embeds_sent = 0
+        self._pending = {}
+        self._channels = {}
+        self._workers = {}
+
+    def enqueue(self, channel, embed):
+        """Queue an embed for a channel and make sure a worker is draining it"""
+        self._pending.setdefault(channel.id, deque()).append(embed)
+        self._channels[channel.id] = channel
+
+        worker = self._workers.get(channel.id)
+        if worker is None or worker.done():
+            self._workers[channel.id] = asyncio.create_task(self._drain(channel.id))
+
+    async def flush(self, channel=None):
+        """Wait until queued embeds (for one channel, or all) have been sent"""
+        if channel is not None:
+            workers = [self._workers.get(channel.id)]
+        else:
+            workers = list(self._workers.values())
+        await asyncio.gather(*[worker for worker in workers if worker is not None])
+
+    def _take_batch(self, pending):
+        """Take as many embeds as fit in one message"""
+        batch = []
+        characters = 0
+        while pending and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            size = len(pending[0])
+            if batch and characters + size > MAX_EMBED_CHARACTERS_PER_MESSAGE:
+                break
+            batch.append(pending.popleft())
+            characters += size
+        return batch
+
+    async def _drain(self, channel_id):
+        """Send queued embeds for a channel until its queue is empty"""
+        pending = self._pending[channel_id]
+        channel = self._channels[channel_id]
+
+        while pending:
+            # Let a burst fill the batch before sending a partial message
+            if len(pending) < MAX_EMBEDS_PER_MESSAGE:
+                await asyncio.sleep(self.coalesce_window)
+
+            batch = self._take_batch(pending)
+            try:
+                await self._send_batch(channel, batch)
+            except Exception as e:
+                logging.error(f"Error sending {len(batch)} notifications to channel {channel_id}: {e}")
+
+    async def _send_batch(self, channel, batch):
+        """Send one message, waiting out Retry-After whenever the channel is rate limited"""
+        for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+            try:
+                await channel.send(embeds=batch)
+                self.messages_sent += 1
+                self.embeds_sent += len(batch)
+                return
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == MAX_SEND_ATTEMPTS:
+                    raise
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                logging.warning(f"Rate limited sending to channel {channel.id}, retrying in {retry_after}s")
+                await asyncio.sleep(retry_after)
+
+# Shared dispatcher for moderation notifications
+notification_dispatcher = NotificationDispatcher()
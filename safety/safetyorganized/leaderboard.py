@@ -0,0 +1,57 @@
+from bisect import bisect_left, insort
+
+class Leaderboard:
+    """Users ordered by reputation (lowest first), updated as reputations change"""
+
+    def __init__(self):
+        # Sorted (reputation, sequence, user_id) keys; the sequence number keeps
+        # ties in the order users were first added
+        self._keys = []
+        self._entries = {}
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def update(self, user_id, reputation):
+        """Insert a user or move them to their new reputation"""
+        key = self._entries.get(user_id)
+        if key is not None:
+            if key[0] == reputation:
+                return
+            del self._keys[bisect_left(self._keys, key)]
+            sequence = key[1]
+        else:
+            sequence = self._sequence
+            self._sequence += 1
+
+        key = (reputation, sequence, user_id)
+        self._entries[user_id] = key
+        insort(self._keys, key)
+
+    def remove(self, user_id):
+        """Remove a user from the leaderboard"""
+        key = self._entries.pop(user_id, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+    def clear(self):
+        """Remove every user"""
+        self._keys.clear()
+        self._entries.clear()
+        self._sequence = 0
+
+    def load(self, reputations):
+        """Replace every entry from (user_id, reputation) pairs with one sort"""
+        self.clear()
+        for user_id, reputation in reputations:
+            self._entries[user_id] = (reputation, self._sequence, user_id)
+            self._sequence += 1
+        self._keys = sorted(self._entries.values())
+
+    def top(self, limit):
+        """Get the user IDs with the lowest reputation"""
+        return [user_id for _, _, user_id in self._keys[:limit]]
@@ -3,8 +3,10 @@ import os
 import discord
 from dotenv import load_dotenv
 from bot import setup_bot, run_bot
-from data import load_moderation_history
+from data import load_moderation_history, get_user_count
 from commands import register_commands
+from cursors import load_cursors
+from cache import user_cache
 from config import HISTORY_FILE
 
 # Configure logging
@@ -33,10 +35,12 @@ bot = setup_bot()
 register_commands(bot)
 
 # Load data
-history_data = load_moderation_history()
+load_moderation_history()
+load_cursors()
+user_cache.load()
 
 # Log how many users are in the history
-logging.info(f"Loaded {len(history_data)} users in moderation history")
+logging.info(f"Loaded {get_user_count()} users in moderation history")
 
 # Run the bot
 if __name__ == "__main__":
@@ -0,0 +1,260 @@
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+import aiohttp
+from aiohttp import web
+
+# Default histogram buckets in seconds, from fast cache hits to slow poll cycles
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+def _format_labels(names, values, extra=None):
+    """Format a label set the way the Prometheus text format expects"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    """A named metric with optional labels"""
+    type = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        """Yield (suffix, label values, extra label, value) for every series"""
+        for key, value in sorted(self._values.items()):
+            yield "", key, None, value
+
+class Counter(Metric):
+    """A value that only goes up"""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A value that can go up and down"""
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+class Callback(Metric):
+    """A counter or gauge read from elsewhere each time the metrics are collected"""
+
+    def __init__(self, name, help, type, function, labels=()):
+        super().__init__(name, help, labels)
+        self.type = type
+        self.function = function
+
+    def samples(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            logging.warning(f"Error collecting metric {self.name}: {e}")
+            return
+        values = value if isinstance(value, dict) else {(): value}
+        for key, value in sorted(values.items()):
+            yield "", key if isinstance(key, tuple) else (key,), None, value
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and largest value"""
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0, "max": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+            state["max"] = max(state["max"], value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, dict(state, counts=list(state["counts"]))) for key, state in sorted(self._values.items())]
+        for key, state in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                yield "_bucket", key, ("le", _format_value(bound)), cumulative
+            yield "_bucket", key, ("le", "+Inf"), state["count"]
+            yield "_sum", key, None, state["sum"]
+            yield "_count", key, None, state["count"]
+
+    def stats(self):
+        """Get the count, mean and maximum of each series"""
+        with self._lock:
+            return {
+                key: {"count": state["count"], "mean": state["sum"] / state["count"], "max": state["max"]}
+                for key, state in self._values.items() if state["count"]
+            }
+
+class MetricsRegistry:
+    """Every metric the bot exposes"""
+
+    def __init__(self, prefix="safetybot_"):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        metric.name = self.prefix + metric.name
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, function, type="gauge", labels=()):
+        """Register a metric whose value (or {label values: value} dict) comes from a function"""
+        return self._add(Callback(name, help, type, function, labels))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, key, extra, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(metric.label_names, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Summarize every series on one line each, for the /metrics command"""
+        lines = []
+        for metric in self._metrics:
+            name = metric.name[len(self.prefix):]
+            if isinstance(metric, Histogram):
+                for key, stats in sorted(metric.stats().items()):
+                    labels = _format_labels(metric.label_names, key)
+                    lines.append(f"{name}{labels}: n={stats['count']} avg={stats['mean'] * 1000:.1f}ms max={stats['max'] * 1000:.1f}ms")
+            else:
+                for _, key, _, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(metric.label_names, key)}: {_format_value(value)}")
+        return "\n".join(lines)
+
+# Metrics shared by the whole bot
+registry = MetricsRegistry()
+
+# Polling
+poll_cycle_seconds = registry.histogram("poll_cycle_seconds", "Time taken by a full guild polling cycle")
+polled_guilds = registry.counter("poll_guilds_total", "Guilds handled by polling cycles, by result", ["result"])
+poll_backlog = registry.gauge("poll_backlog", "Guilds still pending when the last polling cycle overran its interval")
+
+# Audit log ingestion
+audit_entries_fetched = registry.counter("audit_entries_fetched_total", "Audit log entries read")
+audit_entries_duplicate = registry.counter("audit_entries_duplicate_total", "Moderation entries skipped as already imported")
+audit_entries_new = registry.counter("audit_entries_new_total", "Moderation entries added to the history")
+
+# Discord REST calls
+discord_requests = registry.counter("discord_requests_total", "Discord API requests by route and status", ["method", "route", "status"])
+discord_request_seconds = registry.histogram("discord_request_seconds", "Discord API request latency by route", ["method", "route"])
+discord_rate_limited = registry.counter("discord_rate_limited_total", "429 responses from the Discord API by route and scope", ["route", "scope"])
+
+# Slash commands
+command_seconds = registry.histogram("command_seconds", "Time from receiving a slash command to finishing it", ["command"])
+
+# Saves to disk (snapshot, write-ahead log, SQLite, cursors, user cache)
+save_seconds = registry.histogram("save_seconds", "Time taken to persist state, by store", ["store"])
+
+# Snowflakes and interaction/webhook tokens in API paths, which would make every path its own series
+_ROUTE_PATTERNS = [
+    (re.compile(r"^/api/v\d+"), ""),
+    (re.compile(r"/(interactions|webhooks)/(\d+|\{id\})/[^/]+"), r"/\1/{id}/{token}"),
+    (re.compile(r"/\d{15,21}(?=/|$)"), "/{id}")
+]
+
+def route_template(path):
+    """Reduce an API path to its route, e.g. /channels/{id}/messages"""
+    for pattern, replacement in _ROUTE_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path
+
+def discord_http_trace():
+    """Build an aiohttp trace config that records every Discord API request"""
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        route = route_template(params.url.path)
+        status = params.response.status
+        discord_requests.inc(method=params.method, route=route, status=status)
+        discord_request_seconds.observe(time.perf_counter() - context.started, method=params.method, route=route)
+        if status == 429:
+            discord_rate_limited.inc(route=route, scope=params.response.headers.get('X-RateLimit-Scope', 'unknown'))
+
+    async def on_request_exception(session, context, params):
+        discord_requests.inc(method=params.method, route=route_template(params.url.path), status="error")
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
+
+# Runner for the HTTP endpoint (once started)
+_runner = None
+
+async def start_server(host, port):
+    """Serve the metrics over HTTP for Prometheus to scrape"""
+    global _runner
+
+    if _runner is not None or not port:
+        return
+
+    async def handle_metrics(request):
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    try:
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        _runner = runner
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    except OSError as e:
+        logging.error(f"Could not start the metrics endpoint on {host}:{port}: {e}")
+        await runner.cleanup()
@@ -0,0 +1,97 @@
+import logging
+from collections import OrderedDict
+import discord
+from data import get_store_version
+
+# Page renderers by query kind: async renderer(bot, key, page) -> (embed, total_pages)
+PAGE_RENDERERS = {}
+
+# Recently rendered pages keyed by (kind, key, page, store version), shared by every message
+_page_cache = OrderedDict()
+MAX_CACHED_PAGES = 256
+
+def register_renderer(kind, renderer):
+    """Register the renderer for a kind of paginated query"""
+    PAGE_RENDERERS[kind] = renderer
+
+async def render_page(bot, kind, key, page):
+    """Render a page against the current store, reusing it until the store changes"""
+    version = get_store_version()
+    cache_key = (kind, key, page, version)
+
+    if cache_key in _page_cache:
+        _page_cache.move_to_end(cache_key)
+        embed, total_pages = _page_cache[cache_key]
+    else:
+        embed, total_pages = await PAGE_RENDERERS[kind](bot, key, page)
+        _page_cache[cache_key] = (embed, total_pages)
+        while len(_page_cache) > MAX_CACHED_PAGES:
+            _page_cache.popitem(last=False)
+
+    return embed, total_pages, version
+
+class PageButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r'page:(?P<kind>[a-z]+):(?P<key>[\w.]+):(?P<page>\d+):(?P<version>\d+):(?P<direction>[pn])'
+):
+    """Previous/Next button whose custom_id carries everything needed to render its target page"""
+
+    def __init__(self, kind, key, page, version, direction, disabled=False):
+        label, emoji = ("Previous", "⬅️") if direction == "p" else ("Next", "➡️")
+        super().__init__(
+            discord.ui.Button(
+                style=discord.ButtonStyle.secondary,
+                label=label,
+                emoji=emoji,
+                disabled=disabled,
+                custom_id=f"page:{kind}:{key}:{page}:{version}:{direction}"
+            )
+        )
+        self.kind = kind
+        self.key = key
+        self.page = page
+        self.version = version
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["kind"], match["key"], int(match["page"]), int(match["version"]), match["direction"])
+
+    async def callback(self, interaction):
+        """Re-query the store and show the target page"""
+        if self.kind not in PAGE_RENDERERS:
+            await interaction.response.send_message("This list can no longer be paged.", ephemeral=True)
+            return
+
+        try:
+            embed, total_pages, version = await render_page(interaction.client, self.kind, self.key, self.page)
+        except Exception as e:
+            logging.error(f"Error rendering {self.kind} page {self.page}: {e}")
+            await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
+            return
+
+        # Say so when the data changed after the message was first sent
+        if version != self.version:
+            embed = embed.copy()
+            embed.set_footer(text=f"{embed.footer.text} | Updated since this list was opened")
+
+        page = min(self.page, total_pages - 1)
+        await interaction.response.edit_message(embed=embed, view=build_page_view(self.kind, self.key, page, total_pages, version))
+
+def build_page_view(kind, key, page, total_pages, version):
+    """Build the Previous/Next buttons for a page"""
+    view = discord.ui.View(timeout=None)
+    view.add_item(PageButton(kind, key, max(page - 1, 0), version, "p", disabled=(page == 0)))
+    view.add_item(PageButton(kind, key, min(page + 1, total_pages - 1), version, "n", disabled=(page >= total_pages - 1)))
+    return view
+
+async def send_paginated(bot, interaction, kind, key, page=0):
+    """Send the first page of a paginated query"""
+    embed, total_pages, version = await render_page(bot, kind, key, page)
+    page = min(page, total_pages - 1)
+    view = build_page_view(kind, key, page, total_pages, version)
+
+    # Send or edit message
+    if interaction.response.is_done():
+        await interaction.edit_original_response(content=None, embed=embed, view=view)
+    else:
+        await interaction.followup.send(embed=embed, view=view)
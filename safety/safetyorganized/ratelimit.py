@@ -0,0 +1,31 @@
+import asyncio
+import time
+from config import AUDIT_LOG_RATE, AUDIT_LOG_BURST
+
+class TokenBucket:
+    """Async token bucket shared by every caller of a rate-limited route"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add the tokens earned since the last update"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+# Shared bucket for audit log requests across all guild pollers
+audit_log_bucket = TokenBucket(AUDIT_LOG_RATE, AUDIT_LOG_BURST)
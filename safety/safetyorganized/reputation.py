@@ -0,0 +1,92 @@
+import hashlib
+import json
+from config import REPUTATION_WEIGHTS, REPUTATION_HALF_LIFE_DAYS
+from timestamps import now_ms
+
+# NumPy is optional; without it batch recomputes use a plain loop
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DAY_MS = 86_400_000
+
+# Scores are rebased once a new action would weigh more than 2**MAX_EXPONENT
+# times an action at the reference time, well inside float range
+MAX_EXPONENT = 512
+
+class ReputationEngine:
+    """Derives reputation scores from moderation actions"""
+
+    def __init__(self, weights=REPUTATION_WEIGHTS, half_life_days=REPUTATION_HALF_LIFE_DAYS):
+        # Bumped whenever stored scores are recomputed, so cached views refresh
+        self.generation = 0
+        self.configure(weights, half_life_days)
+
+    def configure(self, weights=None, half_life_days=None, reference=None):
+        """Set the weights and half-life, starting a new scoring generation"""
+        if weights is not None:
+            self.weights = dict(weights)
+        if half_life_days is not None:
+            self.half_life_ms = half_life_days * DAY_MS
+
+        # With decay, an action at time t adds weight * 2**((t - reference) / half-life).
+        # Every score then decays by the same factor, so rankings never need
+        # re-sorting as time passes and only the displayed value changes
+        self.reference = now_ms() if reference is None else reference
+
+        self.version = hashlib.sha1(
+            json.dumps([sorted(self.weights.items()), self.half_life_ms]).encode()
+        ).hexdigest()[:12]
+        self.generation += 1
+
+    @property
+    def decays(self):
+        return self.half_life_ms > 0
+
+    def action_score(self, action_type, timestamp):
+        """Get the stored score contribution of one action"""
+        weight = self.weights.get(action_type, 0)
+        if not self.decays or timestamp is None:
+            return weight
+        return weight * 2 ** ((timestamp - self.reference) / self.half_life_ms)
+
+    def score_actions(self, actions):
+        """Get the stored score for a list of actions"""
+        return sum(self.action_score(action.action, action.timestamp) for action in actions)
+
+    def needs_rebase(self, timestamp):
+        """Check whether an action is far enough past the reference time to need a recompute"""
+        return self.decays and timestamp is not None and (timestamp - self.reference) / self.half_life_ms > MAX_EXPONENT
+
+    def current(self, score, at=None):
+        """Convert a stored score to its value now (or at another time)"""
+        if not self.decays:
+            return score
+        return score * 2 ** ((self.reference - (now_ms() if at is None else at)) / self.half_life_ms)
+
+    def score_columns(self, columns):
+        """Recompute every user's stored score from analytics columns, indexed by user code"""
+        weights = [self.weights.get(name, 0) for name in columns.type_names]
+        user_count = len(columns.user_ids)
+
+        if np is None:
+            scores = [0] * user_count
+            for user, action_type, timestamp in zip(columns.users, columns.types, columns.times):
+                weight = weights[action_type]
+                if self.decays and timestamp >= 0:
+                    weight *= 2 ** ((timestamp - self.reference) / self.half_life_ms)
+                scores[user] += weight
+            return scores
+
+        if not len(columns):
+            return np.zeros(user_count)
+        users = np.frombuffer(columns.users, dtype=np.int64)
+        contributions = np.asarray(weights, dtype=np.float64)[np.frombuffer(columns.types, dtype=np.int8)]
+        if self.decays:
+            times = np.frombuffer(columns.times, dtype=np.int64)
+            contributions *= np.where(times >= 0, np.exp2((times - self.reference) / self.half_life_ms), 1.0)
+        return np.bincount(users, weights=contributions, minlength=user_count)
+
+# Engine shared by the store and the commands
+reputation_engine = ReputationEngine()
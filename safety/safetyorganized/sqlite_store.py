@@ -0,0 +1,376 @@
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from config import HISTORY_FILE, HISTORY_WAL_FILE, HISTORY_DB_FILE, HISTORY_CACHE_SIZE
+from timestamps import to_epoch_ms
+from actions import ModerationAction, convert_history, compact_action_id, snowflake
+from metrics import save_seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    reputation INTEGER NOT NULL DEFAULT 0,
+    action_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_users_reputation ON users (reputation);
+
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL REFERENCES users (user_id),
+    guild_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    timestamp INTEGER,
+    reason TEXT,
+    moderator_id TEXT,
+    moderator_name TEXT,
+    action_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_actions_user ON actions (user_id);
+CREATE INDEX IF NOT EXISTS idx_actions_guild ON actions (guild_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_action ON actions (action);
+CREATE INDEX IF NOT EXISTS idx_actions_timestamp ON actions (timestamp);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_actions_action_id ON actions (action_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Database connection (opened on first use)
+_connection = None
+
+# Recently used user histories, most recent last
+_hot_users = OrderedDict()
+
+def get_connection():
+    """Open the database and create the schema if needed"""
+    global _connection
+
+    if _connection is None:
+        os.makedirs(os.path.dirname(os.path.abspath(HISTORY_DB_FILE)), exist_ok=True)
+        _connection = sqlite3.connect(HISTORY_DB_FILE)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _migrate_timestamps(_connection)
+        _connection.executescript(SCHEMA)
+        _migrate_action_ids(_connection)
+        logging.info(f"Opened moderation history database at {HISTORY_DB_FILE}")
+
+    return _connection
+
+def _migrate_timestamps(connection):
+    """Rebuild an actions table created with ISO text timestamps to hold epoch milliseconds"""
+    columns = {row[1]: row[2] for row in connection.execute("PRAGMA table_info(actions)")}
+    if columns.get("timestamp", "INTEGER").upper() == "INTEGER":
+        return
+
+    # Text affinity would turn integers back into strings, so the rows are
+    # copied into a table with an integer column in a single transaction
+    connection.create_function("epoch_ms", 1, to_epoch_ms, deterministic=True)
+    connection.executescript(
+        "BEGIN;"
+        "ALTER TABLE actions RENAME TO actions_text;"
+        "DROP INDEX idx_actions_user; DROP INDEX idx_actions_guild; DROP INDEX idx_actions_action;"
+        "DROP INDEX idx_actions_timestamp; DROP INDEX idx_actions_action_id;"
+        + SCHEMA +
+        "INSERT INTO actions (id, user_id, guild_id, action, timestamp, reason, moderator_id, "
+        "moderator_name, action_id) SELECT id, user_id, guild_id, action, epoch_ms(timestamp), "
+        "reason, moderator_id, moderator_name, action_id FROM actions_text;"
+        "DROP TABLE actions_text;"
+        "COMMIT;"
+    )
+    logging.info("Converted action timestamps in the moderation history database to epoch milliseconds")
+
+def _migrate_action_ids(connection):
+    """Shorten composite action IDs from older databases to their audit log entry IDs"""
+    rows = connection.execute("SELECT id, action_id FROM actions WHERE action_id LIKE '%:%'").fetchall()
+    if not rows:
+        return
+
+    # An ID that would collide with an existing one is left as it was
+    with connection:
+        connection.executemany(
+            "UPDATE OR IGNORE actions SET action_id = ? WHERE id = ?",
+            [(str(compact_action_id(action_id)), row_id) for row_id, action_id in rows]
+        )
+    logging.info(f"Shortened {len(rows)} action IDs in the moderation history database")
+
+def close():
+    """Commit and close the database"""
+    global _connection
+
+    if _connection is not None:
+        _connection.commit()
+        _connection.close()
+        _connection = None
+    _hot_users.clear()
+
+def _row_to_action(row):
+    """Convert an actions row to a ModerationAction"""
+    return ModerationAction(*row)
+
+def _action_to_row(user_id, action):
+    """Convert a ModerationAction to an actions row"""
+    return (
+        user_id,
+        str(action.guild_id),
+        action.action,
+        action.timestamp,
+        action.reason,
+        None if action.moderator_id is None else str(action.moderator_id),
+        action.moderator_name,
+        None if action.action_id is None else str(action.action_id)
+    )
+
+def _remember(user_id, user_history):
+    """Keep a user history in the hot set, evicting the coldest entries"""
+    _hot_users[user_id] = user_history
+    _hot_users.move_to_end(user_id)
+    while len(_hot_users) > HISTORY_CACHE_SIZE:
+        _hot_users.popitem(last=False)
+
+def find_user(user_id):
+    """Load a user's history, or return None if the user is unknown"""
+    user_id = str(user_id)
+
+    if user_id in _hot_users:
+        _hot_users.move_to_end(user_id)
+        return _hot_users[user_id]
+
+    connection = get_connection()
+    row = connection.execute(
+        "SELECT reputation FROM users WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    rows = connection.execute(
+        "SELECT action, guild_id, timestamp, reason, moderator_id, moderator_name, action_id "
+        "FROM actions WHERE user_id = ? ORDER BY id",
+        (user_id,)
+    ).fetchall()
+
+    user_history = {
+        "reputation": row[0],
+        "actions": [_row_to_action(action_row) for action_row in rows]
+    }
+    _remember(user_id, user_history)
+    return user_history
+
+def add_action(user_id, action, reputation_change):
+    """Insert an action and update the user's reputation"""
+    user_id = str(user_id)
+    connection = get_connection()
+
+    try:
+        with save_seconds.time(store="sqlite"), connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,)
+            )
+            connection.execute(
+                "INSERT INTO actions (user_id, guild_id, action, timestamp, reason, "
+                "moderator_id, moderator_name, action_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                _action_to_row(user_id, action)
+            )
+            connection.execute(
+                "UPDATE users SET reputation = reputation + ?, action_count = action_count + 1 "
+                "WHERE user_id = ?",
+                (reputation_change, user_id)
+            )
+    except sqlite3.IntegrityError:
+        # The unique action_id index rejected a duplicate
+        return {"duplicate": True}
+
+    # Keep the cached copy in step with the database
+    user_history = _hot_users.get(user_id)
+    if user_history is not None:
+        user_history["actions"].append(action)
+        user_history["reputation"] += reputation_change
+
+    return {"success": True}
+
+def count_users():
+    """Count the users stored in the database"""
+    return get_connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+def get_version():
+    """Get the newest action row ID, which changes whenever any process adds an action"""
+    return get_connection().execute("SELECT COALESCE(MAX(id), 0) FROM actions").fetchone()[0]
+
+def get_actions_since(row_id, chunk_size=5000):
+    """Get the newest row ID and the (user ID, action) pairs stored after an earlier one, read lazily in chunks"""
+    newest = get_version()
+    return newest, _iter_actions(row_id, newest, chunk_size)
+
+def _iter_actions(row_id, newest, chunk_size):
+    """Yield (user ID, action) pairs in (row_id, newest], one chunk of rows in memory at a time"""
+    connection = get_connection()
+    while row_id < newest:
+        rows = connection.execute(
+            "SELECT id, user_id, action, guild_id, timestamp, reason, moderator_id, moderator_name, action_id "
+            "FROM actions WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (row_id, newest, chunk_size)
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row[1], _row_to_action(row[2:])
+        row_id = rows[-1][0]
+
+def get_reputations(user_ids):
+    """Get the current reputation of each of the given users"""
+    connection = get_connection()
+    user_ids = [str(user_id) for user_id in user_ids]
+    reputations = {}
+
+    # Stay under SQLite's limit on bound parameters
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        reputations.update(connection.execute(
+            f"SELECT user_id, reputation FROM users WHERE user_id IN ({','.join('?' * len(chunk))})",
+            chunk
+        ).fetchall())
+
+    return reputations
+
+def get_scoring():
+    """Get the scoring version and reference time the stored reputations were computed with"""
+    rows = dict(get_connection().execute(
+        "SELECT key, value FROM meta WHERE key IN ('scoring_version', 'reputation_reference')"
+    ).fetchall())
+    if len(rows) < 2:
+        return None
+    return rows["scoring_version"], int(rows["reputation_reference"])
+
+def set_reputations(scores, engine):
+    """Replace every user's reputation and record the scoring they were computed with"""
+    connection = get_connection()
+    with connection:
+        connection.execute("UPDATE users SET reputation = 0")
+        connection.executemany(
+            "UPDATE users SET reputation = ? WHERE user_id = ?",
+            ((float(score), user_id) for user_id, score in scores)
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("scoring_version", engine.version), ("reputation_reference", str(engine.reference))]
+        )
+    _hot_users.clear()
+
+def get_leaderboard(limit=100, guild_id=None):
+    """Get users with the lowest reputation scores, optionally within one guild"""
+    if guild_id is not None:
+        rows = get_connection().execute(
+            "SELECT user_id FROM users WHERE user_id IN "
+            "(SELECT DISTINCT user_id FROM actions WHERE guild_id = ?) "
+            "ORDER BY reputation LIMIT ?",
+            (str(guild_id), limit)
+        ).fetchall()
+    else:
+        rows = get_connection().execute(
+            "SELECT user_id FROM users WHERE action_count > 0 ORDER BY reputation LIMIT ?",
+            (limit,)
+        ).fetchall()
+    return [(user_id, find_user(user_id)) for (user_id,) in rows]
+
+def get_user_action_counts(user_id):
+    """Count a user's actions by type and by guild"""
+    connection = get_connection()
+    user_id = str(user_id)
+
+    by_type = dict(connection.execute(
+        "SELECT action, COUNT(*) FROM actions WHERE user_id = ? GROUP BY action ORDER BY MIN(id)",
+        (user_id,)
+    ).fetchall())
+    by_guild = {snowflake(guild_id): count for guild_id, count in connection.execute(
+        "SELECT guild_id, COUNT(*) FROM actions WHERE user_id = ? GROUP BY guild_id ORDER BY MIN(id)",
+        (user_id,)
+    )}
+
+    return {"by_type": by_type, "by_guild": by_guild}
+
+def calculate_server_stats(guild_id):
+    """Calculate reputation statistics for a server"""
+    connection = get_connection()
+    guild_id = str(guild_id)
+
+    stats = {
+        "action_counts": dict(connection.execute(
+            "SELECT action, COUNT(*) FROM actions WHERE guild_id = ? GROUP BY action",
+            (guild_id,)
+        ).fetchall()),
+        "total_users": 0,
+        "total_reputation": 0,
+        "avg_reputation": 0,
+        "recent_action": None
+    }
+
+    total_users, total_reputation = connection.execute(
+        "SELECT COUNT(*), COALESCE(SUM(reputation), 0) FROM users WHERE user_id IN "
+        "(SELECT DISTINCT user_id FROM actions WHERE guild_id = ?)",
+        (guild_id,)
+    ).fetchone()
+    stats["total_users"] = total_users
+    stats["total_reputation"] = total_reputation
+    if total_users > 0:
+        stats["avg_reputation"] = total_reputation / total_users
+
+    recent = connection.execute(
+        "SELECT action, timestamp, user_id, reason FROM actions WHERE guild_id = ? "
+        "ORDER BY timestamp DESC LIMIT 1",
+        (guild_id,)
+    ).fetchone()
+    if recent:
+        stats["recent_action"] = {
+            "action": recent[0],
+            "timestamp": recent[1],
+            "user_id": recent[2],
+            "reason": recent[3] or "No reason provided"
+        }
+
+    return stats
+
+def migrate_from_json(history_file=HISTORY_FILE, wal_file=HISTORY_WAL_FILE):
+    """Copy an existing JSON history (snapshot plus write-ahead log) into the database"""
+    import store
+
+    history = {}
+    if os.path.exists(history_file):
+        with open(history_file, 'r') as f:
+            history = json.load(f)
+    store.replay(history, wal_file)
+    convert_history(history)
+
+    connection = get_connection()
+    migrated = 0
+    with connection:
+        for user_id, user_data in history.items():
+            if not isinstance(user_data, dict):
+                continue
+
+            # Actions whose action_id is already stored are skipped, so only
+            # rows actually inserted count towards the totals
+            inserted = 0
+            for action in user_data.get("actions", []):
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO actions (user_id, guild_id, action, timestamp, reason, "
+                    "moderator_id, moderator_name, action_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    _action_to_row(str(user_id), action)
+                )
+                inserted += cursor.rowcount
+            connection.execute(
+                "INSERT OR REPLACE INTO users (user_id, reputation, action_count) VALUES (?, ?, ?)",
+                (str(user_id), user_data.get("reputation", 0), inserted)
+            )
+            migrated += inserted
+
+    logging.info(f"Migrated {migrated} actions for {len(history)} users from {history_file} and {wal_file}")
+    return migrated
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    migrate_from_json()
+    close()
@@ -0,0 +1,185 @@
+import glob
+import json
+import logging
+import os
+import threading
+from actions import to_json
+from config import HISTORY_FILE, HISTORY_WAL_FILE, HISTORY_COMPACT_THRESHOLD, HISTORY_FSYNC
+from metrics import save_seconds
+
+# Open handle for the active write-ahead log segment
+_wal_handle = None
+
+# Number of records appended since the last compaction
+_wal_records = 0
+
+# Number of actions covered by the last snapshot (used to amortize compaction)
+_snapshot_actions = 0
+
+# Background compaction thread (if one is running)
+_compaction_thread = None
+
+def _segment_paths(wal_file=HISTORY_WAL_FILE):
+    """Return rotated write-ahead log segments, oldest first"""
+    segments = []
+    for path in glob.glob(glob.escape(wal_file) + '.*'):
+        suffix = path[len(wal_file) + 1:]
+        if suffix.isdigit():
+            segments.append((int(suffix), path))
+    return [path for _, path in sorted(segments)]
+
+def _next_segment_path():
+    """Return the path for the next rotated segment"""
+    segments = _segment_paths()
+    if not segments:
+        return f"{HISTORY_WAL_FILE}.1"
+    last = int(segments[-1][len(HISTORY_WAL_FILE) + 1:])
+    return f"{HISTORY_WAL_FILE}.{last + 1}"
+
+def _count_actions(history):
+    """Count the actions held in a history dict"""
+    return sum(len(data.get("actions", [])) for data in history.values() if isinstance(data, dict))
+
+def apply_record(history, record):
+    """Apply a single write-ahead log record to a history dict (actions are left as dicts)"""
+    user_id = record["user_id"]
+    user_history = history.setdefault(user_id, {"reputation": 0, "actions": []})
+    actions = user_history.setdefault("actions", [])
+
+    # Actions are only ever appended, so a record whose slot is already
+    # filled is covered by the snapshot and must not be applied twice
+    if len(actions) > record["index"]:
+        return False
+
+    actions.append(record["action"])
+    user_history["reputation"] = record["reputation"]
+    return True
+
+def has_log(wal_file=HISTORY_WAL_FILE):
+    """Check whether there is a write-ahead log (active or rotated) to replay"""
+    return os.path.exists(wal_file) or bool(_segment_paths(wal_file))
+
+def replay(history, wal_file=HISTORY_WAL_FILE):
+    """Replay rotated segments and the active log on top of a loaded snapshot"""
+    global _wal_records, _snapshot_actions
+
+    _snapshot_actions = _count_actions(history)
+    applied = 0
+
+    for path in _segment_paths(wal_file) + [wal_file]:
+        if not os.path.exists(path):
+            continue
+
+        with open(path, 'r') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-append leaves a torn final record
+                    logging.warning(f"Ignoring unreadable record at {path}:{line_number}")
+                    continue
+                if apply_record(history, record):
+                    applied += 1
+                _wal_records += 1
+
+    if applied:
+        logging.info(f"Replayed {applied} actions from the write-ahead log")
+
+    return applied
+
+def append_action(user_id, index, action, reputation):
+    """Append one action to the write-ahead log"""
+    global _wal_handle, _wal_records
+
+    if _wal_handle is None:
+        os.makedirs(os.path.dirname(os.path.abspath(HISTORY_WAL_FILE)), exist_ok=True)
+        _wal_handle = open(HISTORY_WAL_FILE, 'a')
+
+    record = {
+        "user_id": user_id,
+        "index": index,
+        "action": action.to_dict(),
+        "reputation": reputation
+    }
+    with save_seconds.time(store="wal"):
+        _wal_handle.write(json.dumps(record, separators=(',', ':')) + '\n')
+        _wal_handle.flush()
+        if HISTORY_FSYNC:
+            os.fsync(_wal_handle.fileno())
+
+    _wal_records += 1
+
+def compaction_due():
+    """Check whether the log has grown enough to be folded into a snapshot"""
+    # Compacting only once the log is as large as the snapshot keeps the
+    # amortized write cost per action constant
+    return _wal_records >= max(HISTORY_COMPACT_THRESHOLD, _snapshot_actions)
+
+def _close_wal():
+    """Close the active write-ahead log segment"""
+    global _wal_handle
+
+    if _wal_handle is not None:
+        _wal_handle.close()
+        _wal_handle = None
+
+def _write_snapshot(history, segments):
+    """Atomically write a snapshot and drop the segments it covers"""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(HISTORY_FILE)), exist_ok=True)
+
+        with save_seconds.time(store="snapshot"):
+            temp_file = HISTORY_FILE + '.tmp'
+            with open(temp_file, 'w') as f:
+                json.dump(history, f, indent=2, default=to_json)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, HISTORY_FILE)
+
+        for path in segments:
+            os.remove(path)
+
+        logging.info(f"Saved moderation history snapshot with {len(history)} users")
+    except Exception as e:
+        logging.error(f"Error saving moderation history snapshot: {e}")
+        import traceback
+        logging.error(traceback.format_exc())
+
+def compact(history, background=True):
+    """Fold the write-ahead log into a new snapshot"""
+    global _compaction_thread, _wal_records, _snapshot_actions
+
+    if _compaction_thread is not None and _compaction_thread.is_alive():
+        if not background:
+            _compaction_thread.join()
+        else:
+            return
+
+    # Rotate the active log so new appends go to a fresh segment
+    _close_wal()
+    if os.path.exists(HISTORY_WAL_FILE):
+        os.replace(HISTORY_WAL_FILE, _next_segment_path())
+    segments = _segment_paths()
+
+    # Copy the user entries and action lists; action records are never
+    # mutated after they are added, so they can be shared
+    snapshot = {
+        user_id: dict(data, actions=list(data.get("actions", [])))
+        for user_id, data in history.items()
+    }
+    _wal_records = 0
+    _snapshot_actions = _count_actions(snapshot)
+
+    if background:
+        _compaction_thread = threading.Thread(
+            target=_write_snapshot,
+            args=(snapshot, segments),
+            name="history-compaction",
+            daemon=True
+        )
+        _compaction_thread.start()
+    else:
+        _write_snapshot(snapshot, segments)
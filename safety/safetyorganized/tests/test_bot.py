@@ -0,0 +1,36 @@
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Configure a throwaway environment before the bot's modules read it
+_workdir = tempfile.mkdtemp()
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("HISTORY_FSYNC", "0")
+for name, file_name in (("HISTORY_FILE", "moderation_history.json"), ("AUDIT_CURSOR_FILE", "audit_cursors.json"), ("USER_CACHE_FILE", "user_cache.json")):
+    os.environ.setdefault(name, os.path.join(_workdir, file_name))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discord.ext import commands
+from bot import setup_bot
+from metrics import polled_guilds
+
+def counter_value(counter, **labels):
+    return counter._values.get(counter._key(labels), 0)
+
+def test_poll_cycle_counts_guilds(monkeypatch, caplog):
+    """One polling cycle records every guild in the guilds-polled counter"""
+    bot = setup_bot()
+    # A guild the bot cannot read the audit log of is skipped without a request
+    guild = SimpleNamespace(name="Quiet guild", id=1, me=None)
+    monkeypatch.setattr(commands.Bot, "guilds", property(lambda self: [guild]))
+    idle_before = counter_value(polled_guilds, result="idle")
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(bot.poll_guilds())
+
+    assert "Error in poll_guilds task" not in caplog.text
+    assert counter_value(polled_guilds, result="idle") == idle_before + 1
+    assert bot.poll_status["guilds_skipped"] == 1
@@ -0,0 +1,40 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def now_ms():
+    """Get the current time in epoch milliseconds"""
+    return time.time_ns() // 1_000_000
+
+def to_epoch_ms(value):
+    """Normalize a stored or incoming timestamp to epoch milliseconds, or None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+
+    # Older history files store ISO strings, with or without a UTC offset
+    if isinstance(value, str):
+        if value.isdigit():
+            return int(value)
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+
+    if isinstance(value, datetime):
+        # Naive datetimes were always written in UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return (value - EPOCH) // timedelta(milliseconds=1)
+
+    return None
+
+def from_epoch_ms(timestamp):
+    """Convert epoch milliseconds to an aware UTC datetime, or None"""
+    if timestamp is None:
+        return None
+    return EPOCH + timedelta(milliseconds=timestamp)
@@ -1,11 +1,35 @@
 import discord
 import logging
 import asyncio
-from datetime import datetime
-from cache import user_cache
+import time
+from collections import OrderedDict
+from cache import user_cache, NOT_CACHED
+from config import USER_FETCH_CONCURRENCY
+from data import get_leaderboard, get_store_version
+from pagination import register_renderer, send_paginated
+from timestamps import from_epoch_ms
+from reputation import reputation_engine
+
+# In-flight user fetches, shared by everyone asking for the same user
+_pending_fetches = {}
+
+# Limit on concurrent REST user fetches
+_fetch_semaphore = asyncio.Semaphore(USER_FETCH_CONCURRENCY)
+
+# Monotonic time until which REST user fetches are paused after a 429
+_fetch_backoff_until = 0
+
+# Attempts per user fetch before giving up on a 429
+MAX_FETCH_ATTEMPTS = 3
+
+# Leaderboard snapshots keyed by (guild ID or all, limit, store version), shared by every page
+_leaderboard_snapshots = OrderedDict()
+MAX_LEADERBOARD_SNAPSHOTS = 16
 
 def format_timestamp(dt):
-    """Format a datetime object as a string"""
+    """Format a datetime or stored epoch-millisecond timestamp as a string"""
+    if isinstance(dt, int):
+        dt = from_epoch_ms(dt)
     if not dt:
         return "Unknown"
     
@@ -15,36 +39,91 @@ def format_timestamp(dt):
         logging.error(f"Error formatting timestamp: {e}")
         return str(dt)
 
-async def prefetch_users(bot, user_ids, batch_size=50):
-    """Prefetch user information in batches to reduce API calls"""
+def format_reputation(score):
+    """Format a stored reputation score as its current value"""
+    score = reputation_engine.current(score)
+    if float(score).is_integer():
+        return str(int(score))
+    return f"{score:.2f}"
+
+def format_sparkline(counts):
+    """Draw a row of counts as a one-line bar chart"""
+    bars = "▁▂▃▄▅▆▇█"
+    peak = max(counts, default=0)
+    if peak == 0:
+        return bars[0] * len(counts)
+    return "".join(bars[count * (len(bars) - 1) // peak] for count in counts)
+
+async def prefetch_users(bot, user_ids, guild=None):
+    """Resolve users ahead of rendering so pages can be built from the cache"""
     global user_cache
     
     # Filter out users that are already in the cache
-    user_ids_to_fetch = [str(user_id) for user_id in user_ids if str(user_id) not in user_cache]
+    user_ids_to_fetch = [int(user_id) for user_id in user_ids if str(user_id).isdigit() and str(user_id) not in user_cache]
     
-    # Fetch users in batches
-    for i in range(0, len(user_ids_to_fetch), batch_size):
-        batch = user_ids_to_fetch[i:i+batch_size]
-        tasks = []
-        
-        for user_id in batch:
-            # Convert to string and check if it's a valid digit string
-            user_id_str = str(user_id)
-            if user_id_str.isdigit():
-                tasks.append(fetch_user_safe(bot, int(user_id_str)))
-        
-        # Wait for all tasks to complete
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+    # Resolve them together; REST fetches are limited by the shared semaphore
+    if user_ids_to_fetch:
+        await asyncio.gather(*[resolve_user(bot, user_id, guild) for user_id in user_ids_to_fetch], return_exceptions=True)
 
-async def fetch_user_safe(bot, user_id):
+async def resolve_user(bot, user_id, guild=None):
+    """Resolve a user from the cache, then gateway state, then a (shared) REST fetch"""
+    user_id = int(user_id)
+    
+    # Use the cached copy while it is fresh
+    cached = user_cache.get(user_id, NOT_CACHED)
+    if cached is not NOT_CACHED:
+        return cached
+    
+    # Users the gateway has already sent us cost nothing to resolve
+    user = bot.get_user(user_id)
+    if user is None and guild is not None:
+        user = guild.get_member(user_id)
+    if user is not None:
+        return user_cache.put(user)
+    
+    # Join a fetch that is already running for this user, or start one
+    pending = _pending_fetches.get(user_id)
+    if pending is None:
+        pending = asyncio.ensure_future(_fetch_user(bot, user_id))
+        _pending_fetches[user_id] = pending
+        pending.add_done_callback(lambda _: _pending_fetches.pop(user_id, None))
+    
+    # Shield the shared fetch so one caller giving up doesn't cancel it for the rest
+    return await asyncio.shield(pending)
+
+async def _fetch_user(bot, user_id):
+    """Fetch a user over REST, backing off on 429s"""
+    global _fetch_backoff_until
+    
+    async with _fetch_semaphore:
+        for attempt in range(MAX_FETCH_ATTEMPTS):
+            # Wait out any rate limit another fetch ran into
+            delay = _fetch_backoff_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            try:
+                user = await bot.fetch_user(user_id)
+                return user_cache.put(user)
+            except discord.NotFound:
+                # Only a user Discord says does not exist is remembered as missing
+                user_cache.put_missing(user_id)
+                return None
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    logging.warning(f"Error fetching user {user_id}: {e}")
+                    break
+                retry_after = float(e.response.headers.get('Retry-After', 1))
+                _fetch_backoff_until = max(_fetch_backoff_until, time.monotonic() + retry_after)
+                logging.warning(f"Rate limited fetching user {user_id}, backing off for {retry_after}s")
+    
+    # Temporary failures are not cached, so the next lookup tries again
+    return None
+
+async def fetch_user_safe(bot, user_id, guild=None):
     """Fetch a user safely and add to cache"""
-    global user_cache
-    
     try:
-        user = await bot.fetch_user(user_id)
-        user_cache[str(user_id)] = user
-        return user
+        return await resolve_user(bot, user_id, guild)
     except Exception as e:
         logging.warning(f"Error fetching user {user_id}: {e}")
         return None
@@ -56,118 +135,98 @@ def get_user_from_cache(user_id):
     user_id = str(user_id)
     return user_cache.get(user_id)
 
-async def send_leaderboard_page(bot, interaction, leaderboard, page=0):
-    """Send a page of the leaderboard with pagination buttons"""
-    # Show loading indicator
-    if interaction.response.is_done():
-        loading_message = await interaction.edit_original_response(content="Loading leaderboard page...", embed=None, view=None)
+class LeaderboardSnapshot:
+    """Leaderboard rows computed once per store version, with each user's last action precomputed"""
     
-    # Calculate pagination
     items_per_page = 20  # Discord allows up to 25 fields per embed, but we'll use 20 for better display
-    total_pages = max(1, (len(leaderboard) + items_per_page - 1) // items_per_page)
-    page = max(0, min(page, total_pages - 1))
-    start_idx = page * items_per_page
-    end_idx = min(start_idx + items_per_page, len(leaderboard))
-    
-    # Create embed
-    embed = discord.Embed(
-        title="Moderation Leaderboard",
-        description=f"Users with the lowest reputation scores (Page {page+1}/{total_pages})",
-        color=discord.Color.gold()
-    )
-    
-    # Add fields for each user on this page
-    for i, (user_id, data) in enumerate(leaderboard[start_idx:end_idx], start=start_idx+1):
-        try:
-            # Try to get user from cache first
+    
+    def __init__(self, leaderboard):
+        self.rows = []
+        
+        # Precompute everything a page needs for each user
+        for user_id, data in leaderboard:
+            actions = data.get("actions", [])
+            action_times = [action.timestamp for action in actions if action.timestamp is not None]
+            if action_times:
+                most_recent_time = f"Last action (UTC): {format_timestamp(max(action_times))}"
+            elif actions:
+                most_recent_time = "Last action: Unknown time"
+            else:
+                most_recent_time = None
+            self.rows.append((user_id, data.get("reputation", 0), len(actions), most_recent_time))
+        
+        self.total_pages = max(1, (len(self.rows) + self.items_per_page - 1) // self.items_per_page)
+    
+    def render_page(self, page, title="Moderation Leaderboard"):
+        """Build the embed for a page"""
+        page = max(0, min(page, self.total_pages - 1))
+        start_idx = page * self.items_per_page
+        
+        # Create embed
+        embed = discord.Embed(
+            title=title,
+            description=f"Users with the lowest reputation scores (Page {page+1}/{self.total_pages})",
+            color=discord.Color.gold()
+        )
+        
+        # Add fields for each user on this page
+        rows = self.rows[start_idx:start_idx + self.items_per_page]
+        for i, (user_id, reputation, action_count, most_recent_time) in enumerate(rows, start=start_idx+1):
+            # Users were prefetched, so the cache has their names
             user = get_user_from_cache(user_id)
             user_name = user.name if user else f"Unknown User ({user_id})"
             
-            # Get reputation
-            reputation = data.get("reputation", 0)
-            
-            # Get action count
-            action_count = len(data.get("actions", []))
-            
-            # Get most recent action timestamp (if any)
-            most_recent_time = None
-            if data.get("actions"):
-                try:
-                    # Sort actions by timestamp (oldest first)
-                    sorted_actions = sorted(
-                        data.get("actions", []),
-                        key=lambda x: datetime.fromisoformat(x.get("timestamp", "1970-01-01T00:00:00").replace('Z', '+00:00'))
-                    )
-                    
-                    # Get the most recent action (last in the sorted list)
-                    if sorted_actions:
-                        recent = sorted_actions[-1]
-                        timestamp = recent.get("timestamp", "Unknown")
-                        if isinstance(timestamp, str):
-                            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                            most_recent_time = f"Last action (UTC): {format_timestamp(dt)}"
-                except Exception as e:
-                    logging.error(f"Error formatting timestamp for user {user_id}: {e}")
-                    most_recent_time = "Last action: Error parsing timestamp"
-            
             # Add field with user ID and timestamp if available
-            value_text = f"User ID: `{user_id}`\nReputation: {reputation}\nActions: {action_count}"
+            value_text = f"User ID: `{user_id}`\nReputation: {format_reputation(reputation)}\nActions: {action_count}"
             if most_recent_time:
                 value_text += f"\n{most_recent_time}"
-                
+            
             embed.add_field(
                 name=f"#{i}: {user_name}",
                 value=value_text,
                 inline=True
             )
-        except Exception as e:
-            logging.error(f"Error formatting leaderboard entry: {e}")
-            embed.add_field(
-                name=f"#{i}: Unknown User",
-                value=f"User ID: `{user_id}`\nReputation: {data.get('reputation', 0)}\nActions: {len(data.get('actions', []))}\nError: {e}",
-                inline=True
-            )
-    
-    # Add pagination info with UTC mention
-    embed.set_footer(text=f"Page {page+1}/{total_pages} | Total Users: {len(leaderboard)} | All timestamps are in UTC")
-    
-    # Create pagination buttons
-    view = discord.ui.View(timeout=300)  # 5 minute timeout
-    
-    # Previous page button
-    prev_button = discord.ui.Button(
-        style=discord.ButtonStyle.secondary,
-        label="Previous",
-        emoji="⬅️",
-        disabled=(page == 0)
-    )
-    
-    # Next page button
-    next_button = discord.ui.Button(
-        style=discord.ButtonStyle.secondary,
-        label="Next",
-        emoji="➡️",
-        disabled=(page == total_pages - 1)
-    )
-    
-    # Set button callbacks
-    async def prev_callback(interaction):
-        await interaction.response.defer()
-        await send_leaderboard_page(bot, interaction, leaderboard, page=page-1)
-    
-    async def next_callback(interaction):
-        await interaction.response.defer()
-        await send_leaderboard_page(bot, interaction, leaderboard, page=page+1)
-    
-    prev_button.callback = prev_callback
-    next_button.callback = next_callback
-    
-    # Add buttons to view
-    view.add_item(prev_button)
-    view.add_item(next_button)
-    
-    # Send or edit message
-    if interaction.response.is_done():
-        await interaction.edit_original_response(content=None, embed=embed, view=view)
-    else:
-        await interaction.followup.send(embed=embed, view=view)
+        
+        # Add pagination info with UTC mention
+        embed.set_footer(text=f"Page {page+1}/{self.total_pages} | Total Users: {len(self.rows)} | All timestamps are in UTC")
+        return embed
+
+def get_leaderboard_snapshot(guild_id, limit):
+    """Get the leaderboard snapshot for the current store version, building it only when the store changed"""
+    snapshot_key = (guild_id, limit, get_store_version())
+    
+    if snapshot_key in _leaderboard_snapshots:
+        _leaderboard_snapshots.move_to_end(snapshot_key)
+        return _leaderboard_snapshots[snapshot_key]
+    
+    snapshot = LeaderboardSnapshot(get_leaderboard(limit=limit, guild_id=guild_id))
+    _leaderboard_snapshots[snapshot_key] = snapshot
+    while len(_leaderboard_snapshots) > MAX_LEADERBOARD_SNAPSHOTS:
+        _leaderboard_snapshots.popitem(last=False)
+    return snapshot
+
+async def render_leaderboard_page(bot, key, page):
+    """Render a leaderboard page; the key is '<guild ID or all>.<limit>'"""
+    scope, limit = key.split('.')
+    guild_id = None if scope == 'all' else scope
+    
+    # Re-query the indexed leaderboard
+    title = "Moderation Leaderboard"
+    if guild_id:
+        guild = bot.get_guild(int(guild_id))
+        title = f"Moderation Leaderboard for {guild.name if guild else f'Server {guild_id}'}"
+    snapshot = get_leaderboard_snapshot(guild_id, int(limit))
+    
+    # Only the users shown on this page need resolving
+    page = max(0, min(page, snapshot.total_pages - 1))
+    start_idx = page * snapshot.items_per_page
+    page_rows = snapshot.rows[start_idx:start_idx + snapshot.items_per_page]
+    await prefetch_users(bot, [user_id for user_id, _, _, _ in page_rows], bot.get_guild(int(guild_id)) if guild_id else None)
+    
+    return snapshot.render_page(page, title), snapshot.total_pages
+
+register_renderer("leaderboard", render_leaderboard_page)
+
+async def send_leaderboard_page(bot, interaction, limit, guild_id=None, page=0):
+    """Send a page of the leaderboard with pagination buttons"""
+    await send_paginated(bot, interaction, "leaderboard", f"{guild_id or 'all'}.{limit}", page)